@@ -0,0 +1,101 @@
+"""
+Measures the time from process start to the first served request.
+
+start using command python -m robocof_mood.benchmarks.cold_start from the root dir
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_cold_start(
+    path: str = "/",
+    preload_models: bool = True,
+    import_timing: bool = False,
+    startup_timeout: float = 120.0,
+) -> float:
+    """
+    Starts `uvicorn robocof_mood.main:app` in a fresh process and polls `path` until it answers.
+
+    Args:
+        path (str, optional): The endpoint to request. Defaults to "/".
+        preload_models (bool, optional): Whether the server loads the models in the background. Defaults to True.
+        import_timing (bool, optional): Let the server print its import-time report. Defaults to False.
+        startup_timeout (float, optional): Give up after this many seconds. Defaults to 120.0.
+
+    Returns:
+        float: Seconds from spawning the process to the first successful response.
+    """
+    port = _free_port()
+    env = dict(os.environ)
+    env["ROBOCOF_PRELOAD_MODELS"] = "1" if preload_models else "0"
+    env["ROBOCOF_IMPORT_TIMING"] = "1" if import_timing else "0"
+
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "robocof_mood.main:app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+    try:
+        url = f"http://127.0.0.1:{port}{path}"
+        with httpx.Client(timeout=1.0) as client:
+            while time.perf_counter() - t0 < startup_timeout:
+                if proc.poll() is not None:
+                    raise RuntimeError(f"server exited with code {proc.returncode}")
+                try:
+                    if client.get(url).is_success:
+                        return time.perf_counter() - t0
+                except httpx.HTTPError:
+                    pass
+                time.sleep(0.01)
+        raise TimeoutError(f"no response from {url} within {startup_timeout} s")
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5, help="number of cold starts to measure")
+    parser.add_argument("--path", default="/", help="endpoint to request")
+    parser.add_argument("--no-preload", action="store_true", help="do not load the models in the background")
+    parser.add_argument("--import-timing", action="store_true", help="print the server's import-time report")
+    args = parser.parse_args()
+
+    timings = []
+    for i in range(args.runs):
+        t = measure_cold_start(
+            args.path,
+            preload_models=not args.no_preload,
+            import_timing=args.import_timing and i == 0,
+        )
+        timings.append(t)
+        print(f"run {i + 1}: {t * 1000:.0f} ms to first response")
+
+    print(
+        f"cold start over {len(timings)} runs: "
+        f"median {statistics.median(timings) * 1000:.0f} ms, "
+        f"min {min(timings) * 1000:.0f} ms, max {max(timings) * 1000:.0f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,442 @@
+"""
+Offline evaluation of the recognizer thresholds: runs the seat, gesture and face recognizers over labelled
+flight recordings in a process pool, sweeps their parameters and prints accuracy, time-to-decision and
+throughput per setting, with the Pareto-optimal settings marked.
+
+Each recognizer loop is replayed in recording time: an inference takes the latest frame at that moment and
+as long as it took when it was first run, so slower settings also see fewer frames, as they would live.
+Motion gating is not simulated.
+
+Per-frame model outputs are cached in --cache, keyed by recording content and model settings, so a re-sweep
+does not run inference again. Only the MediaPipe confidence and the lowest YOLO confidence of the sweep change
+the model outputs; the YOLO confidence, chair size, centroid distance, gesture score and face tolerance are
+applied to the cached outputs. Raising the YOLO confidence afterwards matches a live run up to NMS ties.
+
+The manifest is a JSON list of labelled sessions, recording paths relative to the manifest:
+    [{"recording": "run12_timeout.rfr", "decision": "TIMEOUT_USER_PRESENT", "seat": "SEAT_OCCUPIED", "person": "alice"}]
+"decision" is a Decision name; "seat" (a SeatStatus name), "person" (an image name from --faces, or "Unknown")
+and "timeout" (seconds) are optional.
+
+start using command python -m robocof_mood.benchmarks.evaluation --manifest <labels.json> [--faces <dir>] from the root dir
+"""
+from __future__ import annotations
+
+import argparse
+import bisect
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import statistics
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from robocof_mood.decision_manager import Decision, gesture_decision, timeout_decision
+from robocof_mood.face_recognition.face_recognition import FACE_TOLERANCE
+from robocof_mood.gesture_recognition.gesture_recognizer import Gesture, MIN_CONFIDENCE, MIN_GESTURE_SCORE
+from robocof_mood.input_stream.flight_recorder import FlightRecording
+from robocof_mood.resources.resource_governor import apply_thread_budget, available_cpus
+from robocof_mood.seat_recognition.seat_recognizer import (
+    CENTROID_THRESHOLD, CONFIDENCE, FULL_SIZE, MAX_DETECTIONS, MIN_CHAIR_SIZE, SeatStatus,
+)
+
+# values swept per parameter, the service's current setting first
+DEFAULT_GRID = {
+    "gesture_confidence": [MIN_CONFIDENCE, 0.35, 0.5],
+    "gesture_score": [MIN_GESTURE_SCORE, 0.5, 0.7],
+    "seat_conf": [CONFIDENCE, 0.4, 0.55],
+    "min_chair_size": [MIN_CHAIR_SIZE, 5000, 20000],
+    "centroid_threshold": [CENTROID_THRESHOLD, 150, 250],
+    "face_tolerance": [FACE_TOLERANCE, 0.5, 0.45],
+}
+DECISION_PARAMS = ("gesture_confidence", "gesture_score", "seat_conf", "min_chair_size", "centroid_threshold")
+SEAT_PARAMS = ("seat_conf", "min_chair_size", "centroid_threshold")
+DEFAULT_TIMEOUT = 15.0
+DEFAULT_CACHE_DIR = ".eval_cache"
+# pauses between inferences of the live loops (asyncio.sleep in start() / recognize_from_stream_loop())
+LOOP_PAUSE = 0.01
+FACE_LOOP_PAUSE = 0.1
+# YOLO keeps this many boxes for the cache, so raising the confidence afterwards still finds MAX_DETECTIONS
+CACHE_MAX_DETECTIONS = 100
+COCO_PERSON = 0
+COCO_CHAIR = 56
+
+
+# ---------------------------------------------------------------------- #
+# cache
+# ---------------------------------------------------------------------- #
+class FrameCache:
+    """Model outputs of one recording under one model setting, per frame index, stored as JSON."""
+
+    def __init__(self, cache_dir: str, recording_key: str, component: str, settings: dict):
+        key = hashlib.sha1(json.dumps([recording_key, component, settings], sort_keys=True).encode()).hexdigest()[:16]
+        self.path = os.path.join(cache_dir, f"{component}_{key}.json")
+        self.outputs: dict[str, dict] = {}
+        self.hits = 0
+        self.misses = 0
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                self.outputs = json.load(f)
+
+    def get(self, i: int, compute) -> dict:
+        output = self.outputs.get(str(i))
+        if output is not None:
+            self.hits += 1
+            return output
+        self.misses += 1
+        output = self.outputs[str(i)] = compute(i)
+        return output
+
+    def save(self):
+        if not self.misses:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.outputs, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+
+def recording_key(path: str) -> str:
+    """Content hash of a recording, so renamed or moved recordings keep their cache."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# ---------------------------------------------------------------------- #
+# inference, in the pool processes; models are loaded once per process
+# ---------------------------------------------------------------------- #
+_models: dict = {}
+
+
+def _init_worker(threads: int):
+    apply_thread_budget(threads)
+
+
+def _preprocessor():
+    if "preprocessor" not in _models:
+        from robocof_mood.input_stream.frame_preprocessor import FramePreprocessor
+        _models["preprocessor"] = FramePreprocessor()
+    return _models["preprocessor"]
+
+
+def _infer_seat(frame, conf: float) -> dict:
+    from robocof_mood.seat_recognition.seat_recognizer import SeatRecognizer, load_model
+
+    if "seat" not in _models:
+        _models["seat"] = SeatRecognizer(None, motion_gating=False, with_model=False), load_model()
+    recognizer, model = _models["seat"]
+    model.conf = conf
+    model.max_det = CACHE_MAX_DETECTIONS
+    image = _preprocessor().process(frame, rgb=True)
+    t0 = time.perf_counter()
+    chairs, persons = recognizer.detect(image, model, size=FULL_SIZE)
+    ms = (time.perf_counter() - t0) * 1000
+    boxes = [
+        [cls, box["confidence"], box["xmin"], box["ymin"], box["xmax"], box["ymax"]]
+        for cls, found in ((COCO_CHAIR, chairs), (COCO_PERSON, persons))
+        for box in found
+    ]
+    return {"boxes": boxes, "ms": ms}
+
+
+def _infer_gesture(frame, confidence: float) -> dict:
+    from robocof_mood.gesture_recognition.gesture_recognizer import GestureRecognizer, mp
+
+    key = ("gesture", confidence)
+    if key not in _models:
+        _models[key] = GestureRecognizer([], None, motion_gating=False, min_confidence=confidence)
+    recognizer = _models[key]
+    # as the live loop captures it
+    image = _preprocessor().process(frame, square_crop=True, transform=True)
+    t0 = time.perf_counter()
+    recognizer.recognize(mp.Image(image_format=mp.ImageFormat.SRGB, data=image))
+    ms = (time.perf_counter() - t0) * 1000
+    return {"candidates": recognizer.last_candidates, "ms": ms}
+
+
+def _face_recognizer(gallery: list[tuple[str, str]]):
+    from robocof_mood.face_recognition.face_recognition import FaceRecognizer
+
+    if "face" not in _models:
+        recognizer = FaceRecognizer(None, motion_gating=False)
+        for name, path in gallery:
+            recognizer.add_face_image(name, path)
+        _models["face"] = recognizer
+    return _models["face"]
+
+
+def _infer_face(frame, gallery: list[tuple[str, str]]) -> dict:
+    recognizer = _face_recognizer(gallery)
+    t0 = time.perf_counter()
+    encodings = recognizer.encode(frame)
+    ms = (time.perf_counter() - t0) * 1000
+    return {"encodings": [[float(v) for v in encoding] for encoding in encodings], "ms": ms}
+
+
+# ---------------------------------------------------------------------- #
+# replay of the recognizer loops and post-processing
+# ---------------------------------------------------------------------- #
+def simulate(timestamps: list[float], duration: float, output_for, pause: float = LOOP_PAUSE) -> list[tuple[float, int, dict]]:
+    """
+    Replays a recognizer loop over a recording: every inference takes the latest frame and as long as its
+    cached duration. Returns (time the result is ready, frame index, output) per inference.
+    """
+    trace = []
+    t = 0.0
+    while t < duration:
+        i = max(0, bisect.bisect_right(timestamps, t) - 1)
+        output = output_for(i)
+        ready = t + output["ms"] / 1000
+        trace.append((ready, i, output))
+        t = ready + pause
+    return trace
+
+
+def seat_status(recognizer, output: dict, conf: float, min_size: float, centroid_threshold: float) -> SeatStatus:
+    """Classifies cached YOLO boxes as if the model had run with confidence `conf`."""
+    boxes = sorted((box for box in output["boxes"] if box[1] >= conf), key=lambda box: -box[1])[:MAX_DETECTIONS]
+    chairs, persons = [], []
+    for cls, confidence, xmin, ymin, xmax, ymax in boxes:
+        box = {"xmin": xmin, "ymin": ymin, "xmax": xmax, "ymax": ymax, "confidence": confidence}
+        (chairs if cls == COCO_CHAIR else persons).append(box)
+    return recognizer.classify(chairs, persons, min_size, centroid_threshold)
+
+
+def gestures_of(output: dict, min_score: float) -> list[Gesture]:
+    """The gestures of cached MediaPipe candidates with at least `min_score`."""
+    return [
+        Gesture.__members__.get(name.upper(), Gesture.UNKNOWN)
+        for name, score in output["candidates"]
+        if score >= min_score
+    ]
+
+
+def evaluate_session(session: dict, grid: dict, cache_dir: str, gallery: list[tuple[str, str]]) -> dict:
+    """Runs (or reads from the cache) the models over one recording and evaluates every setting of `grid`."""
+    from robocof_mood.seat_recognition.seat_recognizer import SeatRecognizer
+
+    recording = FlightRecording(session["recording"])
+    if not len(recording):
+        raise ValueError(f"{session['recording']} has no frames")
+    key = recording_key(session["recording"])
+    t0 = recording.timestamps[0]
+    timestamps = [t - t0 for t in recording.timestamps]
+    timeout = float(session.get("timeout", DEFAULT_TIMEOUT))
+    # the loops cannot see further than the recording reaches
+    duration = min(timeout, max(timestamps[-1], 1e-3))
+    caches = []
+
+    # seat: one inference run at the lowest confidence serves every seat setting
+    seat_cache = FrameCache(cache_dir, key, "seat", {"conf": min(grid["seat_conf"]), "size": FULL_SIZE})
+    caches.append(seat_cache)
+    seat_trace = simulate(
+        timestamps, duration, lambda i: seat_cache.get(i, lambda i: _infer_seat(recording.frame(i), min(grid["seat_conf"])))
+    )
+    classifier = SeatRecognizer(None, motion_gating=False, with_model=False)
+    seat_ms = statistics.fmean(output["ms"] for _, _, output in seat_trace)
+    seat_rows = []
+    for conf, min_size, centroid_threshold in itertools.product(*(grid[p] for p in SEAT_PARAMS)):
+        counter = Counter(seat_status(classifier, output, conf, min_size, centroid_threshold) for _, _, output in seat_trace)
+        status = counter.most_common(1)[0][0] if counter else SeatStatus.UNSURE
+        seat_rows.append({
+            "seat_conf": conf, "min_chair_size": min_size, "centroid_threshold": centroid_threshold,
+            "status": status.name,
+            "correct": None if "seat" not in session else status.name == session["seat"],
+        })
+
+    # gesture: the MediaPipe confidences change the model outputs, one run each
+    decision_rows = []
+    for confidence in grid["gesture_confidence"]:
+        gesture_cache = FrameCache(cache_dir, key, "gesture", {"min_confidence": confidence})
+        caches.append(gesture_cache)
+        gesture_trace = simulate(
+            timestamps, duration, lambda i: gesture_cache.get(i, lambda i: _infer_gesture(recording.frame(i), confidence))
+        )
+        gesture_ms = statistics.fmean(output["ms"] for _, _, output in gesture_trace)
+        for min_score in grid["gesture_score"]:
+            decided = None
+            for n, (ready, _, output) in enumerate(gesture_trace, 1):
+                decision = gesture_decision(gestures_of(output, min_score))
+                if decision is not None:
+                    decided = decision, ready, n
+                    break
+            for seat_row in seat_rows:
+                if decided is not None:
+                    decision, seconds, frames = decided
+                else:
+                    decision, seconds, frames = timeout_decision(SeatStatus[seat_row["status"]]), timeout, len(gesture_trace)
+                decision_rows.append({
+                    "gesture_confidence": confidence, "gesture_score": min_score,
+                    **{p: seat_row[p] for p in SEAT_PARAMS},
+                    "decision": decision.name,
+                    "correct": decision.name == session["decision"],
+                    "seconds": seconds,
+                    "frames": frames,
+                    # gesture and seat inference for one frame each
+                    "ms_per_frame": gesture_ms + seat_ms,
+                })
+
+    face_rows = []
+    if gallery and "person" in session:
+        face_cache = FrameCache(cache_dir, key, "face", {"gallery": sorted(name for name, _ in gallery)})
+        caches.append(face_cache)
+        face_trace = simulate(
+            timestamps, duration, lambda i: face_cache.get(i, lambda i: _infer_face(recording.frame(i), gallery)),
+            pause=FACE_LOOP_PAUSE,
+        )
+        recognizer = _face_recognizer(gallery)
+        for tolerance in grid["face_tolerance"]:
+            names = Counter(
+                name
+                for _, _, output in face_trace
+                for name in recognizer.match([np.asarray(e) for e in output["encodings"]], tolerance)
+                if name != "Unknown"
+            )
+            person = names.most_common(1)[0][0] if names else "Unknown"
+            face_rows.append({"face_tolerance": tolerance, "person": person, "correct": person == session["person"]})
+
+    for cache in caches:
+        cache.save()
+    return {
+        "recording": session["recording"],
+        "decision": decision_rows,
+        "seat": seat_rows,
+        "face": face_rows,
+        "cache": {"hits": sum(c.hits for c in caches), "misses": sum(c.misses for c in caches)},
+    }
+
+
+# ---------------------------------------------------------------------- #
+# aggregation and report
+# ---------------------------------------------------------------------- #
+def aggregate(rows: list[dict], params: tuple[str, ...]) -> list[dict]:
+    """Averages the per-session rows of every setting."""
+    groups: dict[tuple, list[dict]] = {}
+    for row in rows:
+        groups.setdefault(tuple(row[p] for p in params), []).append(row)
+    table = []
+    for values, group in groups.items():
+        labelled = [row["correct"] for row in group if row["correct"] is not None]
+        entry = dict(zip(params, values))
+        entry["sessions"] = len(labelled)
+        entry["accuracy"] = round(sum(labelled) / len(labelled), 3) if labelled else None
+        if "seconds" in group[0]:
+            entry["seconds"] = round(statistics.fmean(row["seconds"] for row in group), 2)
+            entry["frames"] = round(statistics.fmean(row["frames"] for row in group), 1)
+            entry["fps"] = round(1000 / statistics.fmean(row["ms_per_frame"] for row in group), 1)
+        table.append(entry)
+    return table
+
+
+def pareto_front(table: list[dict], maximize: tuple[str, ...], minimize: tuple[str, ...]) -> list[dict]:
+    """The settings no other setting beats in every objective."""
+    def score(entry):
+        return [entry[k] if entry[k] is not None else float("-inf") for k in maximize] + \
+               [-entry[k] for k in minimize]
+
+    scores = [score(entry) for entry in table]
+    front = []
+    for entry, s in zip(table, scores):
+        dominated = any(
+            all(a >= b for a, b in zip(other, s)) and any(a > b for a, b in zip(other, s))
+            for other in scores
+        )
+        if not dominated:
+            front.append(entry)
+    return front
+
+
+def print_table(title: str, table: list[dict], columns: list[str], marked: list[dict]):
+    print(f"\n{title}")
+    print("  ".join(f"{c:>18}" for c in columns) + "  pareto")
+    for entry in table:
+        print("  ".join(f"{str(entry[c]):>18}" for c in columns) + ("       *" if entry in marked else ""))
+
+
+def load_manifest(path: str) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        sessions = json.load(f)
+    root = os.path.dirname(os.path.abspath(path))
+    for session in sessions:
+        session["recording"] = os.path.join(root, session["recording"])
+        Decision[session["decision"]]  # fail early on typos
+        if "seat" in session:
+            SeatStatus[session["seat"]]
+    return sessions
+
+
+def load_gallery(directory: str | None) -> list[tuple[str, str]]:
+    """(name, image path) of every image in `directory`, named after the file."""
+    if not directory:
+        return []
+    return [
+        (os.path.splitext(name)[0], os.path.join(directory, name))
+        for name in sorted(os.listdir(directory))
+        if name.lower().endswith((".jpg", ".jpeg", ".png"))
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--manifest", required=True, help="JSON list of labelled recordings")
+    parser.add_argument("--faces", help="directory of face images named after the person, enables the face sweep")
+    parser.add_argument("--grid", help="JSON file overriding values of DEFAULT_GRID")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_DIR, help="directory of the per-frame model outputs")
+    parser.add_argument("--workers", type=int, default=max(1, len(available_cpus()) // 2))
+    parser.add_argument("--all", action="store_true", help="print every setting, not only the Pareto front")
+    parser.add_argument("--output", help="write all results to this JSON file")
+    args = parser.parse_args()
+
+    grid = dict(DEFAULT_GRID)
+    if args.grid:
+        with open(args.grid, encoding="utf-8") as f:
+            grid.update(json.load(f))
+    sessions = load_manifest(args.manifest)
+    gallery = load_gallery(args.faces)
+    threads = max(1, len(available_cpus()) // args.workers)
+
+    t0 = time.perf_counter()
+    results = []
+    # spawn, like the recognizer workers: torch and MediaPipe thread pools do not survive a fork
+    with ProcessPoolExecutor(
+        args.workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker, initargs=(threads,)
+    ) as pool:
+        futures = {pool.submit(evaluate_session, session, grid, args.cache, gallery): session for session in sessions}
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print(f"[evaluation] {os.path.basename(result['recording'])}: "
+                  f"{result['cache']['hits']} cached, {result['cache']['misses']} inferred frames")
+    print(f"[evaluation] {len(sessions)} sessions in {time.perf_counter() - t0:.1f} s")
+
+    current = {p: values[0] for p, values in grid.items()}
+    decisions = aggregate([row for r in results for row in r["decision"]], DECISION_PARAMS)
+    front = pareto_front(decisions, maximize=("accuracy", "fps"), minimize=("seconds",))
+    shown = decisions if args.all else [e for e in decisions if e in front or all(e[p] == current[p] for p in DECISION_PARAMS)]
+    print_table("Decision: Pareto front and the current setting", shown,
+                [*DECISION_PARAMS, "accuracy", "seconds", "frames", "fps"], front)
+
+    seats = aggregate([row for r in results for row in r["seat"]], SEAT_PARAMS)
+    seats.sort(key=lambda e: -(e["accuracy"] or 0))
+    print_table("Seat status", seats if args.all else seats[:10], [*SEAT_PARAMS, "accuracy", "sessions"], [])
+
+    faces = aggregate([row for r in results for row in r["face"]], ("face_tolerance",))
+    if faces:
+        print_table("Face identification", faces, ["face_tolerance", "accuracy", "sessions"], [])
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"grid": grid, "decision": decisions, "pareto": front, "seat": seats, "face": faces, "sessions": results}, f, indent=2)
+        print(f"[evaluation] results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Compares the old per-frame preprocessing (copy, cvtColor, equalizeHist, cvtColor, convertScaleAbs,
+cvtColor BGR->RGB in the recognizers) with the pooled FramePreprocessor.
+
+start using command python -m robocof_mood.benchmarks.preprocessing from the root dir
+"""
+from __future__ import annotations
+
+import argparse
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from robocof_mood.input_stream.frame_preprocessor import FramePreprocessor
+
+
+def legacy_gesture(frame: np.ndarray) -> np.ndarray:
+    """capture_frame(square_crop=True, transform=True) before the preprocessing pipeline."""
+    frame = FramePreprocessor.center_crop_square(frame.copy())
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    equalized = cv2.equalizeHist(gray)
+    frame = cv2.cvtColor(equalized, cv2.COLOR_GRAY2BGR)
+    return cv2.convertScaleAbs(frame, alpha=1.2, beta=20)
+
+
+def legacy_seat(frame: np.ndarray) -> np.ndarray:
+    """capture_frame() + the BGR->RGB conversion in SeatRecognizer.recognize before the pipeline."""
+    return cv2.cvtColor(frame.copy(), cv2.COLOR_BGR2RGB)
+
+
+def synthetic_frames(width: int, height: int, count: int = 8) -> list[np.ndarray]:
+    """Noisy gradients, so equalisation has a non-trivial histogram to work with."""
+    rng = np.random.default_rng(0)
+    ramp = np.linspace(40, 200, width, dtype=np.float32)[None, :, None]
+    frames = []
+    for _ in range(count):
+        noise = rng.normal(0, 25, (height, width, 3)).astype(np.float32)
+        frames.append(np.clip(ramp + noise, 0, 255).astype(np.uint8))
+    return frames
+
+
+def _run(fn, frames: list[np.ndarray], iterations: int) -> tuple[float, float]:
+    """Returns (ms per frame, peak bytes of temporary numpy memory per frame)."""
+    for frame in frames:  # warm-up, fills the buffer pool
+        fn(frame)
+
+    t0 = time.perf_counter()
+    for i in range(iterations):
+        fn(frames[i % len(frames)])
+    elapsed = time.perf_counter() - t0
+
+    # numpy reports its allocations to tracemalloc; OpenCV's python bindings allocate outputs through numpy
+    peaks = []
+    tracemalloc.start()
+    for frame in frames:
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        fn(frame)
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+    return elapsed / iterations * 1000, sum(peaks) / len(peaks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--iterations", type=int, default=500)
+    args = parser.parse_args()
+
+    frames = synthetic_frames(args.width, args.height)
+    pre = FramePreprocessor()
+
+    # the fused LUT has to reproduce equalizeHist + convertScaleAbs exactly
+    max_diff = max(
+        int(np.abs(legacy_gesture(f).astype(np.int16) - pre.process(f, square_crop=True, transform=True)).max())
+        for f in frames
+    )
+    print(f"max pixel difference legacy vs. fused transform: {max_diff}")
+
+    cases = [
+        ("gesture (crop + transform)", legacy_gesture, lambda f: pre.process(f, square_crop=True, transform=True)),
+        ("seat (copy + BGR->RGB)", legacy_seat, lambda f: pre.process(f, rgb=True)),
+    ]
+    print(f"{args.width}x{args.height}, {args.iterations} iterations")
+    print(f"{'pipeline':<28} | {'before [ms]':>11} | {'after [ms]':>10} | {'before peak':>12} | {'after peak':>11}")
+    for name, before_fn, after_fn in cases:
+        before_ms, before_alloc = _run(before_fn, frames, args.iterations)
+        after_ms, after_alloc = _run(after_fn, frames, args.iterations)
+        print(
+            f"{name:<28} | {before_ms:11.3f} | {after_ms:10.3f} | "
+            f"{before_alloc / 1024:9.0f} KiB | {after_alloc / 1024:8.0f} KiB"
+        )
+    print(f"buffer pool size: {pre.pool.nbytes() / 1024 / 1024:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
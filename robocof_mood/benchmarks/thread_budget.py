@@ -0,0 +1,112 @@
+"""
+Aggregate throughput and tail latency of concurrent decision sessions (seat + gesture inference and frame
+preprocessing per frame) with the libraries' default thread pools versus the ResourceGovernor's budgets.
+Each mode runs in a fresh subprocess, since torch and OpenCV size their pools only once.
+
+start using command python -m robocof_mood.benchmarks.thread_budget --source <video, recording or image dir> from the root dir
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+
+def _percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run_mode(mode: str, source: str, sessions: int, frames_per_session: int, pin: bool) -> dict:
+    """Runs `sessions` concurrent sessions in this process and returns throughput and latency figures."""
+    from robocof_mood.resources.resource_governor import ResourceGovernor
+
+    if mode == "governed":
+        # like main.py: budgets are in place before torch / mediapipe are imported
+        governor = ResourceGovernor(pin=pin)
+        governor.pin_service()
+        for _ in range(sessions):
+            governor.session_started()
+
+    from robocof_mood.benchmarks.unified_detector import load_frames
+    from robocof_mood.input_stream.frame_preprocessor import FramePreprocessor
+    from robocof_mood.seat_recognition.seat_recognizer import SeatRecognizer
+    from robocof_mood.gesture_recognition.gesture_recognizer import GestureRecognizer, mp
+
+    frames = load_frames(source, frames_per_session)
+    # one recognizer pair per session, as concurrent decisions would use in worker mode
+    pairs = [
+        (SeatRecognizer(None, motion_gating=False), GestureRecognizer([], None, motion_gating=False), FramePreprocessor())
+        for _ in range(sessions)
+    ]
+    if mode == "governed":
+        governor.apply()  # torch is loaded now
+
+    latencies: list[float] = []
+    lock = threading.Lock()
+
+    def session(seat, gesture, pre):
+        own = []
+        for i in range(frames_per_session):
+            frame = frames[i % len(frames)]
+            t0 = time.perf_counter()
+            seat.recognize(pre.process(frame, rgb=True), seat.model, rgb=True)
+            g = pre.process(frame, square_crop=True, transform=True)
+            gesture.recognize(mp.Image(image_format=mp.ImageFormat.SRGB, data=g))
+            own.append((time.perf_counter() - t0) * 1000)
+        with lock:
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=session, args=pair) for pair in pairs]
+    t0 = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - t0
+    if mode == "governed":
+        for _ in range(sessions):
+            governor.session_finished()
+
+    return {
+        "mode": mode,
+        "fps": len(latencies) / elapsed,
+        "p50": statistics.median(latencies),
+        "p95": _percentile(latencies, 0.95),
+        "p99": _percentile(latencies, 0.99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--source", required=True, help="video file, flight recording (.rfr) or directory of images")
+    parser.add_argument("--sessions", type=int, default=3, help="concurrent decision sessions")
+    parser.add_argument("--frames", type=int, default=50, help="frames per session")
+    parser.add_argument("--pin", action="store_true", help="pin the service to its CPUs")
+    parser.add_argument("--mode", choices=["default", "governed"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode is not None:
+        # child process: run one mode and report as JSON
+        print(json.dumps(run_mode(args.mode, args.source, args.sessions, args.frames, args.pin)))
+        return
+
+    for mode in ("default", "governed"):
+        cmd = [
+            sys.executable, "-m", "robocof_mood.benchmarks.thread_budget", "--mode", mode,
+            "--source", args.source, "--sessions", str(args.sessions), "--frames", str(args.frames),
+        ] + (["--pin"] if args.pin else [])
+        output = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+        r = json.loads(output.strip().splitlines()[-1])
+        print(
+            f"{r['mode']:<9} {args.sessions} sessions: {r['fps']:6.1f} frames/s | "
+            f"p50 {r['p50']:6.1f} ms | p95 {r['p95']:6.1f} ms | p99 {r['p99']:6.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
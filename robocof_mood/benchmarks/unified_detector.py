@@ -0,0 +1,134 @@
+"""
+Compares the current three-model setup (YOLOv5 via torch.hub, MediaPipe on the full square crop,
+face_recognition on the full frame) with the single-pass ultralytics detector that feeds seat
+classification and restricts where MediaPipe and face_recognition run.
+
+start using command python -m robocof_mood.benchmarks.unified_detector --source <video, recording or image dir> from the root dir
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import time
+
+import cv2
+
+from robocof_mood.input_stream.flight_recorder import FlightRecording, FILE_EXTENSION
+from robocof_mood.input_stream.frame_preprocessor import FramePreprocessor
+from robocof_mood.perception.unified_detector import DEFAULT_MODEL_PATH, UnifiedDetector, union_region
+
+
+def load_frames(source: str, limit: int) -> list:
+    """Reads up to `limit` BGR frames from a video file, a flight recording or a directory of images."""
+    frames = []
+    if source.endswith(FILE_EXTENSION):
+        for _, frame in FlightRecording(source).frames():
+            frames.append(frame)
+            if len(frames) >= limit:
+                break
+    elif os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            frame = cv2.imread(os.path.join(source, name), cv2.IMREAD_COLOR)
+            if frame is not None:
+                frames.append(frame)
+            if len(frames) >= limit:
+                break
+    else:
+        cap = cv2.VideoCapture(source)
+        while len(frames) < limit:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            frames.append(frame)
+        cap.release()
+    if not frames:
+        raise ValueError(f"No frames found in {source}")
+    return frames
+
+
+def _timed(timings: dict, key: str, fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    timings.setdefault(key, []).append((time.perf_counter() - t0) * 1000)
+    return result
+
+
+def run_three_model(frames: list, with_face: bool) -> tuple[dict, int]:
+    from robocof_mood.seat_recognition.seat_recognizer import SeatRecognizer
+    from robocof_mood.gesture_recognition.gesture_recognizer import GestureRecognizer, mp
+
+    seat = SeatRecognizer(None, motion_gating=False)
+    gesture = GestureRecognizer([], None, motion_gating=False)
+    face = None
+    if with_face:
+        from robocof_mood.face_recognition.face_recognition import FaceRecognizer
+        face = FaceRecognizer(None, motion_gating=False)
+    pre = FramePreprocessor()
+
+    timings, passes = {}, 0
+    for frame in frames:
+        _timed(timings, "seat", seat.recognize, frame, seat.model)
+        g = pre.process(frame, square_crop=True, transform=True)
+        _timed(timings, "gesture", gesture.recognize, mp.Image(image_format=mp.ImageFormat.SRGB, data=g))
+        passes += 2
+        if face is not None:
+            _timed(timings, "face", face.recognize, frame)
+            passes += 1
+    return timings, passes
+
+
+def run_unified(frames: list, model_path: str, with_face: bool) -> tuple[dict, int]:
+    from robocof_mood.seat_recognition.seat_recognizer import SeatRecognizer
+    from robocof_mood.gesture_recognition.gesture_recognizer import GestureRecognizer, mp
+
+    seat = SeatRecognizer(None, motion_gating=False, detector=UnifiedDetector(model_path))
+    gesture = GestureRecognizer([], None, motion_gating=False)
+    face = None
+    if with_face:
+        from robocof_mood.face_recognition.face_recognition import FaceRecognizer
+        face = FaceRecognizer(None, motion_gating=False)
+    pre = FramePreprocessor()
+
+    timings, passes = {}, 0
+    for frame in frames:
+        _timed(timings, "seat", seat.recognize, frame, None)
+        passes += 1
+        perception = seat.latest_perception
+        region = union_region(perception.hand_regions())
+        if region is not None:
+            x0, y0, x1, y1 = region
+            g = pre.transform(frame[y0:y1, x0:x1])
+            _timed(timings, "gesture", gesture.recognize, mp.Image(image_format=mp.ImageFormat.SRGB, data=g))
+        if face is not None and perception.persons:
+            _timed(timings, "face", face.recognize, frame, regions=perception.face_regions())
+    return timings, passes
+
+
+def _summary(name: str, timings: dict, passes: int, frames: int):
+    total = sum(sum(values) for values in timings.values()) / frames
+    stages = ", ".join(
+        f"{key} {statistics.mean(values):.1f} ms x{len(values)}" for key, values in timings.items()
+    )
+    print(f"{name:<12} {total:7.1f} ms/frame | {passes / frames:.1f} full-frame CNN passes/frame | {stages}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--source", required=True, help="video file, flight recording (.rfr) or directory of images")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH, help="ultralytics weights for the unified detector")
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--no-face", action="store_true", help="skip face_recognition (dlib not installed)")
+    args = parser.parse_args()
+
+    frames = load_frames(args.source, args.frames)
+    print(f"{len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]} from {args.source}")
+
+    timings, passes = run_three_model(frames, not args.no_face)
+    _summary("three-model", timings, passes, len(frames))
+    timings, passes = run_unified(frames, args.model, not args.no_face)
+    _summary("unified", timings, passes, len(frames))
+
+
+if __name__ == "__main__":
+    main()
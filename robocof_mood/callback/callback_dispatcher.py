@@ -0,0 +1,281 @@
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+
+import httpx
+
+from robocof_mood.tracing import log
+
+
+OUTBOX_PATH = "callback_outbox.jsonl"
+
+
+@dataclass
+class PendingCallback:
+    """A callback POST that has not been acknowledged by the receiver yet."""
+
+    id: str
+    url: str
+    payload: dict
+    attempts: int = 0
+    created: float = field(default_factory=time.time)
+    # accepted by the receiver, only the outbox ack is missing
+    delivered: bool = False
+
+
+class CallbackDispatcher:
+    """
+    Delivers decision callbacks over a long-lived, pooled `httpx.AsyncClient`.
+
+    Every callback is first appended to an on-disk outbox (JSON lines, append-only)
+    and only marked as done once the receiver answered with a 2xx. Failed POSTs are
+    retried with jittered exponential backoff, so decisions survive both a flaky
+    app backend and a restart of this service.
+    """
+
+    def __init__(
+        self,
+        outbox_path: str = OUTBOX_PATH,
+        *,
+        max_concurrency: int = 8,
+        timeout: float = 10.0,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+        max_attempts: int | None = None,
+    ):
+        """Constructor
+
+        Args:
+            outbox_path (str, optional): File the outbox is persisted to. Defaults to OUTBOX_PATH.
+            max_concurrency (int, optional): Maximum number of POSTs in flight at once. Defaults to 8.
+            timeout (float, optional): Timeout in seconds for a single POST. Defaults to 10.0.
+            base_delay (float, optional): Backoff delay in seconds after the first failure. Defaults to 0.5.
+            max_delay (float, optional): Upper bound for the backoff delay in seconds. Defaults to 30.0.
+            max_attempts (int | None, optional): Give up after this many attempts. None retries forever. Defaults to None.
+        """
+        self.outbox_path = outbox_path
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+
+        self._client: httpx.AsyncClient | None = None
+        self._queue: asyncio.Queue[PendingCallback] | None = None
+        self._workers: list[asyncio.Task] = []
+        self._retry_handles: set[asyncio.TimerHandle] = set()
+        self._ack_tasks: set[asyncio.Task] = set()
+        self._pending: dict[str, PendingCallback] = {}
+        self._file_lock = threading.Lock()
+
+    # ------------------------------------------------------------------ #
+    # lifecycle
+    # ------------------------------------------------------------------ #
+    async def start(self):
+        """Open the pooled client, replay the outbox and start the sender tasks."""
+        http2 = importlib.util.find_spec("h2") is not None
+        self._client = httpx.AsyncClient(
+            timeout=self.timeout,
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency,
+                keepalive_expiry=60.0,
+            ),
+        )
+        self._queue = asyncio.Queue()
+
+        for pending in await asyncio.to_thread(self._load_outbox):
+            self._pending[pending.id] = pending
+            self._queue.put_nowait(pending)
+        if self._pending:
+            log.info("callback.replay", "replaying pending callbacks from outbox", pending=len(self._pending))
+
+        self._workers = [
+            asyncio.create_task(self._sender()) for _ in range(self.max_concurrency)
+        ]
+
+    async def stop(self):
+        """Stop sending and close the client. Undelivered callbacks stay in the outbox."""
+        for handle in self._retry_handles:
+            handle.cancel()
+        self._retry_handles.clear()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        # let outbox writes in progress finish, a lost ack would resend the callback after a restart
+        await asyncio.gather(*self._ack_tasks, return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    # ------------------------------------------------------------------ #
+    # public API
+    # ------------------------------------------------------------------ #
+    async def submit(self, url: str, payload: dict) -> str:
+        """
+        Persist a callback to the outbox and queue it for delivery.
+
+        Args:
+            url (str): The URL to POST the payload to.
+            payload (dict): JSON-serialisable body of the callback.
+
+        Returns:
+            str: The id of the queued callback.
+        """
+        if self._queue is None:
+            raise RuntimeError("CallbackDispatcher.start() has not been called.")
+
+        pending = PendingCallback(id=uuid.uuid4().hex, url=str(url), payload=payload)
+        await asyncio.to_thread(
+            self._append,
+            {"op": "put", "id": pending.id, "url": pending.url,
+             "payload": pending.payload, "created": pending.created},
+        )
+        self._pending[pending.id] = pending
+        self._queue.put_nowait(pending)
+        return pending.id
+
+    def pending_count(self) -> int:
+        """Returns the number of callbacks that have not been delivered yet."""
+        return len(self._pending)
+
+    # ------------------------------------------------------------------ #
+    # internal sender
+    # ------------------------------------------------------------------ #
+    async def _sender(self):
+        while True:
+            pending = await self._queue.get()
+            try:
+                await self._deliver(pending)
+            except Exception as exc:
+                # a sender task must never die, or the dispatcher silently loses concurrency
+                self._failed(pending, exc)
+            finally:
+                self._queue.task_done()
+
+    def _failed(self, pending: PendingCallback, exc: Exception):
+        reason = f"{type(exc).__name__}: {exc}"
+        if isinstance(exc, OSError):
+            # the outbox could not be written (disk full, ...), try again later
+            self._retry_later(pending, reason)
+            return
+        # invalid URL, payload that is not JSON-serialisable, ...: no retry can deliver it
+        log.error("callback.dead_letter", "callback cannot be delivered, dropping", url=pending.url,
+                  payload=pending.payload, reason=reason)
+        self._ack_later(pending)
+
+    async def _deliver(self, pending: PendingCallback):
+        if pending.delivered:
+            await self._ack(pending)  # only the ack failed before, do not send the callback twice
+            return
+        pending.attempts += 1
+        try:
+            r = await self._client.post(pending.url, json=pending.payload)
+        except httpx.HTTPError as exc:
+            self._retry_later(pending, f"{type(exc).__name__}: {exc}")
+            return
+
+        if r.is_success:
+            pending.delivered = True
+            await self._ack(pending)
+        elif r.status_code in (408, 425, 429) or r.status_code >= 500:
+            self._retry_later(pending, f"HTTP {r.status_code}")
+        else:
+            # the receiver rejected the payload; retrying will not help
+            log.error("callback.rejected", "callback rejected, dropping", url=pending.url, status=r.status_code)
+            await self._ack(pending)
+
+    def _retry_later(self, pending: PendingCallback, reason: str):
+        if self.max_attempts is not None and pending.attempts >= self.max_attempts:
+            log.error("callback.gave_up", "callback failed, giving up", url=pending.url, attempts=pending.attempts, reason=reason)
+            self._ack_later(pending)
+            return
+
+        # full jitter: uniform in [0, min(max_delay, base * 2^n)]
+        cap = min(self.max_delay, self.base_delay * 2 ** (pending.attempts - 1))
+        delay = random.uniform(0, cap)
+        log.warning("callback.retry", "callback failed, retrying", url=pending.url, reason=reason, attempt=pending.attempts, delay=round(delay, 1))
+
+        loop = asyncio.get_running_loop()
+
+        def requeue():
+            self._retry_handles.discard(handle)
+            self._queue.put_nowait(pending)
+
+        handle = loop.call_later(delay, requeue)
+        self._retry_handles.add(handle)
+
+    async def _ack(self, pending: PendingCallback):
+        await asyncio.to_thread(self._append, {"op": "ack", "id": pending.id})
+        self._pending.pop(pending.id, None)
+
+    def _ack_later(self, pending: PendingCallback):
+        """Acks `pending` in a task that is kept until it is done (the loop only holds weak references)."""
+        task = asyncio.create_task(self._ack(pending))
+        self._ack_tasks.add(task)
+
+        def done(task: asyncio.Task):
+            self._ack_tasks.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                log.error("callback.ack_failed", "could not write the outbox ack", id=pending.id, error=task.exception())
+
+        task.add_done_callback(done)
+
+    # ------------------------------------------------------------------ #
+    # outbox file
+    # ------------------------------------------------------------------ #
+    def _append(self, record: dict):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._file_lock:
+            with open(self.outbox_path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _load_outbox(self) -> list[PendingCallback]:
+        """Reads the outbox, returns the unacknowledged entries and compacts the file."""
+        if not os.path.exists(self.outbox_path):
+            return []
+
+        pending: dict[str, PendingCallback] = {}
+        with self._file_lock:
+            with open(self.outbox_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # torn write from a crash
+                    if record.get("op") == "put":
+                        pending[record["id"]] = PendingCallback(
+                            id=record["id"],
+                            url=record["url"],
+                            payload=record["payload"],
+                            created=record.get("created", time.time()),
+                        )
+                    elif record.get("op") == "ack":
+                        pending.pop(record.get("id"), None)
+
+            # rewrite the file with only the pending entries so it does not grow forever
+            tmp_path = self.outbox_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for p in pending.values():
+                    f.write(json.dumps(
+                        {"op": "put", "id": p.id, "url": p.url,
+                         "payload": p.payload, "created": p.created},
+                        separators=(",", ":"),
+                    ) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.outbox_path)
+
+        return sorted(pending.values(), key=lambda p: p.created)
@@ -1,9 +1,19 @@
 import asyncio
+import threading
+import time
+from typing import Callable
 from robocof_mood.input_stream.input_stream import InputStream
 from robocof_mood.input_stream.webcam_input_stream import WebcamInputStream
 from robocof_mood.input_stream.api_mjpeg_input_stream import MJPEGAPIInputStream, smoke_test
 from robocof_mood.gesture_recognition.gesture_recognizer import GestureRecognizer, Gesture
 from robocof_mood.seat_recognition.seat_recognizer import SeatRecognizer, SeatStatus 
+from robocof_mood.workers.recognizer_worker import RecognizerWorker
+from robocof_mood.seat_recognition.desk_prior_cache import DeskPriorCache
+from robocof_mood.perception.unified_detector import UnifiedDetector
+from robocof_mood.tracing import tracer, log
+from robocof_mood.resources.resource_governor import ResourceGovernor
+from robocof_mood.resources.overload_controller import OverloadController, QualityTier
+from robocof_mood.sessions.cancellation import CancellationToken
 from enum import Enum
 from collections import Counter
 
@@ -16,18 +26,53 @@ class Decision(Enum):
     TIMEOUT_USER_PRESENT = 5
     TIMEOUT = 6
     ERROR = 7
+    CANCELLED = 8
 
 
 
+# Seconds a /prepare stays armed if no decision is requested
+DEFAULT_PREPARE_TTL = 30
+# Seconds make_decision waits for the cancelled recognizer tasks of a session to wind down
+STOP_TIMEOUT = 0.05
+# Frames older than this (seconds since capture) are not used by the recognizers
+DEFAULT_MAX_FRAME_AGE = 1.0
+
 GESTURES_POSITIVE = [Gesture.THUMB_UP, Gesture.CLOSED_FIST]
 GESTURES_NEGATIVE = [Gesture.OPEN_PALM]
 
 
+def gesture_decision(gestures: list[Gesture]) -> Decision | None:
+    """The decision a set of recognized gestures stands for, None if none of them decides anything."""
+    if any(gesture in gestures for gesture in GESTURES_POSITIVE):
+        return Decision.CARRY_OUT_ACTION
+    if any(gesture in gestures for gesture in GESTURES_NEGATIVE):
+        return Decision.USER_ABORT
+    return None
+
+
+def timeout_decision(seat_status: SeatStatus) -> Decision:
+    """The reason reported on timeout, given the prevailing seat status."""
+    if seat_status == SeatStatus.SEAT_EMPTY or seat_status == SeatStatus.NO_CHAIRS_NO_PEOPLE:
+        return Decision.TIMEOUT_NO_USER_PRESENT
+    if seat_status == SeatStatus.SEAT_OCCUPIED:
+        return Decision.TIMEOUT_USER_PRESENT
+    return Decision.TIMEOUT
+
+
 class DecisionManager:
     """A class to manage the decision-making process for the robot of whether or not to carry out an action."""
 
     def __init__(
-        self, input_stream: InputStream, timeout: int = 15, debug_mode: bool = False
+        self,
+        input_stream: InputStream,
+        timeout: int = 15,
+        debug_mode: bool = False,
+        worker_mode: bool = False,
+        desk_priors: DeskPriorCache | None = None,
+        unified_model_path: str | None = None,
+        governor: ResourceGovernor | None = None,
+        overload: OverloadController | None = None,
+        max_frame_age: float | None = DEFAULT_MAX_FRAME_AGE,
     ):
         """Constructor
 
@@ -35,33 +80,277 @@ class DecisionManager:
             live_feed (LiveFeed): The live feed object to get the current image from.
             timeout (int, optional): The timeout in seconds to wait for a decision. Defaults to 15.
             debug_mode (bool, optional): Does not return any decision and only prints debug information. Defaults to False.
+            worker_mode (bool, optional): Run each recognizer's inference in its own worker process. Defaults to False.
+            desk_priors (DeskPriorCache | None, optional): Learned chair locations per desk id. Defaults to None.
+            unified_model_path (str | None, optional): Local ultralytics model for single-pass perception. Seat
+                status comes from its detections and gesture recognition only runs where it found people.
+                Takes precedence over worker mode for the seat recognizer. Defaults to None.
+            governor (ResourceGovernor | None, optional): Assigns thread budgets to the backends and workers and
+                rebalances them per running decision. Defaults to None.
+            overload (OverloadController | None, optional): Steps the recognizers down through quality tiers when the
+                service is saturated. Defaults to None.
+            max_frame_age (float | None, optional): The recognizers reject frames older than this many seconds, e.g.
+                while the stream reconnects. None accepts every frame. Defaults to DEFAULT_MAX_FRAME_AGE.
         """
         self.input_stream = input_stream
-        self.__gesture_recognizer = GestureRecognizer(
-            GESTURES_POSITIVE + GESTURES_NEGATIVE, input_stream, debug_mode=debug_mode
-        )
-        self.__seat_recognizer = SeatRecognizer(input_stream)
+        self.__worker_mode = worker_mode
+        self.desk_priors = desk_priors
+        self.__unified_model_path = unified_model_path
+        self.__workers: dict[str, RecognizerWorker] = {}
+        self.governor = governor
+        self.overload = overload
+        self.max_frame_age = max_frame_age
+        if overload is not None:
+            overload.add_listener(self.__apply_tier)
+        # recognizers (and with them torch / mediapipe) are created on first use or in preload()
+        self.__gesture_recognizer: GestureRecognizer | None = None
+        self.__seat_recognizer: SeatRecognizer | None = None
+        self.__recognizer_lock = threading.Lock()
         self.__debug_mode = debug_mode
+        # state of a pending preparation, see prepare()
+        self.__prepared = False
+        # set while a cold prepare() loads the models, later prepare() calls wait for it
+        self.__preparing: asyncio.Future | None = None
+        self.__prepared_seat_task: asyncio.Task | None = None
+        # stop signal of the prepared seat task, handed over to the decision with it
+        self.__prepared_cancel: CancellationToken | None = None
+        self.__prepared_desk_id: str | None = None
+        self.__warm_up_task: asyncio.Task | None = None
+        self.__prepare_expiry: asyncio.TimerHandle | None = None
+        self.__decision_running = False
         self.__timeout = timeout if not debug_mode else float("inf")
 
-    async def make_decision(self) -> Decision:
+    def __get_gesture_recognizer(self) -> GestureRecognizer:
+        """Get the gesture recognizer, creating it (and importing mediapipe) on first use."""
+        if self.__gesture_recognizer is None:
+            with self.__recognizer_lock:
+                if self.__gesture_recognizer is None:
+                    self.__gesture_recognizer = GestureRecognizer(
+                        GESTURES_POSITIVE + GESTURES_NEGATIVE,
+                        self.input_stream,
+                        debug_mode=self.__debug_mode,
+                        worker=self.__start_worker("gesture"),
+                        perception_source=self.__latest_perception if self.__unified_model_path else None,
+                        overload=self.overload,
+                        max_frame_age=self.max_frame_age,
+                    )
+        return self.__gesture_recognizer
+
+    def __get_seat_recognizer(self) -> SeatRecognizer:
+        """Get the seat recognizer, creating it (and importing torch) on first use."""
+        if self.__seat_recognizer is None:
+            with self.__recognizer_lock:
+                if self.__seat_recognizer is None:
+                    if self.__unified_model_path is not None:
+                        self.__seat_recognizer = SeatRecognizer(
+                            self.input_stream,
+                            detector=UnifiedDetector(self.__unified_model_path),
+                            overload=self.overload,
+                            max_frame_age=self.max_frame_age,
+                        )
+                    else:
+                        self.__seat_recognizer = SeatRecognizer(
+                            self.input_stream,
+                            worker=self.__start_worker("seat"),
+                            overload=self.overload,
+                            max_frame_age=self.max_frame_age,
+                        )
+        return self.__seat_recognizer
+
+    def __apply_tier(self, tier: QualityTier):
+        """Quality-tier settings that live in the input stream rather than in a recognizer."""
+        if self.input_stream.supports_decode_reduction:
+            self.input_stream.decode_reduction = tier.decode_reduction
+
+    def __latest_perception(self):
+        """Latest result of the unified detector, which runs in the seat recognizer's loop."""
+        if self.__seat_recognizer is None:
+            return None
+        return self.__seat_recognizer.latest_perception
+
+    def __start_worker(self, kind: str) -> RecognizerWorker | None:
+        """Start the worker process for `kind` in worker mode and wait until its model is loaded."""
+        if not self.__worker_mode:
+            return None
+        options = self.governor.options_for(kind) if self.governor is not None else None
+        worker = RecognizerWorker(kind, options=options)
+        # the first model load may download weights; decisions wait for the worker after this.
+        # Raises if the model cannot be loaded, the recognizer is then not created either
+        worker.start(wait=True, timeout=300)
+        if self.governor is not None:
+            self.governor.register_worker(kind, worker)
+        self.__workers[kind] = worker
+        return worker
+
+    def shutdown(self):
+        """Stop the worker processes (worker mode only)."""
+        for worker in self.__workers.values():
+            worker.stop()
+        self.__workers.clear()
+
+    def worker_restarts(self) -> dict[str, int]:
+        """How often each worker process was restarted after a crash."""
+        return {kind: worker.restarts for kind, worker in self.__workers.items()}
+
+    gesture_recognizer = property(__get_gesture_recognizer)
+    seat_recognizer = property(__get_seat_recognizer)
+
+    def preload(self):
+        """Import the ML backends and load all models now instead of on the first decision.
+
+        Blocking; run it in a thread to keep the event loop responsive.
+        """
+        self.__get_gesture_recognizer()
+        self.__get_seat_recognizer()
+
+    def is_preloaded(self) -> bool:
+        """Whether all recognizers have been created already."""
+        return self.__gesture_recognizer is not None and self.__seat_recognizer is not None
+
+    def seat_scale_stats(self) -> dict | None:
+        """Per-scale latency and escalation rate of the seat detector, None before it was created."""
+        if self.__seat_recognizer is None:
+            return None
+        return self.__seat_recognizer.scale_stats.summary()
+
+    async def prepare(self, ttl: float = DEFAULT_PREPARE_TTL, desk_id: str | None = None):
+        """
+        Warms up the pipeline before the robot arrives: connects the input stream, loads the models,
+        runs a first gesture inference and starts collecting seat evidence.
+        The next make_decision() picks up the warm pipeline. If no decision is requested within `ttl`
+        seconds, the preparation expires and the input stream is stopped again.
+
+        Args:
+            ttl (float, optional): Seconds until an unused preparation expires. Defaults to DEFAULT_PREPARE_TTL.
+            desk_id (str | None, optional): The desk the robot is heading to, selects the seat prior. Defaults to None.
+        """
+        loop = asyncio.get_running_loop()
+        if self.__decision_running:
+            return
+        if self.__preparing is not None:
+            # a cold preparation is still loading the models: extend it once it is armed
+            await asyncio.wait([self.__preparing])
+        if self.__prepared:
+            # already warm, only push back the expiry
+            if self.__prepare_expiry is not None:
+                self.__prepare_expiry.cancel()
+                self.__prepare_expiry = loop.call_later(ttl, self.__expire_preparation)
+            return
+        if self.__decision_running:
+            return
+
+        self.__prepared = True
+        preparing = self.__preparing = loop.create_future()
+        try:
+            if not self.is_preloaded():
+                await asyncio.to_thread(self.preload)
+        except BaseException:
+            self.__prepared = False
+            raise
+        finally:
+            self.__preparing = None
+            preparing.set_result(None)
+        if self.__decision_running or not self.__prepared:
+            return
+
+        self.input_stream.start()
+        seat_recognizer = self.__seat_recognizer
+        seat_recognizer.reset()
+        seat_recognizer.set_desk(desk_id, self.desk_priors)
+        self.__prepared_desk_id = desk_id
+        self.__prepared_cancel = CancellationToken()
+        self.__prepared_seat_task = asyncio.create_task(seat_recognizer.start(self.__prepared_cancel), name="seat")
+        self.__warm_up_task = asyncio.create_task(self.__warm_up())
+        self.__prepare_expiry = loop.call_later(ttl, self.__expire_preparation)
+        log.info("prepare.armed", "pipeline armed", ttl=ttl, desk_id=desk_id)
+
+    async def __warm_up(self):
+        """Runs the first (slow) gesture inference as soon as the first frame arrives."""
+        while True:
+            frame = self.input_stream.capture_frame(square_crop=True, transform=True)
+            if frame is not None:
+                # seconds of MediaPipe start-up, off the loop; the copy outlives the frame's pooled buffer
+                await asyncio.to_thread(self.__gesture_recognizer.warm_up, frame.copy())
+                return
+            await asyncio.sleep(0.02)
+
+    def __take_preparation(self) -> tuple[asyncio.Task | None, CancellationToken | None]:
+        """Disarms the current preparation and hands over its seat recognition task and that task's token."""
+        seat_task, cancel = self.__prepared_seat_task, self.__prepared_cancel
+        if self.__prepare_expiry is not None:
+            self.__prepare_expiry.cancel()
+        if self.__warm_up_task is not None and not self.__warm_up_task.done():
+            self.__warm_up_task.cancel()
+        self.__prepared = False
+        self.__prepared_seat_task = None
+        self.__prepared_cancel = None
+        self.__prepared_desk_id = None
+        self.__warm_up_task = None
+        self.__prepare_expiry = None
+        return seat_task, cancel
+
+    def __expire_preparation(self):
+        """Called when a preparation was not used within its ttl."""
+        seat_task, cancel = self.__take_preparation()
+        if seat_task is not None:
+            cancel.cancel()
+            seat_task.cancel()
+        if not self.__decision_running:
+            self.input_stream.stop()
+        log.info("prepare.expired", "preparation expired")
+
+    def is_prepared(self) -> bool:
+        """Whether a warm pipeline from prepare() is waiting for the next decision."""
+        return self.__prepared_seat_task is not None
+
+    async def make_decision(
+        self,
+        desk_id: str | None = None,
+        progress: Callable[[str, dict], None] | None = None,
+    ) -> Decision:
         """
         Makes a decision bpased on the live feed.
 
+        Args:
+            desk_id (str | None, optional): Id of the desk in front of the robot, selects the seat prior. Defaults to None.
+            progress (Callable[[str, dict], None] | None, optional): Called with ("seat", {...}) and ("gesture", {...})
+                whenever the intermediate state changes, and with ("latency", {...}) once decided. Defaults to None.
+
         Returns:
             Decision.ABORT if the decision is to abort the action,
             Decision.CARRY_OUT_ACTION if the decision is to carry out the action,
-            Decision.TIMEOUT if no other decision was taken within the timeout.
+            Decision.TIMEOUT if no other decision was taken within the timeout,
+            Decision.CANCELLED if the decision-making task was cancelled.
         """
 
+        self.__decision_running = True
+        # a warm pipeline from prepare() keeps its stream and seat evidence
+        prepared_desk_id = self.__prepared_desk_id
+        prepared_seat_task, prepared_cancel = self.__take_preparation()
+        # stop signal of this session's recognizer loops; the recognizers are shared, so stopping them through
+        # the recognizer would also end the loops of other sessions
+        cancel = CancellationToken()
+        if prepared_cancel is not None:
+            cancel.add_callback(prepared_cancel.cancel)
+
+        # loading the models blocks for seconds on a cold start, keep the loop responsive
+        if not self.is_preloaded():
+            try:
+                await asyncio.to_thread(self.preload)
+            except BaseException:
+                self.__decision_running = False
+                raise
+        gesture_recognizer = self.__gesture_recognizer
+        seat_recognizer = self.__seat_recognizer
+
         async def gesture_recognition_task():
             """A task to run the gesture recognition in the background."""
-            return await self.__gesture_recognizer.start()
+            return await gesture_recognizer.start(cancel)
 
         async def seat_recognition_task():
             """A task to run the seat recognition in the background."""
             # Placeholder for seat recognition logic
-            return await self.__seat_recognizer.start()
+            return await seat_recognizer.start(cancel)
 
         async def face_recognition_task():
             """A task to run the face recognition in the background."""
@@ -73,20 +362,55 @@ class DecisionManager:
             await asyncio.sleep(timeout)
             return None
 
-        self.input_stream.start()
+        if prepared_seat_task is None:
+            self.input_stream.start()
+            seat_recognizer.reset()
+            seat_recognizer.set_desk(desk_id, self.desk_priors)
+            seat_task = asyncio.create_task(seat_recognition_task(), name="seat")
+        else:
+            log.info("decision.prepared", "starting with a prepared pipeline", desk_id=desk_id)
+            seat_task = prepared_seat_task
+            if desk_id != prepared_desk_id:
+                # prepared for another desk, its seat evidence does not apply
+                seat_recognizer.reset()
+                seat_recognizer.set_desk(desk_id, self.desk_priors)
+
+        recorder = self.input_stream.recorder
+        if recorder is not None:
+            # keep the recognizer outputs next to the raw frames for the flight recording
+            report = progress
+
+            def progress(event_type: str, data: dict):
+                recorder.annotate(event_type, data)
+                if report is not None:
+                    report(event_type, data)
+
+        tier_listener = None
+        if progress is not None:
+            seat_recognizer.listener = lambda data: progress("seat", data)
+            gesture_recognizer.listener = lambda data: progress("gesture", data)
+            if self.overload is not None:
+                progress("load", {"tier": self.overload.tier.name})
+                tier_listener = lambda tier: progress("load", {"tier": tier.name})
+                self.overload.add_listener(tier_listener)
+
+        if self.governor is not None:
+            # fewer threads per backend while decisions run concurrently
+            self.governor.session_started()
 
         tasks = {
-            asyncio.create_task(gesture_recognition_task()): "gesture",
-            asyncio.create_task(seat_recognition_task()): "seat",
-            asyncio.create_task(face_recognition_task()): "face",
-            asyncio.create_task(timeout_task(self.timeout)): "timeout",
+            asyncio.create_task(gesture_recognition_task(), name="gesture"): "gesture",
+            seat_task: "seat",
+            asyncio.create_task(face_recognition_task(), name="face"): "face",
+            asyncio.create_task(timeout_task(self.timeout), name="timeout"): "timeout",
         }
 
         try:
             while tasks:
-                done, pending = await asyncio.wait(
-                    tasks, return_when=asyncio.FIRST_COMPLETED
-                )
+                with tracer.span("decision.wait", pending=len(tasks)):
+                    done, pending = await asyncio.wait(
+                        tasks, return_when=asyncio.FIRST_COMPLETED
+                    )
 
                 decision = None
 
@@ -94,38 +418,36 @@ class DecisionManager:
                     result = task.result()
                     task_name = tasks[task]
                     if task_name != "seat":
-                        print(f"Task {task_name} completed with result: {result}")
+                        log.info("decision.task_done", f"Task {task_name} completed", task=task_name, result=result)
 
                     if task_name == "gesture":
-                        if any(gesture in result for gesture in GESTURES_POSITIVE):
-                            decision = Decision.CARRY_OUT_ACTION
-                            break
-                        if any(gesture in result for gesture in GESTURES_NEGATIVE):
-                            decision = Decision.USER_ABORT
+                        decision = gesture_decision(result)
+                        if decision is not None:
                             break
 
                     elif task_name == "seat":
                         #this should never trigger
-                        print(result)
+                        log.warning("decision.task_done", "seat task completed", result=result)
                     elif task_name == "face":
                         pass
 
                     elif task_name == "timeout":
-                        seat_status = self.__seat_recognizer.output()
-                        print("Seat Status:", seat_status )
-                        if seat_status == SeatStatus.SEAT_EMPTY or seat_status == SeatStatus.NO_CHAIRS_NO_PEOPLE:
-                            decision = Decision.TIMEOUT_NO_USER_PRESENT
-                        elif seat_status == SeatStatus.SEAT_OCCUPIED:
-                            decision = Decision.TIMEOUT_USER_PRESENT
-                        else:
-                            decision = Decision.TIMEOUT
+                        seat_status = seat_recognizer.output()
+                        log.info("decision.seat_status", "Seat Status", status=seat_status)
+                        decision = timeout_decision(seat_status)
                         break
 
                     # Remove the completed task from the dictionary
                     del tasks[task]
 
                 if decision is not None:
-                    print(f"Decision made: {decision}")
+                    # gesture decisions rest on the frame the gesture was seen in, timeouts on the seat evidence
+                    evidence = gesture_recognizer if task_name == "gesture" else seat_recognizer
+                    latency = self.__frame_latency(evidence.last_frame_time, gesture_recognizer, seat_recognizer)
+                    log.info("decision.made", "Decision made", decision=decision, seq=self.input_stream.frame_seq, **latency)
+                    tracer.instant("decision", decision=str(decision), seq=self.input_stream.frame_seq, **latency)
+                    if progress is not None:
+                        progress("latency", latency)
 
                     # Cancel pending tasks
                     for task in pending:
@@ -134,12 +456,46 @@ class DecisionManager:
                     return decision
 
         except asyncio.CancelledError as e:
-            print(f"Decision-making process was cancelled: {e}")
+            log.info("decision.cancelled", "Decision-making process was cancelled", reason=e)
+            return Decision.CANCELLED
         finally:
+            # stop every recognizer loop of this session right away to free the CPU: the token drops the session's
+            # work queued in the worker processes, the task cancellation interrupts the awaits in progress
+            cancel.cancel()
+            undone = [task for task in tasks if not task.done()]
+            for task in undone:
+                task.cancel()
+            if undone:
+                _, still_running = await asyncio.wait(undone, timeout=STOP_TIMEOUT)
+                if still_running:
+                    log.warning("decision.stop_slow", "recognizer task(s) still running after stop", tasks=len(still_running))
+            seat_recognizer.listener = None
+            gesture_recognizer.listener = None
+            if tier_listener is not None:
+                self.overload.remove_listener(tier_listener)
+            if self.governor is not None:
+                self.governor.session_finished()
             self.input_stream.stop()
+            self.__decision_running = False
+            if self.desk_priors is not None and desk_id is not None:
+                try:
+                    await asyncio.to_thread(self.desk_priors.save)
+                except OSError as exc:
+                    # the decision is made and must still be reported; the priors are saved again next time
+                    log.error("desk_priors.save_failed", "could not save desk priors", error=exc)
 
         return Decision.ERROR
 
+    @staticmethod
+    def __frame_latency(
+        frame_time: float | None, gesture_recognizer: GestureRecognizer, seat_recognizer: SeatRecognizer
+    ) -> dict:
+        """Camera-to-decision latency of the frame a decision rests on, and the frames rejected as too old."""
+        return {
+            "frame_to_decision_ms": None if frame_time is None else round((time.time() - frame_time) * 1000, 1),
+            "stale_frames": {"gesture": gesture_recognizer.stale_frames, "seat": seat_recognizer.stale_frames},
+        }
+
     def __get_timeout(self) -> int:
         """Get the timeout for the decision-making process."""
         return self.__timeout
@@ -1,10 +1,26 @@
 import asyncio
+import time
 import numpy as np
-import face_recognition
-from typing import Optional
+from typing import Callable, Optional
 from robocof_mood.input_stream.input_stream import InputStream
+from robocof_mood.input_stream.change_detector import ChangeDetector
+from robocof_mood.lazy_import import lazy_import
+from robocof_mood.perception.unified_detector import PerceptionResult
+from robocof_mood.tracing import tracer, log
+from robocof_mood.resources.overload_controller import OverloadController
+from robocof_mood.sessions.cancellation import CancellationToken
 import cv2
 
+# dlib / face_recognition take seconds to import, only load them when first used
+face_recognition = lazy_import("face_recognition")
+# maximum face distance that counts as a match (face_recognition's default)
+FACE_TOLERANCE = 0.6
+
+# Scene-change gate: faces only need to be re-encoded when the scene changed noticeably
+GATE_MEAN_THRESHOLD = 6.0
+GATE_CELL_THRESHOLD = 30.0
+GATE_MAX_SKIP_SECONDS = 2.0
+
 
 class FaceRecognizer:
     def __init__(
@@ -13,6 +29,11 @@ class FaceRecognizer:
             face_names=None,
             known_face_encodings=None,
             debug_mode: bool = False,
+            motion_gating: bool = True,
+            perception_source: Callable[[], Optional[PerceptionResult]] | None = None,
+            overload: OverloadController | None = None,
+            max_frame_age: float | None = None,
+            tolerance: float = FACE_TOLERANCE,
     ):
         """Constructor
 
@@ -20,6 +41,12 @@ class FaceRecognizer:
             gestures (list[Gesture]): List of gestures to recognize. Will stop active recognition if one of these gestures is detected.
             input_stream (InputStream): The input stream to capture frames from.
             debug_mode (bool, optional): If True, will not return any gesture recognized and will only print debug information. Defaults to False.
+            motion_gating (bool, optional): If True, recognize_from_stream() reuses the last result for unchanged frames. Defaults to True.
+            perception_source (Callable | None, optional): Returns the latest unified detector result; faces are then only
+                searched in the head region of detected persons. Defaults to None.
+            overload (OverloadController | None, optional): Face recognition pauses in degraded quality tiers. Defaults to None.
+            max_frame_age (float | None, optional): Frames older than this (seconds since capture) are rejected. Defaults to None (accept all).
+            tolerance (float, optional): Maximum face distance that counts as a match; lower is stricter. Defaults to FACE_TOLERANCE.
         """
 
         if known_face_encodings is None:
@@ -30,6 +57,17 @@ class FaceRecognizer:
         self.__debug_mode = debug_mode
         self.__known_face_encodings = known_face_encodings
         self.__known_face_names = face_names
+        self.change_detector = ChangeDetector(
+            GATE_MEAN_THRESHOLD, GATE_CELL_THRESHOLD, grid=16, max_skip_seconds=GATE_MAX_SKIP_SECONDS
+        ) if motion_gating else None
+        self.__last_recognized: Optional[list[str]] = None
+        self.__perception_source = perception_source
+        self.overload = overload
+        self.max_frame_age = max_frame_age
+        self.stale_frames = 0
+        self.tolerance = tolerance
+        # stop signal of the running recognition loop, see stop()
+        self.__cancel = CancellationToken()
 
     def add_face_image(self, name: str, image_path: str):
         """Adds a new face to the recognizer from an image file.
@@ -91,27 +129,61 @@ class FaceRecognizer:
         """
         return self.__known_face_encodings
 
-    def recognize(self, image: np.ndarray) -> list[str]:
+    def recognize(self, image: np.ndarray, rgb: bool = False, regions: Optional[list] = None) -> list[str]:
         """
         Recognizes faces in the given image.
 
         Args:
             image (np.ndarray): The image to recognize faces in.
+            rgb (bool, optional): True if `image` is already in RGB order. Defaults to False.
+            regions (Optional[list], optional): Only search faces in these (x0, y0, x1, y1) regions instead of the
+                whole image. Defaults to None.
 
         Returns:
             list[str]: The names of the recognized faces.
         """
+        return self.match(self.encode(image, rgb, regions))
+
+    def encode(self, image: np.ndarray, rgb: bool = False, regions: Optional[list] = None) -> list[np.ndarray]:
+        """
+        Finds the faces in the given image and returns their encodings, see recognize().
+
+        Returns:
+            list[np.ndarray]: One encoding per face found.
+        """
         # Convert the image from BGR color (which OpenCV uses) to RGB color (which face_recognition uses)
-        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        rgb_image = image if rgb else cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
 
         # Find all the faces and face encodings in the current frame of video
-        face_locations = face_recognition.face_locations(rgb_image)
-        face_encodings = face_recognition.face_encodings(rgb_image, face_locations)
+        if regions is None:
+            face_locations = face_recognition.face_locations(rgb_image)
+        else:
+            face_locations = []
+            for x0, y0, x1, y1 in regions:
+                crop = np.ascontiguousarray(rgb_image[y0:y1, x0:x1])
+                face_locations.extend(
+                    (top + y0, right + x0, bottom + y0, left + x0)
+                    for top, right, bottom, left in face_recognition.face_locations(crop)
+                )
+        return face_recognition.face_encodings(rgb_image, face_locations)
+
+    def match(self, face_encodings: list[np.ndarray], tolerance: Optional[float] = None) -> list[str]:
+        """
+        Names the faces of the given encodings, "Unknown" for faces that match no known face.
+
+        Args:
+            face_encodings (list[np.ndarray]): Encodings as returned by encode().
+            tolerance (Optional[float], optional): Overrides the recognizer's tolerance. Defaults to None.
 
+        Returns:
+            list[str]: The names of the faces.
+        """
+        if tolerance is None:
+            tolerance = self.tolerance
         recognized_faces = []
         for face_encoding in face_encodings:
             # See if the face is a match for the known face(s)
-            matches = face_recognition.compare_faces(self.__known_face_encodings, face_encoding)
+            matches = face_recognition.compare_faces(self.__known_face_encodings, face_encoding, tolerance)
             name = "Unknown"
 
             # Or instead, use the known face with the smallest distance to the new face
@@ -123,18 +195,21 @@ class FaceRecognizer:
 
         return recognized_faces
 
-    async def recognize_async(self, image: np.ndarray) -> list[str]:
+    async def recognize_async(self, image: np.ndarray, rgb: bool = False, regions: Optional[list] = None) -> list[str]:
         """
         Asynchronously recognizes faces in the given image.
 
         Args:
             image (np.ndarray): The image to recognize faces in.
+            rgb (bool, optional): True if `image` is already in RGB order. Defaults to False.
+            regions (Optional[list], optional): Only search faces in these regions. Defaults to None.
 
         Returns:
             list[str]: The names of the recognized faces.
         """
         loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, self.recognize, image)
+        # a job still queued in the executor when the loop is stopped is skipped (returns None)
+        return await loop.run_in_executor(None, self.__cancel.guard(self.recognize, image, rgb, regions))
 
     async def recognize_from_stream(self) -> Optional[list[str]]:
         """
@@ -142,14 +217,46 @@ class FaceRecognizer:
         Returns:
             Optional[list[str]]: The names of the recognized faces or None if no faces are recognized.
         """
-        frame = await self.__input_stream.get_frame()
+        if self.overload is not None and not self.overload.tier.face_enabled:
+            # paused under load, the last result is the best we have
+            return self.__last_recognized
+
+        regions = None
+        if self.__perception_source is not None:
+            perception = self.__perception_source()
+            if perception is not None:
+                regions = perception.face_regions()
+                if not regions:
+                    return []  # nobody in view, no face to recognize
+
+        frame = self.__input_stream.capture_frame(rgb=True)
         if frame is None:
             return None
+        age = self.__input_stream.captured_age()
+        if self.max_frame_age is not None and age is not None and age > self.max_frame_age:
+            # the stream stalled, nobody is known to be in front of the camera now
+            self.stale_frames += 1
+            return None
 
-        recognized_faces = await self.recognize_async(frame)
+        if (
+            self.change_detector is not None
+            and not self.change_detector.needs_inference(frame)
+            and self.__last_recognized is not None
+        ):
+            return self.__last_recognized
+
+        # the executor job outlives this frame's turn in the buffer pool, hand it a private copy
+        t0 = time.perf_counter()
+        with tracer.span("face.infer", seq=self.__input_stream.frame_seq, regions=0 if regions is None else len(regions)):
+            recognized_faces = await self.recognize_async(frame.copy(), rgb=True, regions=regions)
+        if recognized_faces is None:
+            return None  # stopped while queued
+        if self.overload is not None:
+            self.overload.observe("face", time.perf_counter() - t0)
+        self.__last_recognized = recognized_faces
 
         if self.__debug_mode:
-            print(f"[Face Recognizer]: Recognized faces: {recognized_faces}")
+            log.debug("face.recognized", "Recognized faces", faces=recognized_faces, seq=self.__input_stream.frame_seq)
 
         return recognized_faces
 
@@ -158,13 +265,15 @@ class FaceRecognizer:
         Asynchronously recognizes faces from the input stream in a loop.
         This method will continuously capture frames from the input stream and recognize faces in each frame.
         """
-        while True:
-            recognized_faces = await self.recognize_from_stream()
-            if recognized_faces is not None:
-                if self.__debug_mode:
-                    print(f"[Face Recognizer]: Recognized faces: {recognized_faces}")
+        token = self.__cancel = CancellationToken()
+        while not token.cancelled:
+            await self.recognize_from_stream()
             await asyncio.sleep(0.1)
 
+    def stop(self):
+        """Ends recognize_from_stream_loop() before its next frame and skips recognitions still queued in the executor."""
+        self.__cancel.cancel()
+
     def start_recognition_loop(self):
         """
         Starts the recognition loop.
@@ -1,13 +1,49 @@
+from __future__ import annotations
 import asyncio
-import mediapipe as mp
-from mediapipe.tasks import python
-from mediapipe.tasks.python import vision
+import threading
+import time
 from enum import Enum
-from typing import Optional
+from typing import Callable, Optional
 from robocof_mood.input_stream.input_stream import InputStream
+from robocof_mood.input_stream.change_detector import ChangeDetector
+from robocof_mood.lazy_import import lazy_import
+from robocof_mood.workers.recognizer_worker import RecognizerWorker, WorkerCrashedError
+from robocof_mood.perception.unified_detector import PerceptionResult, union_region
+from robocof_mood.tracing import tracer, log
+from robocof_mood.resources.overload_controller import OverloadController
+from robocof_mood.sessions.cancellation import CancellationToken
+
+# mediapipe is only imported once a GestureRecognizer is created
+mp = lazy_import("mediapipe")
+python = lazy_import("mediapipe.tasks.python")
+vision = lazy_import("mediapipe.tasks.python.vision")
 
 
 MODEL_PATH = "models/gesture_recognizer.task"
+# MediaPipe hand detection / presence / tracking confidence
+MIN_CONFIDENCE = 0.2
+# gestures with a lower category score are ignored
+MIN_GESTURE_SCORE = 0.0
+# unified detector results older than this (seconds) do not restrict where gestures are searched
+MAX_PERCEPTION_AGE = 0.5
+# contents of MODEL_PATH, read once per process (pre-forked workers inherit it), see load_model_asset()
+_model_asset: bytes | None = None
+
+
+def load_model_asset() -> bytes:
+    """Reads the MediaPipe task file on first use, later calls return the same bytes."""
+    global _model_asset
+    if _model_asset is None:
+        with open(MODEL_PATH, "rb") as f:
+            _model_asset = f.read()
+    return _model_asset
+
+# Scene-change gate: a finer grid and low per-cell threshold so that a moving hand
+# always triggers inference, and a short max skip so a held gesture is re-checked quickly
+GATE_MEAN_THRESHOLD = 3.0
+GATE_CELL_THRESHOLD = 12.0
+GATE_GRID = 32
+GATE_MAX_SKIP_SECONDS = 0.5
 
 
 class Gesture(Enum):
@@ -27,6 +63,13 @@ class GestureRecognizer:
         gestures: list[Gesture],
         input_stream: InputStream,
         debug_mode: bool = False,
+        motion_gating: bool = True,
+        worker: RecognizerWorker | None = None,
+        perception_source: Callable[[], Optional[PerceptionResult]] | None = None,
+        overload: OverloadController | None = None,
+        max_frame_age: float | None = None,
+        min_confidence: float = MIN_CONFIDENCE,
+        min_score: float = MIN_GESTURE_SCORE,
     ):
         """Constructor
 
@@ -34,40 +77,140 @@ class GestureRecognizer:
             gestures (list[Gesture]): List of gestures to recognize. Will stop active recognition if one of these gestures is detected.
             input_stream (InputStream): The input stream to capture frames from.
             debug_mode (bool, optional): If True, will not return any gesture recognized and will only print debug information. Defaults to False.
+            motion_gating (bool, optional): If True, frames without (hand) motion since the last inference are skipped. Defaults to True.
+            worker (RecognizerWorker | None, optional): Run inference in this worker process instead of in-process. Defaults to None.
+            perception_source (Callable | None, optional): Returns the latest unified detector result. If given, inference
+                only runs on the region around the hands of the detected persons; without a recent detection of a
+                person it runs on the full frame. Defaults to None.
+            overload (OverloadController | None, optional): Lowers the inference rate in the most degraded quality tier. Defaults to None.
+            max_frame_age (float | None, optional): Frames older than this (seconds since capture) are rejected. Defaults to None (accept all).
+            min_confidence (float, optional): Hand detection, presence and tracking confidence of the MediaPipe task. Defaults to MIN_CONFIDENCE.
+            min_score (float, optional): Gestures recognized with a lower score are ignored. Defaults to MIN_GESTURE_SCORE.
         """
         self.__gestures = gestures
-        base_options = python.BaseOptions(model_asset_path=MODEL_PATH)
+        self.__worker = worker
+        self.__perception_source = perception_source
+        self.overload = overload
+        self.max_frame_age = max_frame_age
+        self.stale_frames = 0
+        self.min_score = min_score
+        # capture time of the last inferred frame; once start() returns, the frame the gesture was seen in
+        self.last_frame_time: float | None = None
+        # stop signal of a start() loop started without a token, see stop()
+        self.__cancel: CancellationToken | None = None
+        # called with {"candidates": [...]} whenever gestures are seen, e.g. for live progress
+        self.listener: Callable[[dict], None] | None = None
+        self.last_candidates: list[tuple[str, float]] = []
+        self.__input_stream = input_stream
+        self.__debug_mode = debug_mode
+        self.change_detector = ChangeDetector(
+            GATE_MEAN_THRESHOLD, GATE_CELL_THRESHOLD, grid=GATE_GRID, max_skip_seconds=GATE_MAX_SKIP_SECONDS
+        ) if motion_gating else None
+        self.__recognizer = None
+        # MediaPipe graphs are not reentrant: warm_up() runs in a thread while start() may already infer
+        self.__recognizer_lock = threading.Lock()
+        if worker is not None:
+            # the worker process loads its own MediaPipe task
+            return
+
+        # the task graph starts threads, so it is created per process; only the model bytes are shared
+        base_options = python.BaseOptions(model_asset_buffer=load_model_asset())
         options = vision.GestureRecognizerOptions(
             base_options=base_options,
             num_hands=2,
-            min_hand_detection_confidence=0.2,
-            min_hand_presence_confidence=0.2,
-            min_tracking_confidence=0.2,
+            min_hand_detection_confidence=min_confidence,
+            min_hand_presence_confidence=min_confidence,
+            min_tracking_confidence=min_confidence,
         )
         self.__recognizer = vision.GestureRecognizer.create_from_options(options)
-        self.__input_stream = input_stream
-        self.__debug_mode = debug_mode
 
     async def start(
         self,
+        token: CancellationToken | None = None,
     ) -> list[Gesture]:
         """
         Starts the gesture recognition process. Returns the recognized gesture once a gesture from `gestures` is recognized.
 
+        Args:
+            token (CancellationToken | None, optional): Stop signal of the decision session this loop belongs to;
+                cancelling it ends the loop and drops its requests queued in the worker process, without touching
+                the loops of other sessions. Defaults to None (a token of its own, cancelled by stop()).
+
         Returns:
-            Gesture: The recognized gesture.
+            Gesture: The recognized gesture, or an empty list if the token was cancelled first.
         """
-        while True:
-            frame = self.__input_stream.capture_frame(square_crop=True, transform=True)
+        if token is None:
+            token = self.__cancel = CancellationToken()
+        if self.change_detector is not None:
+            self.change_detector.reset()
+        self.stale_frames = 0
+        self.last_frame_time = None
+        while not token.cancelled:
+            region = None
+            if self.__perception_source is not None:
+                perception = self.__perception_source()
+                # without a fresh person detection the whole frame is searched: YOLO misses close-up hands and
+                # partly visible people, and a missed opt-in gesture costs more than a full-frame pass
+                if (
+                    perception is not None
+                    and perception.persons
+                    and time.monotonic() - perception.created <= MAX_PERCEPTION_AGE
+                ):
+                    region = union_region(perception.hand_regions())
+
+            if region is None:
+                frame = self.__input_stream.capture_frame(square_crop=True, transform=True)
+            else:
+                frame = self.__input_stream.capture_frame()
+                if frame is not None:
+                    x0, y0, x1, y1 = region
+                    frame = self.__input_stream.preprocessor.transform(frame[y0:y1, x0:x1])
             if frame is None:
-                print("[Gesture Recognizer]: Failed to capture image.")
+                log.warning("capture.failed", "Failed to capture image", recognizer="gesture")
+                # wait for the stream instead of spinning on the event loop
+                await asyncio.sleep(0.01)
+                continue
+            frame_time = self.__input_stream.captured_time
+            age = self.__input_stream.captured_age()
+            if self.max_frame_age is not None and age is not None and age > self.max_frame_age:
+                # the stream stalled (reconnect, slow decode): do not count the same old frame again
+                self.stale_frames += 1
+                await asyncio.sleep(0.01)
+                continue
+
+            if self.change_detector is not None and not self.change_detector.needs_inference(frame):
+                # nothing moved since the last inference, which found no matching gesture
+                await asyncio.sleep(0.01)
                 continue
 
-            # Convert the frame to a MediaPipe Image object
-            mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=frame)
+            seq = self.__input_stream.frame_seq
+            t0 = time.perf_counter()
+            if self.__worker is not None:
+                try:
+                    with tracer.span("gesture.infer", pid=self.__worker.pid, seq=seq):
+                        gestures = await self.__worker.infer(frame, token=token)
+                except WorkerCrashedError:
+                    continue  # the worker restarts itself, try again with a fresh frame
+                if gestures is None or token.cancelled:
+                    continue
+            else:
+                with tracer.span("gesture.infer", seq=seq, region=region is not None):
+                    # Convert the frame to a MediaPipe Image object
+                    mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=frame)
 
-            # Recognize the gestures in the current frame
-            gestures = self.recognize(mp_image)
+                    # Recognize the gestures in the current frame
+                    gestures = self.recognize(mp_image)
+            if self.overload is not None:
+                self.overload.observe("gesture", time.perf_counter() - t0, on_loop=self.__worker is None)
+            self.last_frame_time = frame_time
+            log.debug("gesture.recognized", "Recognized gestures", gestures=gestures, seq=seq)
+
+            if gestures and self.listener is not None:
+                if self.__worker is not None:
+                    candidates = [{"gesture": g.name, "score": None} for g in gestures]
+                else:
+                    candidates = [{"gesture": name, "score": score} for name, score in self.last_candidates]
+                self.listener({"candidates": candidates})
 
             if gestures:
                 # filter the recognized gestures to check if any of them are in the list of gestures
@@ -78,8 +221,23 @@ class GestureRecognizer:
                     if not self.__debug_mode:
                         return recognized_gestures
 
-            # yield control to allow other tasks to run
-            await asyncio.sleep(0.01)
+            # yield control to allow other tasks to run (gesture is throttled only in the last quality tier)
+            interval = self.overload.tier.gesture_interval if self.overload is not None else 0.0
+            await asyncio.sleep(0.01 + interval)
+        return []
+
+    def warm_up(self, frame):
+        """
+        Runs one inference on the given frame and discards the result.
+        The first inference of a MediaPipe task is considerably slower than the following ones.
+
+        Args:
+            frame (np.ndarray): A frame as returned by InputStream.capture_frame(square_crop=True, transform=True).
+        """
+        if self.__recognizer is None:
+            return  # inference runs in a worker process, which warms up on its own
+        with self.__recognizer_lock:
+            self.__recognizer.recognize(mp.Image(image_format=mp.ImageFormat.SRGB, data=frame))
 
     def recognize(self, image: mp.Image) -> list[Gesture]:
         """
@@ -91,10 +249,9 @@ class GestureRecognizer:
         Returns:
             Gesture: The recognized gesture.
         """
-        result = self.__recognizer.recognize(image)
-        gestures = self.__parse_result(result)
-        print(f"[DEBUG] Recognized gestures: {gestures}")
-        return gestures
+        with self.__recognizer_lock:
+            result = self.__recognizer.recognize(image)
+        return self.__parse_result(result)
 
     def __parse_result(self, result) -> list[Gesture]:
         """Parses the result of the gesture recognition.
@@ -106,10 +263,16 @@ class GestureRecognizer:
             list[Gesture]: All gestures recognized.
         """
         gestures = result.gestures
+        self.last_candidates = [
+            (gesture.category_name, float(gesture.score))
+            for gesture_list in gestures
+            for gesture in gesture_list
+        ]
         ret = [
             self.__parse_gesture(gesture.category_name)
             for gesture_list in gestures
             for gesture in gesture_list
+            if gesture.score >= self.min_score
         ]
         return ret
 
@@ -132,9 +295,11 @@ class GestureRecognizer:
 
     def stop(self):
         """
-        Stops the gesture recognition process.
+        Stops a start() loop that was started without a token: it ends before its next frame and its
+        requests queued in the worker process are dropped. Sessions cancel their own token instead.
         """
-        pass
+        if self.__cancel is not None:
+            self.__cancel.cancel()
 
     def __get_gestures(self):
         return self.__gestures
@@ -1,5 +1,7 @@
 from __future__ import annotations
 from robocof_mood.input_stream.input_stream import InputStream
+from robocof_mood.input_stream.flight_recorder import FlightRecorder
+from robocof_mood.tracing import tracer, log
 
 import cv2
 import numpy as np
@@ -7,6 +9,10 @@ import requests, threading, time
 from collections import deque
 
 
+# imdecode flags for InputStream.decode_reduction; libjpeg scales during the IDCT, which is much cheaper
+_DECODE_FLAGS = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4}
+
+
 class MJPEGAPIInputStream(InputStream):
     """
     Reads a multipart/x-mixed-replace MJPEG stream in a background thread
@@ -14,6 +20,8 @@ class MJPEGAPIInputStream(InputStream):
     Designed for >30 fps, limited only by network + decode time.
     """
 
+    supports_decode_reduction = True
+
     def __init__(
         self,
         url: str,
@@ -23,6 +31,9 @@ class MJPEGAPIInputStream(InputStream):
         max_queue: int = 3,  # how many JPEGs to hold undecoded
         timeout: float = 5.0,
         headers: dict | None = None,
+        recorder: FlightRecorder | None = None,  # keeps the raw JPEGs of the last seconds
+        camera_timestamps: bool = False,  # trust an X-Timestamp part header (epoch seconds, needs synced clocks)
+        debug_window: bool = False,  # show the captured frames in an OpenCV window
     ):
         self.url = url
         self.boundary = boundary + b"\r\n"  # match server delimiter
@@ -30,11 +41,15 @@ class MJPEGAPIInputStream(InputStream):
         self.max_queue = max_queue
         self.timeout = timeout
         self.headers = headers or {}
+        self.recorder = recorder
+        self.camera_timestamps = camera_timestamps
+        self.debug_window = debug_window
 
         self._session: requests.Session | None = None
         self._worker: threading.Thread | None = None
         self._stop_flag = threading.Event()
         self._latest_frame: np.ndarray | None = None
+        self._latest_reduction = 1
         self._frame_lock = threading.Lock()
         self._jpeg_q = deque(maxlen=max_queue)
         
@@ -44,41 +59,44 @@ class MJPEGAPIInputStream(InputStream):
     # public API required by InputStream
     # ------------------------------------------------------------------ #
     def start(self):
+        if self._worker is not None and self._worker.is_alive():
+            if not self._stop_flag.is_set():
+                return  # already reading
+            self._worker.join()  # stop() timed out: let the old reader finish first
         # reset internal state
         self._stop_flag.clear()          
         self._jpeg_q.clear()             
         with self._frame_lock:
             self._latest_frame = None
+            self.frame_time = None
             
         self._session = requests.Session()
         self._worker = threading.Thread(target=self._reader, daemon=True)
         self._worker.start()
 
     def capture_frame(
-        self, square_crop: bool = False, transform: bool = False
+        self, square_crop: bool = False, transform: bool = False, rgb: bool = False
     ) -> np.ndarray | None:
         """
-        Returns a *copy* of the most recent frame so the caller can mutate it
-        without racing the reader thread. Returns None until first frame lands.
+        Returns the most recent frame, cropped / transformed / converted straight into a
+        pooled buffer, so the caller can mutate it without racing the reader thread.
+        Returns None until first frame lands.
         """
         with self._frame_lock:
             if self._latest_frame is None:
                 return None
+            self.captured_time = self.frame_time
+            self.captured_reduction = self._latest_reduction
 
-            if square_crop:
-                frame = self.center_crop_square(self._latest_frame.copy())
-            else:
-                frame = self._latest_frame.copy()
-
-            if transform:
-                frame = self.transform_frame(frame)
+            with tracer.span("capture", seq=self.frame_seq, square_crop=square_crop, transform=transform, rgb=rgb):
+                frame = self.preprocessor.process(
+                    self._latest_frame, square_crop=square_crop, transform=transform, rgb=rgb
+                )
+            latest = self._latest_frame
 
-            if not transform:
-                # 🖼️ Show the frame for debugging
-                cv2.imshow("Debug Frame", frame)
-                if cv2.waitKey(1) & 0xFF == ord("q"):
-                    exit()  # Press 'q' to exit the window
-            return frame
+        if not transform:
+            self.show_debug_frame(latest if rgb else frame)
+        return frame
 
     def stop(self):
         self._stop_flag.set()
@@ -136,22 +154,46 @@ class MJPEGAPIInputStream(InputStream):
                         if header_end == -1:
                             continue  # malformed
                         jpeg_bytes = part[header_end + 4 :]  # skip the empty line
+                        received = time.time()
+                        taken = self._camera_time(part[:header_end]) if self.camera_timestamps else None
+                        # a camera clock ahead of ours must not make frames look younger than they are
+                        frame_time = received if taken is None else min(taken, received)
 
-                        self._jpeg_q.append(jpeg_bytes)
+                        self._jpeg_q.append((jpeg_bytes, frame_time))
+                        if self.recorder is not None:
+                            self.recorder.record_frame(jpeg_bytes)
 
                         # Keep only the *last* JPEG if decoding lags behind
                         while self._jpeg_q:
-                            jpg = self._jpeg_q.pop()
-                            img = cv2.imdecode(
-                                np.frombuffer(jpg, dtype=np.uint8), cv2.IMREAD_COLOR
-                            )
+                            jpg, frame_time = self._jpeg_q.pop()
+                            # the tier may change meanwhile, the frame keeps the reduction it was decoded at
+                            reduction = self.decode_reduction
+                            with tracer.span("decode", seq=self.frame_seq + 1, bytes=len(jpg)):
+                                img = cv2.imdecode(
+                                    np.frombuffer(jpg, dtype=np.uint8), _DECODE_FLAGS[reduction]
+                                )
                             if img is not None:
                                 with self._frame_lock:
                                     self._latest_frame = img
+                                    self._latest_reduction = reduction
+                                    self.frame_seq += 1
+                                    self.frame_time = frame_time
                                 break  # decoded newest; drop older ones
 
         except Exception as exc:
-            print(f"[MJPEG reader] stopped because: {exc}")
+            log.error("stream.stopped", "MJPEG reader stopped", error=exc)
+
+    @staticmethod
+    def _camera_time(headers: bytes) -> float | None:
+        """The X-Timestamp header of an MJPEG part, None if missing or malformed."""
+        for line in headers.split(b"\r\n"):
+            name, _, value = line.partition(b":")
+            if name.strip().lower() == b"x-timestamp":
+                try:
+                    return float(value)
+                except ValueError:
+                    return None
+        return None
 
 
 def smoke_test():
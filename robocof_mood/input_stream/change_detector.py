@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import time
+
+import cv2
+import numpy as np
+
+
+class ChangeDetector:
+    """
+    Cheap scene-change gate in front of a recognizer.
+
+    Frames are reduced to a tiny luma thumbnail (`grid` x `grid` cells, area averaged) and compared
+    with the thumbnail of the last frame that was passed on to inference. A frame needs inference if
+    the mean change over all cells exceeds `mean_threshold` (global change, e.g. a person sitting down)
+    or any single cell changes by more than `cell_threshold` (local change, e.g. a hand moving).
+    Differences are in grey levels (0-255).
+    """
+
+    def __init__(
+        self,
+        mean_threshold: float,
+        cell_threshold: float,
+        grid: int = 16,
+        max_skip_seconds: float = 2.0,
+    ):
+        """Constructor
+
+        Args:
+            mean_threshold (float): Mean absolute difference per cell above which a frame counts as changed.
+            cell_threshold (float): Absolute difference of a single cell above which a frame counts as changed.
+            grid (int, optional): Side length of the thumbnail in cells. Defaults to 16.
+            max_skip_seconds (float, optional): Force inference after this many seconds without one. Defaults to 2.0.
+        """
+        self.mean_threshold = mean_threshold
+        self.cell_threshold = cell_threshold
+        self.grid = grid
+        self.max_skip_seconds = max_skip_seconds
+
+        self._reference: np.ndarray | None = None
+        self._reference_time = 0.0
+        self.inferred = 0
+        self.skipped = 0
+
+    def thumbnail(self, frame: np.ndarray) -> np.ndarray:
+        """Downscales a BGR or greyscale frame to a `grid` x `grid` int16 luma thumbnail."""
+        small = cv2.resize(frame, (self.grid, self.grid), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return small.astype(np.int16)
+
+    def needs_inference(self, frame: np.ndarray) -> bool:
+        """
+        Decides whether `frame` differs enough from the last inferred frame to run inference again.
+        If so, `frame` becomes the new reference.
+
+        Args:
+            frame (np.ndarray): The captured frame.
+
+        Returns:
+            bool: True if the recognizer should run on this frame, False if the last result can be reused.
+        """
+        thumb = self.thumbnail(frame)
+        now = time.monotonic()
+
+        changed = (
+            self._reference is None
+            or self._reference.shape != thumb.shape
+            or now - self._reference_time >= self.max_skip_seconds
+        )
+        if not changed:
+            diff = np.abs(thumb - self._reference)
+            changed = diff.mean() > self.mean_threshold or diff.max() > self.cell_threshold
+
+        if changed:
+            self._reference = thumb
+            self._reference_time = now
+            self.inferred += 1
+        else:
+            self.skipped += 1
+        return changed
+
+    def reset(self):
+        """Forget the reference frame so the next frame is always inferred."""
+        self._reference = None
+        self.inferred = 0
+        self.skipped = 0
+
+    def skip_ratio(self) -> float:
+        """Share of frames for which inference was skipped since the last reset."""
+        total = self.inferred + self.skipped
+        return self.skipped / total if total else 0.0
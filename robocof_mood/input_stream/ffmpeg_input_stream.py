@@ -0,0 +1,177 @@
+from __future__ import annotations
+from robocof_mood.input_stream.input_stream import InputStream
+from robocof_mood.tracing import tracer, log
+
+import os
+import cv2
+import numpy as np
+import threading, time
+
+
+# FFmpeg demuxer / decoder options for live sources: no input buffering, no B-frame reordering delay,
+# RTSP over TCP (no UDP packet loss on Wi-Fi, which would corrupt frames until the next keyframe)
+LOW_LATENCY_OPTIONS = "rtsp_transport;tcp|fflags;nobuffer|flags;low_delay|max_delay;500000|reorder_queue_size;0"
+RECONNECT_DELAY = 0.5
+MAX_RECONNECT_DELAY = 10.0
+
+
+class FFmpegInputStream(InputStream):
+    """
+    Reads an RTSP / H.264 stream (or anything else FFmpeg can open: rtsp://, http://...mp4, udp://, files)
+    in a background thread and always exposes the **latest decoded frame** via `capture_frame()`,
+    like MJPEGAPIInputStream but at a fraction of the bandwidth.
+
+    After a dropped connection the decoder is recreated: FFmpeg only outputs frames from the next keyframe
+    on, so no half-decoded (grey / smeared) frames reach the recognizers, and until then `capture_frame()`
+    returns None instead of the last frame before the drop.
+
+    Test locally by serving an H.264 file, e.g. `python -m http.server` next to sample.mp4 and
+    `FFmpegInputStream("http://localhost:8000/sample.mp4")`, or with an RTSP server (mediamtx) and
+    `ffmpeg -re -stream_loop -1 -i sample.mp4 -c copy -f rtsp rtsp://localhost:8554/cam`.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        *,
+        low_latency: bool = True,
+        open_timeout: float = 5.0,
+        read_timeout: float = 5.0,
+        pace: bool | None = None,
+    ):
+        """Constructor
+
+        Args:
+            url (str): Source URL or path.
+            low_latency (bool, optional): Use LOW_LATENCY_OPTIONS for the FFmpeg backend. Defaults to True.
+            open_timeout (float, optional): Seconds to wait for the connection. Defaults to 5.0.
+            read_timeout (float, optional): Seconds without a frame before reconnecting. Defaults to 5.0.
+            pace (bool | None, optional): Read at the source frame rate instead of as fast as possible. None paces
+                sources with a known length (files), which would otherwise be consumed in a burst. Defaults to None.
+        """
+        self.url = url
+        self.low_latency = low_latency
+        self.open_timeout = open_timeout
+        self.read_timeout = read_timeout
+        self.pace = pace
+
+        self._worker: threading.Thread | None = None
+        self._stop_flag = threading.Event()
+        self._latest_frame: np.ndarray | None = None
+        self._frame_lock = threading.Lock()
+        self.reconnects = 0
+
+    # ------------------------------------------------------------------ #
+    # public API required by InputStream
+    # ------------------------------------------------------------------ #
+    def start(self):
+        if self._worker is not None and self._worker.is_alive():
+            if not self._stop_flag.is_set():
+                return  # already reading
+            self._worker.join()  # stop() timed out: let the old reader finish first
+        self._stop_flag.clear()
+        with self._frame_lock:
+            self._latest_frame = None
+            self.frame_time = None
+        self._worker = threading.Thread(target=self._reader, daemon=True)
+        self._worker.start()
+
+    def capture_frame(
+        self, square_crop: bool = False, transform: bool = False, rgb: bool = False
+    ) -> np.ndarray | None:
+        """
+        Returns the most recent frame, cropped / transformed / converted into a pooled buffer.
+        Returns None until the first frame (after a reconnect: the first keyframe) is decoded.
+        """
+        with self._frame_lock:
+            if self._latest_frame is None:
+                return None
+            self.captured_time = self.frame_time
+            with tracer.span("capture", seq=self.frame_seq, square_crop=square_crop, transform=transform, rgb=rgb):
+                return self.preprocessor.process(
+                    self._latest_frame, square_crop=square_crop, transform=transform, rgb=rgb
+                )
+
+    def stop(self):
+        self._stop_flag.set()
+        if self._worker:
+            self._worker.join(timeout=3)
+
+    # ------------------------------------------------------------------ #
+    # internal reader
+    # ------------------------------------------------------------------ #
+    def _open(self) -> cv2.VideoCapture:
+        if self.low_latency:
+            # read by OpenCV's FFmpeg backend when the capture is opened
+            os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = LOW_LATENCY_OPTIONS
+        cap = cv2.VideoCapture(
+            self.url,
+            cv2.CAP_FFMPEG,
+            [
+                cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, int(self.open_timeout * 1000),
+                cv2.CAP_PROP_READ_TIMEOUT_MSEC, int(self.read_timeout * 1000),
+            ],
+        )
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
+
+    def _reader(self):
+        delay = RECONNECT_DELAY
+        while not self._stop_flag.is_set():
+            cap = self._open()
+            if not cap.isOpened():
+                log.warning("stream.open_failed", "FFmpeg reader could not open stream", url=self.url, retry_in=delay)
+                cap.release()
+                self._stop_flag.wait(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+                continue
+
+            pace = self.pace
+            if pace is None:
+                pace = cap.get(cv2.CAP_PROP_FRAME_COUNT) > 0
+            fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+            next_frame = time.monotonic()
+
+            try:
+                while not self._stop_flag.is_set():
+                    with tracer.span("decode", seq=self.frame_seq + 1):
+                        ok, img = cap.read()
+                    if not ok or img is None:
+                        break  # connection dropped, read timeout or end of file
+                    delay = RECONNECT_DELAY
+                    with self._frame_lock:
+                        self._latest_frame = img
+                        self.frame_seq += 1
+                        self.frame_time = time.time()
+                    if pace:
+                        next_frame += 1.0 / fps
+                        self._stop_flag.wait(max(0.0, next_frame - time.monotonic()))
+            finally:
+                cap.release()
+
+            if self._stop_flag.is_set():
+                break
+            # the frame before the drop is stale, and the new decoder only starts at the next keyframe
+            with self._frame_lock:
+                self._latest_frame = None
+            self.reconnects += 1
+            log.warning("stream.ended", "FFmpeg stream ended, reconnecting", url=self.url, retry_in=delay)
+            self._stop_flag.wait(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+
+def smoke_test(url: str = "rtsp://localhost:8554/cam"):
+    stream = FFmpegInputStream(url)
+    stream.start()
+    t0 = time.time()
+    last_seq = 0
+    while True:
+        frame = stream.capture_frame()
+        if frame is not None and stream.frame_seq != last_seq:
+            last_seq = stream.frame_seq
+            cv2.imshow("FFmpeg Feed", frame)
+        if cv2.waitKey(1) & 0xFF == ord("q"):
+            break
+    stream.stop()
+    cv2.destroyAllWindows()
+    print(f"Received {last_seq} frames in {time.time() - t0:.1f} s, {stream.reconnects} reconnects")
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import json
+import os
+import struct
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+
+DEFAULT_SECONDS = 10.0
+# ~10 s of 720p MJPEG at 30 fps is about 25 MB
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+DEFAULT_MAX_ANNOTATIONS = 4096
+
+# Container layout: MAGIC | jpeg 0 | jpeg 1 | ... | JSON index | index offset (u64 LE) | INDEX_MAGIC
+MAGIC = b"RFR1"
+INDEX_MAGIC = b"RFRi"
+_FOOTER = struct.Struct("<Q4s")
+FILE_EXTENSION = ".rfr"
+
+
+class FlightRecorder:
+    """
+    Ring buffer of the raw JPEG bytes of the last `seconds` of the camera stream, plus the recognizer
+    outputs seen in that time. Frames are kept exactly as received (no re-encoding) and memory is bounded
+    by both age and total size.
+
+    record_frame() and annotate() only append under a short lock, they never touch the disk; dump() copies
+    the references out and writes the container, so call it off the hot path (e.g. asyncio.to_thread).
+    """
+
+    def __init__(
+        self,
+        seconds: float = DEFAULT_SECONDS,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        max_annotations: int = DEFAULT_MAX_ANNOTATIONS,
+    ):
+        """Constructor
+
+        Args:
+            seconds (float, optional): How much of the stream to keep. Defaults to DEFAULT_SECONDS.
+            max_bytes (int, optional): Upper bound for the buffered JPEG bytes. Defaults to DEFAULT_MAX_BYTES.
+            max_annotations (int, optional): Upper bound for the buffered recognizer outputs. Defaults to DEFAULT_MAX_ANNOTATIONS.
+        """
+        self.seconds = seconds
+        self.max_bytes = max_bytes
+        self._frames: deque[tuple[int, float, bytes]] = deque()  # (seq, timestamp, jpeg)
+        self._annotations: deque[dict] = deque(maxlen=max_annotations)
+        self._bytes = 0
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def record_frame(self, jpeg: bytes, timestamp: float | None = None) -> int:
+        """Adds the JPEG bytes of one received frame and returns its sequence number."""
+        now = time.time() if timestamp is None else timestamp
+        with self._lock:
+            self._seq += 1
+            self._frames.append((self._seq, now, jpeg))
+            self._bytes += len(jpeg)
+            horizon = now - self.seconds
+            while self._frames and (self._frames[0][1] < horizon or self._bytes > self.max_bytes):
+                self._bytes -= len(self._frames.popleft()[2])
+            return self._seq
+
+    def annotate(self, source: str, data, timestamp: float | None = None):
+        """Attaches a recognizer output to the most recent frame."""
+        now = time.time() if timestamp is None else timestamp
+        with self._lock:
+            self._annotations.append({"time": now, "seq": self._seq, "source": source, "data": data})
+
+    def snapshot(self, since: float | None = None) -> tuple[list[tuple[int, float, bytes]], list[dict]]:
+        """Returns the buffered frames and annotations (newer than `since`, if given)."""
+        with self._lock:
+            frames = list(self._frames)
+            annotations = list(self._annotations)
+        if since is not None:
+            frames = [f for f in frames if f[1] >= since]
+            annotations = [a for a in annotations if a["time"] >= since]
+        return frames, annotations
+
+    def dump(self, path: str, since: float | None = None, meta: dict | None = None) -> str | None:
+        """
+        Writes the buffer to `path` as a flight recording (see FlightRecording).
+
+        Args:
+            path (str): Output file.
+            since (float | None, optional): Only keep frames and annotations from this time on. Defaults to None.
+            meta (dict | None, optional): JSON-serialisable session information. Defaults to None.
+
+        Returns:
+            str | None: `path`, or None if there was nothing to write.
+        """
+        frames, annotations = self.snapshot(since)
+        if not frames:
+            return None
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            index = []
+            offset = len(MAGIC)
+            for seq, timestamp, jpeg in frames:
+                f.write(jpeg)
+                index.append([offset, len(jpeg), timestamp, seq])
+                offset += len(jpeg)
+            header = {"version": 1, "meta": meta or {}, "frames": index, "annotations": annotations}
+            f.write(json.dumps(header, default=str).encode("utf-8"))
+            f.write(_FOOTER.pack(offset, INDEX_MAGIC))
+        os.replace(tmp_path, path)
+        return path
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+
+class FlightRecording:
+    """Read access to a file written by FlightRecorder.dump(); frames are read and decoded on demand."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a flight recording")
+            f.seek(-_FOOTER.size, os.SEEK_END)
+            end = f.tell()
+            index_offset, magic = _FOOTER.unpack(f.read(_FOOTER.size))
+            if magic != INDEX_MAGIC:
+                raise ValueError(f"{path} is truncated (no index)")
+            f.seek(index_offset)
+            header = json.loads(f.read(end - index_offset))
+        self.meta: dict = header["meta"]
+        self.annotations: list[dict] = header["annotations"]
+        self._index: list[list] = header["frames"]
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    @property
+    def timestamps(self) -> list[float]:
+        return [entry[2] for entry in self._index]
+
+    def jpeg(self, i: int) -> bytes:
+        """The raw JPEG bytes of frame `i`, as they came from the camera."""
+        offset, length, _, _ = self._index[i]
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def frame(self, i: int) -> np.ndarray | None:
+        """Frame `i` decoded to BGR."""
+        return cv2.imdecode(np.frombuffer(self.jpeg(i), dtype=np.uint8), cv2.IMREAD_COLOR)
+
+    def frames(self):
+        """Yields (timestamp, BGR frame) for every frame, in order."""
+        with open(self.path, "rb") as f:
+            for offset, length, timestamp, _ in self._index:
+                f.seek(offset)
+                img = cv2.imdecode(np.frombuffer(f.read(length), dtype=np.uint8), cv2.IMREAD_COLOR)
+                if img is not None:
+                    yield timestamp, img
+
+    def annotations_for(self, seq: int) -> list[dict]:
+        """Recognizer outputs attached to the frame with sequence number `seq`."""
+        return [a for a in self.annotations if a["seq"] == seq]
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import threading
+
+import cv2
+import numpy as np
+
+
+# contrast / brightness applied after histogram equalisation
+ALPHA = 1.2
+BETA = 20
+
+
+class BufferPool:
+    """
+    Preallocated frame buffers, keyed by purpose and shape.
+
+    Every key owns a small ring of `depth` buffers that are handed out in turn, so a returned frame
+    stays valid until `depth` further frames with the same key have been requested.
+    """
+
+    def __init__(self, depth: int = 3):
+        self.depth = depth
+        self._rings: dict[tuple, tuple[list[np.ndarray], list[int]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, kind: str, shape: tuple[int, ...], dtype=np.uint8) -> np.ndarray:
+        key = (kind, shape, np.dtype(dtype).str)
+        with self._lock:
+            ring = self._rings.get(key)
+            if ring is None:
+                ring = ([np.empty(shape, dtype=dtype) for _ in range(self.depth)], [0])
+                self._rings[key] = ring
+            buffers, cursor = ring
+            buf = buffers[cursor[0]]
+            cursor[0] = (cursor[0] + 1) % self.depth
+            return buf
+
+    def clear(self):
+        with self._lock:
+            self._rings.clear()
+
+    def nbytes(self) -> int:
+        """Total memory held by the pool in bytes."""
+        with self._lock:
+            return sum(b.nbytes for buffers, _ in self._rings.values() for b in buffers)
+
+
+class FramePreprocessor:
+    """
+    Allocation-free version of InputStream's crop / transform / colour conversion steps.
+
+    The source frame is read exactly once and written into pooled destination buffers:
+        - square crop is a view, no copy
+        - transform: BGR -> grey, one LUT pass (histogram equalisation fused with contrast and
+          brightness), grey -> BGR
+        - rgb: BGR -> RGB straight from the source, replacing copy + cvtColor in the recognizers
+    """
+
+    def __init__(self, alpha: float = ALPHA, beta: float = BETA, pool_depth: int = 3):
+        """Constructor
+
+        Args:
+            alpha (float, optional): Contrast factor of the transform. Defaults to ALPHA.
+            beta (float, optional): Brightness offset of the transform. Defaults to BETA.
+            pool_depth (int, optional): Number of buffers per shape, i.e. how many frames a returned frame survives. Defaults to 3.
+        """
+        self.alpha = alpha
+        self.beta = beta
+        self.pool = BufferPool(pool_depth)
+        self._lut = np.empty(256, dtype=np.uint8)
+        self._lut_f = np.empty(256, dtype=np.float32)
+        self._lut_lock = threading.Lock()
+
+    def process(
+        self,
+        frame: np.ndarray,
+        square_crop: bool = False,
+        transform: bool = False,
+        rgb: bool = False,
+    ) -> np.ndarray:
+        """
+        Crops, transforms and / or converts `frame` into a pooled buffer. `frame` itself is not modified.
+
+        Args:
+            frame (np.ndarray): BGR source frame with shape (H, W, 3).
+            square_crop (bool, optional): Center-crop to the largest square. Defaults to False.
+            transform (bool, optional): Greyscale + equalisation + contrast/brightness, returned as 3-channel. Defaults to False.
+            rgb (bool, optional): Return RGB instead of BGR. Ignored for transformed (grey) frames. Defaults to False.
+
+        Returns:
+            np.ndarray: A pooled buffer holding the result.
+        """
+        src = self.center_crop_square(frame) if square_crop else frame
+
+        if transform:
+            return self.transform(src)
+
+        out = self.pool.get("rgb" if rgb else "bgr", src.shape)
+        if rgb:
+            cv2.cvtColor(src, cv2.COLOR_BGR2RGB, dst=out)
+        else:
+            np.copyto(out, src)
+        return out
+
+    def transform(self, frame: np.ndarray) -> np.ndarray:
+        """Greyscale, equalise and adjust contrast/brightness of `frame` with one LUT pass."""
+        h, w = frame.shape[:2]
+        grey = self.pool.get("grey", (h, w))
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=grey)
+        with self._lut_lock:
+            cv2.LUT(grey, self._fused_lut(grey), dst=grey)
+        out = self.pool.get("transformed", (h, w, 3))
+        cv2.cvtColor(grey, cv2.COLOR_GRAY2BGR, dst=out)
+        return out
+
+    def _fused_lut(self, grey: np.ndarray) -> np.ndarray:
+        """
+        Builds the lookup table of cv2.equalizeHist for `grey` (same algorithm and rounding)
+        and folds cv2.convertScaleAbs(alpha, beta) into it.
+        """
+        hist = cv2.calcHist([grey], [0], None, [256], [0, 256]).ravel()
+        nonzero = np.flatnonzero(hist)
+        lut_f = self._lut_f
+        if nonzero.size == 0:
+            lut_f[:] = 0
+        else:
+            first = nonzero[0]
+            total = hist.sum()
+            if hist[first] == total:
+                # flat image: equalizeHist maps everything to the single present level
+                lut_f[:] = first
+            else:
+                scale = np.float32(255.0 / (total - hist[first]))
+                np.cumsum(hist, out=lut_f)
+                lut_f -= hist[first]
+                lut_f *= scale
+                np.rint(lut_f, out=lut_f)
+                np.clip(lut_f, 0, 255, out=lut_f)
+        lut_f *= self.alpha
+        lut_f += self.beta
+        np.abs(lut_f, out=lut_f)
+        np.rint(lut_f, out=lut_f)
+        np.clip(lut_f, 0, 255, out=lut_f)
+        self._lut[:] = lut_f
+        return self._lut
+
+    @staticmethod
+    def center_crop_square(frame: np.ndarray) -> np.ndarray:
+        """Center-crop an HxWxC frame to the largest possible square (zero-copy view)."""
+        if frame.ndim != 3:
+            raise ValueError("Expected an image with shape (H, W, C)")
+        h, w = frame.shape[:2]
+        if h == w:
+            return frame
+        if w > h:
+            offset = (w - h) // 2
+            return frame[:, offset : offset + h]
+        offset = (h - w) // 2
+        return frame[offset : offset + w, :]
@@ -1,9 +1,29 @@
 from abc import ABC, abstractmethod
+import time
 import cv2
 import numpy as np
+from robocof_mood.input_stream.frame_preprocessor import FramePreprocessor
 
 
 class InputStream(ABC):
+    # FlightRecorder of the raw camera data, if the stream keeps one
+    recorder = None
+    # sequence number of the latest frame, counted by streams that receive frames in the background
+    frame_seq = 0
+    # whether the stream can decode frames at a reduced size (JPEG sources); others ignore decode_reduction
+    supports_decode_reduction = False
+    # frames are decoded at 1/decode_reduction of the camera resolution (streams that support it, under load)
+    decode_reduction = 1
+    # decode_reduction of the frame returned by the last capture_frame() call, 1 for full-size frames
+    captured_reduction = 1
+    # wall-clock time the latest frame was taken: the camera's timestamp if the source sends a trusted one,
+    # otherwise when it arrived here. None before the first frame and for sources that do not track it
+    frame_time = None
+    # frame_time of the frame returned by the last capture_frame() call
+    captured_time = None
+    # show every captured frame in an OpenCV window (local debugging only, needs a display)
+    debug_window = False
+
     @abstractmethod
     def start(self):
         """Start the input stream."""
@@ -11,15 +31,20 @@ class InputStream(ABC):
 
     @abstractmethod
     def capture_frame(
-        self, square_crop: bool = False, transform: bool = False
+        self, square_crop: bool = False, transform: bool = False, rgb: bool = False
     ) -> np.ndarray | None:
         """Capture a frame from the input stream.
 
+        The returned array is a pooled buffer (see FramePreprocessor): it stays valid for the next
+        few captures with the same options and must be copied if it is kept longer.
+
         Args:
             square_crop : bool, optional
                 If True, center-crop the frame to a square. Defaults to False.
             transform : bool, optional
                 If True, apply transformations to the frame (e.g., greyscale, contrast, brightness). Defaults to False.
+            rgb : bool, optional
+                If True, return the frame in RGB instead of BGR order. Defaults to False.
 
         Returns:
             np.ndarray | None
@@ -32,6 +57,33 @@ class InputStream(ABC):
         """Stop the input stream."""
         pass
 
+    def captured_age(self) -> float | None:
+        """Seconds since the frame returned by the last capture_frame() was taken, None if unknown.
+
+        Recognizers run on the event loop and read this right after capture_frame(), before the next await.
+        """
+        if self.captured_time is None:
+            return None
+        return max(0.0, time.time() - self.captured_time)
+
+    def show_debug_frame(self, frame: np.ndarray):
+        """Shows `frame` in the debug window if `debug_window` is set. Call it outside the frame lock."""
+        if not self.debug_window:
+            return
+        try:
+            cv2.imshow("Debug Frame", frame)
+            cv2.waitKey(1)
+        except cv2.error:
+            pass  # headless OpenCV build or no display
+
+    @property
+    def preprocessor(self) -> FramePreprocessor:
+        """The preprocessor (and buffer pool) used for crop, transform and colour conversion."""
+        preprocessor = self.__dict__.get("_preprocessor")
+        if preprocessor is None:
+            preprocessor = self._preprocessor = FramePreprocessor()
+        return preprocessor
+
     def center_crop_square(self, frame: np.ndarray) -> np.ndarray:
         """
         Center-crop an HxWxC BGR/RGB frame to the largest possible square.
@@ -44,20 +96,7 @@ class InputStream(ABC):
             np.ndarray
                 Square crop (zero-copy).
         """
-        if frame.ndim != 3:
-            raise ValueError("Expected an image with shape (H, W, C)")
-
-        h, w = frame.shape[:2]
-
-        if h == w:
-            return frame  # already square
-
-        if w > h:  # crop left/right
-            offset = (w - h) // 2
-            return frame[:, offset : offset + h]
-        else:  # crop top/bottom
-            offset = (h - w) // 2
-            return frame[offset : offset + w, :]
+        return FramePreprocessor.center_crop_square(frame)
 
     def transform_frame(self, frame: np.ndarray) -> np.ndarray:
         """
@@ -69,14 +108,7 @@ class InputStream(ABC):
 
         Returns:
             np.ndarray
-                Greyscale image with adjusted contrast and brightness.
+                Greyscale image with adjusted contrast and brightness (pooled buffer).
         """
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        equalized = cv2.equalizeHist(gray)
-        frame = cv2.cvtColor(equalized, cv2.COLOR_GRAY2BGR)
-
-        alpha = 1.2  # contrast
-        beta = 20  # brightness
-        frame = cv2.convertScaleAbs(frame, alpha=alpha, beta=beta)
-
-        return frame
+        # equalisation, contrast and brightness are fused into a single LUT pass
+        return self.preprocessor.transform(frame)
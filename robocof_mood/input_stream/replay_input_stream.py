@@ -0,0 +1,77 @@
+from __future__ import annotations
+from robocof_mood.input_stream.input_stream import InputStream
+from robocof_mood.input_stream.flight_recorder import FlightRecording
+
+import bisect
+import time
+import numpy as np
+
+
+class ReplayInputStream(InputStream):
+    """
+    Plays back a flight recording (see FlightRecorder) as if it were the live camera, so a failed
+    decision can be re-run through the DecisionManager and the recognizers.
+    """
+
+    def __init__(self, path: str, *, realtime: bool = True, loop: bool = False):
+        """Constructor
+
+        Args:
+            path (str): The recording file.
+            realtime (bool, optional): Follow the recorded timestamps; if False every capture returns the next frame. Defaults to True.
+            loop (bool, optional): Start over after the last frame instead of returning None. Defaults to False.
+        """
+        self.recording = FlightRecording(path)
+        self.realtime = realtime
+        self.loop = loop
+        self._timestamps = self.recording.timestamps
+        self._started: float | None = None
+        self._position = 0
+        self._decoded: tuple[int, np.ndarray | None] | None = None
+
+    def start(self):
+        self._started = time.monotonic()
+        self._position = 0
+
+    def capture_frame(
+        self, square_crop: bool = False, transform: bool = False, rgb: bool = False
+    ) -> np.ndarray | None:
+        """Returns the frame that was current at the same time into the recording, None once it is over."""
+        if self._started is None or not self._timestamps:
+            return None
+        current = self._current_index()
+        if current is None:
+            return None
+        i, lag = current
+        # as old as the frame would have been live; without realtime every frame is fresh
+        self.frame_time = self.captured_time = time.time() - lag
+        if self._decoded is None or self._decoded[0] != i:
+            self._decoded = (i, self.recording.frame(i))
+        frame = self._decoded[1]
+        if frame is None:
+            return None
+        return self.preprocessor.process(frame, square_crop=square_crop, transform=transform, rgb=rgb)
+
+    def stop(self):
+        self._started = None
+        self._decoded = None
+
+    def _current_index(self) -> tuple[int, float] | None:
+        """Index of the current frame and the seconds since it was recorded, in recording time."""
+        n = len(self._timestamps)
+        if not self.realtime:
+            if self._position >= n:
+                if not self.loop:
+                    return None
+                self._position = 0
+            self._position += 1
+            return self._position - 1, 0.0
+
+        elapsed = time.monotonic() - self._started
+        duration = self._timestamps[-1] - self._timestamps[0]
+        if elapsed > duration:
+            if not self.loop:
+                return None
+            elapsed = elapsed % duration if duration > 0 else 0.0
+        i = max(0, bisect.bisect_right(self._timestamps, self._timestamps[0] + elapsed) - 1)
+        return i, max(0.0, self._timestamps[0] + elapsed - self._timestamps[i])
@@ -1,45 +1,151 @@
+from __future__ import annotations
 import numpy as np
 from robocof_mood.input_stream.input_stream import InputStream
+from robocof_mood.tracing import tracer, log
 import cv2
+import threading
+import time
+
+
+RECONNECT_DELAY = 0.5
+MAX_RECONNECT_DELAY = 10.0
 
 
 class WebcamInputStream(InputStream):
-    def __init__(self):
+    """
+    Reads a local / USB camera in a background thread and always exposes the **latest frame** via
+    `capture_frame()`, like MJPEGAPIInputStream: the event loop never blocks on `cap.read()`, the driver
+    buffer cannot serve stale frames, and all recognizers see the same, sequence-numbered frame.
+    A lost camera is reopened with backoff instead of exiting.
+    """
+
+    def __init__(
+        self,
+        device: int | str = 0,
+        *,
+        width: int | None = None,
+        height: int | None = None,
+        fps: float | None = None,
+        fourcc: str | None = "MJPG",
+        buffer_size: int = 1,
+        debug_window: bool = False,
+    ):
+        """Constructor
+
+        Args:
+            device (int | str, optional): Camera index or device path. Defaults to 0 (the default camera).
+            width (int | None, optional): Requested frame width. Defaults to None (driver default).
+            height (int | None, optional): Requested frame height. Defaults to None (driver default).
+            fps (float | None, optional): Requested frame rate. Defaults to None (driver default).
+            fourcc (str | None, optional): Pixel format; MJPG gives full frame rates at high resolutions over USB 2.
+                Defaults to "MJPG".
+            buffer_size (int, optional): Driver buffer size in frames. Defaults to 1.
+            debug_window (bool, optional): Show the captured frames in an OpenCV window. Defaults to False.
+        """
+        self.device = device
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.fourcc = fourcc
+        self.buffer_size = buffer_size
+        self.debug_window = debug_window
+
         self.cap = None
+        self._worker: threading.Thread | None = None
+        self._stop_flag = threading.Event()
+        self._latest_frame: np.ndarray | None = None
+        self._frame_lock = threading.Lock()
+        self.reconnects = 0
 
     def start(self):
-        """Start capturing frames from the webcam."""
-        self.cap = cv2.VideoCapture(0)  # 0 is the default camera
-
-        if not self.cap.isOpened():
-            print("Error: Could not access the webcam.")
-            exit()
+        """Start capturing frames from the webcam; a no-op while the capture thread is already running."""
+        if self._worker is not None and self._worker.is_alive():
+            if not self._stop_flag.is_set():
+                return
+            # stop() timed out on a blocking read: let that reader finish before starting the next one
+            self._worker.join()
+        self._stop_flag.clear()
+        with self._frame_lock:
+            self._latest_frame = None
+            self.frame_time = None
+        self._worker = threading.Thread(target=self._reader, daemon=True)
+        self._worker.start()
 
     def capture_frame(
-        self, square_crop: bool = False, transform: bool = False
+        self, square_crop: bool = False, transform: bool = False, rgb: bool = False
     ) -> np.ndarray | None:
-        """Capture and return a frame from the webcam."""
-        ret, frame = self.cap.read()
-        if not ret:
-            print("Error: Failed to capture image.")
-            return None
-
-        if square_crop:
-            frame = self.center_crop_square(frame)
-
-        if transform:
-            frame = self.transform_frame(frame)
+        """Returns the most recent frame (pooled buffer), None until the camera delivers the first one."""
+        with self._frame_lock:
+            if self._latest_frame is None:
+                return None
+            self.captured_time = self.frame_time
+            with tracer.span("capture", seq=self.frame_seq, square_crop=square_crop, transform=transform, rgb=rgb):
+                frame = self.preprocessor.process(
+                    self._latest_frame, square_crop=square_crop, transform=transform, rgb=rgb
+                )
+            # the reader replaces the frame instead of writing into it, so it can be shown after the lock
+            latest = self._latest_frame
 
         if not transform:
-            # 🖼️ Show the frame for debugging
-            cv2.imshow("Debug Frame", frame)
-            if cv2.waitKey(1) & 0xFF == ord("q"):
-                exit()  # Press 'q' to exit the window
-
+            self.show_debug_frame(latest if rgb else frame)
         return frame
 
     def stop(self):
-        """Release the webcam and close OpenCV windows."""
-        if self.cap is not None:
-            self.cap.release()
-        cv2.destroyAllWindows()
+        """Stop the capture thread, release the webcam and close OpenCV windows."""
+        self._stop_flag.set()
+        if self._worker:
+            self._worker.join(timeout=3)
+        try:
+            cv2.destroyAllWindows()
+        except cv2.error:
+            pass  # headless OpenCV build
+
+    # ------------------------------------------------------------------ #
+    # internal reader
+    # ------------------------------------------------------------------ #
+    def _open(self) -> cv2.VideoCapture:
+        cap = cv2.VideoCapture(self.device)
+        if self.fourcc:
+            cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*self.fourcc))
+        if self.width:
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        if self.height:
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        if self.fps:
+            cap.set(cv2.CAP_PROP_FPS, self.fps)
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, self.buffer_size)
+        return cap
+
+    def _reader(self):
+        delay = RECONNECT_DELAY
+        while not self._stop_flag.is_set():
+            self.cap = self._open()
+            if not self.cap.isOpened():
+                log.warning("stream.open_failed", "could not access camera", device=self.device, retry_in=delay)
+                self.cap.release()
+                self._stop_flag.wait(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+                continue
+
+            try:
+                while not self._stop_flag.is_set():
+                    ok, img = self.cap.read()  # blocks until the camera delivers the next frame
+                    if not ok or img is None:
+                        break  # camera unplugged or driver error
+                    delay = RECONNECT_DELAY
+                    with self._frame_lock:
+                        self._latest_frame = img
+                        self.frame_seq += 1
+                        self.frame_time = time.time()
+            finally:
+                self.cap.release()
+
+            if self._stop_flag.is_set():
+                break
+            # do not keep serving the last frame of a lost camera
+            with self._frame_lock:
+                self._latest_frame = None
+            self.reconnects += 1
+            log.warning("stream.ended", "lost camera, reopening", device=self.device, retry_in=delay)
+            self._stop_flag.wait(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
@@ -0,0 +1,188 @@
+"""
+Lazy loading of the heavy ML stacks (torch, mediapipe, face_recognition, ...)
+plus a small built-in import-time profiler, comparable to `python -X importtime`.
+
+Usage:
+    torch = lazy_import("torch")   # nothing is imported yet
+    torch.hub.load(...)            # first attribute access imports torch
+"""
+from __future__ import annotations
+
+import importlib
+import importlib.abc
+import sys
+import threading
+import time
+from types import ModuleType
+
+
+_lock = threading.RLock()
+# module name -> seconds spent in the first (lazy) import
+_lazy_load_times: dict[str, float] = {}
+
+
+class LazyModule(ModuleType):
+    """A module placeholder that imports the real module on first attribute access."""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_lazy_module"] = None
+
+    def _load(self) -> ModuleType:
+        module = self.__dict__["_lazy_module"]
+        if module is not None:
+            return module
+        with _lock:
+            module = self.__dict__["_lazy_module"]
+            if module is None:
+                t0 = time.perf_counter()
+                module = importlib.import_module(self.__name__)
+                _lazy_load_times[self.__name__] = time.perf_counter() - t0
+                self.__dict__["_lazy_module"] = module
+        return module
+
+    def __getattr__(self, item):
+        return getattr(self._load(), item)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_lazy_module"] is not None else "not loaded"
+        return f"<lazy module '{self.__name__}' ({state})>"
+
+
+def lazy_import(name: str) -> LazyModule:
+    """
+    Returns a placeholder for the module `name` that is imported on first use.
+
+    Args:
+        name (str): Fully qualified module name, e.g. "mediapipe.tasks.python.vision".
+
+    Returns:
+        LazyModule: The placeholder module.
+    """
+    return LazyModule(name)
+
+
+def is_loaded(module: ModuleType) -> bool:
+    """Returns whether a (lazy) module has been imported already."""
+    if isinstance(module, LazyModule):
+        return module.__dict__["_lazy_module"] is not None
+    return True
+
+
+def preload(*modules: ModuleType):
+    """Imports the given lazy modules right away (e.g. to warm up before the first request)."""
+    for module in modules:
+        if isinstance(module, LazyModule):
+            module._load()
+
+
+def lazy_load_times() -> dict[str, float]:
+    """Returns the seconds spent importing each lazy module that has been loaded so far."""
+    return dict(_lazy_load_times)
+
+
+# ---------------------------------------------------------------------- #
+# import-time profiler
+# ---------------------------------------------------------------------- #
+class _TimedLoader(importlib.abc.Loader):
+    def __init__(self, loader, profiler: "_ImportProfiler"):
+        self._loader = loader
+        self._profiler = profiler
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._profiler.enter()
+        t0 = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler.leave(module.__name__, time.perf_counter() - t0)
+
+    def __getattr__(self, item):
+        return getattr(self._loader, item)
+
+
+class _ImportProfiler(importlib.abc.MetaPathFinder):
+    """Meta path finder that wraps every loader to record self and cumulative import times."""
+
+    def __init__(self):
+        # name -> (self seconds, cumulative seconds, nesting depth)
+        self.timings: dict[str, tuple[float, float, int]] = {}
+        self._local = threading.local()
+
+    def _stack(self) -> list[float]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(spec.loader, self)
+                return spec
+        return None
+
+    def enter(self):
+        # children accumulate their cumulative time into the parent's slot
+        self._stack().append(0.0)
+
+    def leave(self, name: str, cumulative: float):
+        stack = self._stack()
+        children = stack.pop()
+        depth = len(stack)
+        if stack:
+            stack[-1] += cumulative
+        self.timings[name] = (cumulative - children, cumulative, depth)
+
+
+_profiler: _ImportProfiler | None = None
+
+
+def enable_import_timing():
+    """Starts recording the import time of every module imported from now on."""
+    global _profiler
+    with _lock:
+        if _profiler is None:
+            _profiler = _ImportProfiler()
+            sys.meta_path.insert(0, _profiler)
+
+
+def disable_import_timing():
+    """Stops recording import times. Already recorded timings are kept."""
+    with _lock:
+        if _profiler is not None and _profiler in sys.meta_path:
+            sys.meta_path.remove(_profiler)
+
+
+def import_time_report(top: int = 25) -> str:
+    """
+    Formats the recorded import times, slowest (cumulative) first.
+
+    Args:
+        top (int, optional): Number of modules to list. Defaults to 25.
+
+    Returns:
+        str: The report, one module per line (self / cumulative in ms).
+    """
+    lines = []
+    if _profiler is not None and _profiler.timings:
+        total = sum(self_t for self_t, _, _ in _profiler.timings.values())
+        lines.append(f"import time: {len(_profiler.timings)} modules, {total * 1000:.1f} ms total")
+        lines.append(f"{'self [ms]':>10} | {'cumulative':>10} | module")
+        ranked = sorted(_profiler.timings.items(), key=lambda kv: kv[1][1], reverse=True)
+        for name, (self_t, cum_t, depth) in ranked[:top]:
+            lines.append(f"{self_t * 1000:10.1f} | {cum_t * 1000:10.1f} | {'  ' * depth}{name}")
+    if _lazy_load_times:
+        lines.append("lazy modules loaded:")
+        for name, seconds in sorted(_lazy_load_times.items(), key=lambda kv: kv[1], reverse=True):
+            lines.append(f"{seconds * 1000:10.1f} ms  {name}")
+    return "\n".join(lines) if lines else "no import timings recorded"
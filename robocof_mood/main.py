@@ -1,27 +1,132 @@
-import httpx
-from fastapi import FastAPI, Request, BackgroundTasks, Depends, Form, File, UploadFile, HTTPException
+import os
+import json
+import time
+import asyncio
+from robocof_mood.lazy_import import enable_import_timing, import_time_report
+
+# set ROBOCOF_IMPORT_TIMING=1 to print a report of where start-up import time goes
+IMPORT_TIMING = os.getenv("ROBOCOF_IMPORT_TIMING", "0") == "1"
+if IMPORT_TIMING:
+    enable_import_timing()
+
+from fastapi import FastAPI, Request, BackgroundTasks, Depends, Form, File, UploadFile, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import HttpUrl, BaseModel, Field
 from contextlib import asynccontextmanager
 from robocof_mood.input_stream.api_mjpeg_input_stream import MJPEGAPIInputStream
 from robocof_mood.input_stream.webcam_input_stream import WebcamInputStream
-from robocof_mood.decision_manager import DecisionManager
+from robocof_mood.input_stream.ffmpeg_input_stream import FFmpegInputStream
+from robocof_mood.input_stream.flight_recorder import FlightRecorder, FILE_EXTENSION
+from robocof_mood.decision_manager import DecisionManager, Decision, DEFAULT_PREPARE_TTL, DEFAULT_MAX_FRAME_AGE
+from robocof_mood.callback.callback_dispatcher import CallbackDispatcher, OUTBOX_PATH
+from robocof_mood.seat_recognition.desk_prior_cache import DeskPriorCache
+from robocof_mood.progress.progress_hub import ProgressHub
+from robocof_mood.sessions.decision_store import DecisionStore
+from robocof_mood.tracing import tracer, log
+from robocof_mood.resources.resource_governor import ResourceGovernor, parse_cpu_list
+from robocof_mood.resources.overload_controller import OverloadController
+from robocof_mood.serving import process_stats
+from robocof_mood.snapshots.snapshot_classifier import SnapshotClassifier, TASKS as SNAPSHOT_TASKS
 
 LIVESTREAM_URL = "http://192.168.137.204:8000/video_feed"
+# e.g. ROBOCOF_STREAM_URL=rtsp://192.168.137.204:8554/cam to read an H.264 stream instead of the MJPEG feed
+STREAM_URL = os.getenv("ROBOCOF_STREAM_URL") or None
 # Default timeout in seconds
 DEFAULT_TIMEOUT = 15
 MAX_TIMEOUT = 120  # 60 * 2
+# load torch / mediapipe and the models in the background right after start-up;
+# set ROBOCOF_PRELOAD_MODELS=0 to only load them on the first decision
+PRELOAD_MODELS = os.getenv("ROBOCOF_PRELOAD_MODELS", "1") != "0"
+MAX_PREPARE_TTL = 300
+# set ROBOCOF_WORKER_MODE=1 to run every recognizer in its own process
+WORKER_MODE = os.getenv("ROBOCOF_WORKER_MODE", "0") == "1"
+# learned chair locations per desk, kept across restarts
+DESK_PRIORS_PATH = "desk_priors.json"
+# callbacks not yet accepted by the app backend, resent after a restart
+CALLBACK_OUTBOX_PATH = OUTBOX_PATH
+# e.g. ROBOCOF_UNIFIED_MODEL=models/yolo11n.pt for single-pass perception with ultralytics
+UNIFIED_MODEL_PATH = os.getenv("ROBOCOF_UNIFIED_MODEL") or None
+# seconds of raw camera JPEGs kept in memory; 0 disables the flight recorder
+FLIGHT_RECORDER_SECONDS = float(os.getenv("ROBOCOF_FLIGHT_RECORDER_SECONDS", "10"))
+# flight recordings of failed (timeout / error) decisions and on-demand dumps go here
+RECORDINGS_DIR = "recordings"
+# set ROBOCOF_TRACING=1 to record a Chrome trace of every decision (GET /decision/{robot_run_id}/trace)
+TRACING = os.getenv("ROBOCOF_TRACING", "0") == "1"
+# CPUs the service may use, e.g. ROBOCOF_CPUS=0-3 (default: all); ROBOCOF_PIN_CPUS=1 pins each worker to its slice
+CPUS = parse_cpu_list(os.getenv("ROBOCOF_CPUS", "")) or None
+PIN_CPUS = os.getenv("ROBOCOF_PIN_CPUS", "0") == "1"
+# step down through quality tiers when the host is saturated; ROBOCOF_LOAD_SHEDDING=0 keeps full quality
+LOAD_SHEDDING = os.getenv("ROBOCOF_LOAD_SHEDDING", "1") != "0"
+# seconds after capture from which frames are too old for the recognizers; ROBOCOF_MAX_FRAME_AGE=0 accepts every frame
+MAX_FRAME_AGE = float(os.getenv("ROBOCOF_MAX_FRAME_AGE", str(DEFAULT_MAX_FRAME_AGE))) or None
+# set ROBOCOF_DEBUG_WINDOW=1 to watch the captured frames in an OpenCV window (needs a display)
+DEBUG_WINDOW = os.getenv("ROBOCOF_DEBUG_WINDOW", "0") == "1"
+# e.g. ROBOCOF_LOG_LEVEL=DEBUG for the per-frame recognizer output (sampled), ROBOCOF_LOG_FORMAT=json for log shippers
+LOG_LEVEL = os.getenv("ROBOCOF_LOG_LEVEL", "INFO")
+LOG_JSON = os.getenv("ROBOCOF_LOG_FORMAT", "text") == "json"
+# log records per decision session, errors excepted
+LOG_SESSION_CAP = int(os.getenv("ROBOCOF_LOG_SESSION_CAP", str(log.DEFAULT_SESSION_CAP)))
+# limits of one /snapshots/classify or /faces/enrol request
+MAX_SNAPSHOT_IMAGES = 64
+MAX_SNAPSHOT_BYTES = 10 * 1024 * 1024
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    input_stream = MJPEGAPIInputStream(LIVESTREAM_URL)
+    log.configure(LOG_LEVEL, json_output=LOG_JSON, session_cap=LOG_SESSION_CAP)
+    if TRACING:
+        tracer.enable_tracing()
+    # thread budgets have to be in place before torch / mediapipe create their pools
+    governor = ResourceGovernor(CPUS, pin=PIN_CPUS)
+    governor.pin_service()
+    governor.apply()
+    overload = OverloadController() if LOAD_SHEDDING else None
+    recorder = FlightRecorder(FLIGHT_RECORDER_SECONDS) if FLIGHT_RECORDER_SECONDS > 0 else None
+    if STREAM_URL:
+        input_stream = FFmpegInputStream(STREAM_URL)  # no raw JPEGs to record
+    else:
+        input_stream = MJPEGAPIInputStream(LIVESTREAM_URL, recorder=recorder, debug_window=DEBUG_WINDOW)
     #input_stream = WebcamInputStream() # for debugging
-    decision_manager = DecisionManager(input_stream, timeout=DEFAULT_TIMEOUT)
+    decision_manager = DecisionManager(
+        input_stream,
+        timeout=DEFAULT_TIMEOUT,
+        worker_mode=WORKER_MODE,
+        desk_priors=DeskPriorCache(DESK_PRIORS_PATH),
+        unified_model_path=UNIFIED_MODEL_PATH,
+        governor=governor,
+        overload=overload,
+        max_frame_age=MAX_FRAME_AGE,
+    )
     app.state.decision_manager = decision_manager
+    callback_dispatcher = CallbackDispatcher(CALLBACK_OUTBOX_PATH)
+    await callback_dispatcher.start()
+    app.state.callback_dispatcher = callback_dispatcher
+    app.state.progress_hub = ProgressHub()
+    # one decision per robot_run_id: retries attach to it or get its cached result
+    app.state.decision_store = DecisionStore()
+    # still images, independent of the camera stream
+    app.state.snapshot_classifier = SnapshotClassifier(UNIFIED_MODEL_PATH)
+    if overload is not None:
+        overload.start()
+    preload_task = None
+    if PRELOAD_MODELS:
+        preload_task = asyncio.create_task(asyncio.to_thread(decision_manager.preload))
+        preload_task.add_done_callback(lambda task: None if task.cancelled() else process_stats.mark_ready())
+    else:
+        process_stats.mark_ready()
+    if IMPORT_TIMING:
+        print(import_time_report())
     try:
         yield
     finally:
-        print("Application shutdown complete.")
+        if preload_task is not None and not preload_task.done():
+            preload_task.cancel()
+        if overload is not None:
+            await overload.stop()
+        await callback_dispatcher.stop()
+        decision_manager.shutdown()
+        log.info("app.shutdown", "Application shutdown complete.")
+        log.flush()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -31,30 +136,123 @@ def get_dm(request: Request) -> DecisionManager:
     return request.app.state.decision_manager
 
 
+def get_dispatcher(request: Request) -> CallbackDispatcher:
+    return request.app.state.callback_dispatcher
+
+
+def get_hub(request: Request) -> ProgressHub:
+    return request.app.state.progress_hub
+
+
+def get_store(request: Request) -> DecisionStore:
+    return request.app.state.decision_store
+
+
+def get_classifier(request: Request) -> SnapshotClassifier:
+    return request.app.state.snapshot_classifier
+
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to the RoboCof decision-making API!"}
 
 
-async def _decide_and_callback(dm: DecisionManager, callback: HttpUrl, robot_run_id: int, image_bytes: bytes | None = None):
+@app.get("/metrics")
+async def metrics(dm: DecisionManager = Depends(get_dm), classifier: SnapshotClassifier = Depends(get_classifier)):
+    """Load and quality figures of the running service."""
+    return {
+        "overload": dm.overload.stats() if dm.overload is not None else None,
+        "worker_restarts": dm.worker_restarts(),
+        "seat_scales": dm.seat_scale_stats(),
+        "process": process_stats.snapshot(),
+        "log": log.stats(),
+        "snapshots": classifier.stats(),
+    }
+
+
+@app.get("/debug/imports")
+async def import_report():
+    return {"report": import_time_report().splitlines()}
+
+
+async def _save_recording(dm: DecisionManager, name: str, since: float | None = None, meta: dict | None = None) -> str | None:
+    """Writes the flight recorder buffer to RECORDINGS_DIR without blocking the event loop."""
+    recorder = dm.input_stream.recorder
+    if recorder is None:
+        return None
+    path = os.path.join(RECORDINGS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}_{name}{FILE_EXTENSION}")
+    try:
+        path = await asyncio.to_thread(recorder.dump, path, since, meta)
+    except OSError as exc:
+        log.error("recording.failed", "could not write flight recording", path=path, error=exc)
+        return None
+    if path is not None:
+        log.info("recording.saved", "flight recording saved", path=path)
+    return path
+
+
+async def _decide_and_callback(dm: DecisionManager, dispatcher: CallbackDispatcher, callback: HttpUrl, robot_run_id: int, image_bytes: bytes | None = None, desk_id: str | None = None, hub: ProgressHub | None = None, store: DecisionStore | None = None):
     if image_bytes:
         # TODO use face recognition
         pass
 
+    if hub is not None:
+        hub.open(robot_run_id)
+        hub.publish(robot_run_id, "started", {"desk_id": desk_id, "timeout": dm.timeout})
+
+    def progress(event_type: str, data: dict):
+        if event_type == "latency" and store is not None:
+            store.report_latency(robot_run_id, data)
+        if hub is not None:
+            hub.publish(robot_run_id, event_type, data)
+
+    started = time.time()
+    tracer.begin_session(robot_run_id)
+    # before the task is created, its context inherits the run id
+    log.begin_session(robot_run_id)
+    task = asyncio.create_task(dm.make_decision(desk_id=desk_id, progress=progress), name=f"decision {robot_run_id}")
+    if store is not None:
+        store.start(robot_run_id, task)
     try:
-        decision = await dm.make_decision()
+        decision = await task
+    except asyncio.CancelledError:
+        if not task.cancelled():
+            raise
+        decision = Decision.CANCELLED  # cancelled before it started
     except Exception as exc:
-        print(f"[decision] failed: {exc}")
+        log.error("decision.failed", "decision failed", error=exc)
+        if store is not None:
+            store.fail(robot_run_id, str(exc))
+        if hub is not None:
+            hub.publish(robot_run_id, "error", {"detail": str(exc)})
+            hub.close(robot_run_id)
+        await _save_recording(dm, f"run{robot_run_id}_exception", started, {"robot_run_id": robot_run_id, "desk_id": desk_id, "error": str(exc)})
         return
+    finally:
+        tracer.end_session(robot_run_id)
+        log.end_session(robot_run_id)
+
+    if hub is not None:
+        hub.publish(robot_run_id, "decision", {"decision": str(decision)})
+        hub.close(robot_run_id)
 
     payload = {"decision": str(decision), "robot_run_id": robot_run_id}
 
-    try:
-        async with httpx.AsyncClient(timeout=10) as client:
-            r = await client.post(str(callback), json=payload)
-            r.raise_for_status()
-    except Exception as exc:
-        print(f"[callback] POST {callback} failed: {exc}")
+    # retries of the request may have brought other callback URLs, each gets the result once
+    callback_urls = [str(callback)]
+    if store is not None:
+        record = store.get(robot_run_id)
+        if record is not None:
+            callback_urls = record.callback_urls
+        store.finish(robot_run_id, decision)
+
+    # persisted to the outbox and retried until the app backend accepts it
+    for url in callback_urls:
+        await dispatcher.submit(url, payload)
+
+    # every timeout outcome (no user, user present, ...) and errors are what needs debugging later
+    if decision.name.startswith("TIMEOUT") or decision == Decision.ERROR:
+        await _save_recording(dm, f"run{robot_run_id}_{decision.name.lower()}", started, {"robot_run_id": robot_run_id, "desk_id": desk_id, "decision": str(decision)})
 
 
 @app.post("/decision", status_code=202)
@@ -64,21 +262,201 @@ async def decision_entrypoint(
     callback_url: HttpUrl = Form(...),
     robot_run_id: int = Form(...),
     timeout: int = Form(DEFAULT_TIMEOUT),
+    desk_id: str | None = Form(default=None),
     dm: DecisionManager = Depends(get_dm),
+    dispatcher: CallbackDispatcher = Depends(get_dispatcher),
+    hub: ProgressHub = Depends(get_hub),
+    store: DecisionStore = Depends(get_store),
 ):
     if timeout < 1 or timeout > MAX_TIMEOUT:
         raise HTTPException(status_code=400, detail=f"Timeout must be between 1 and {MAX_TIMEOUT} seconds.")
 
+    # a retry of the same robot_run_id must not start a second decision on the shared stream
+    record, created = store.begin(robot_run_id, str(callback_url), desk_id)
+    if not created:
+        if record.in_flight():
+            return {**record.to_dict(), "detail": "Decision already in progress, result will be sent to callback"}
+        return JSONResponse({**record.to_dict(), "detail": "Decision already made"}, status_code=200)
+
     image_bytes = None if image is None else image.file.read()
 
     dm.timeout = timeout
 
     background_tasks.add_task(
-        _decide_and_callback, dm, callback_url, robot_run_id, image_bytes
+        _decide_and_callback, dm, dispatcher, callback_url, robot_run_id, image_bytes, desk_id, hub, store
     )
 
     return {"detail": "Decision accepted, result will be sent to callback"}
 
 
+@app.post("/prepare", status_code=202)
+async def prepare_entrypoint(
+    background_tasks: BackgroundTasks,
+    ttl: int = Form(DEFAULT_PREPARE_TTL),
+    desk_id: str | None = Form(default=None),
+    dm: DecisionManager = Depends(get_dm),
+):
+    """Called by the pathfinding side while the robot approaches the desk, so /decision starts warm."""
+    if ttl < 1 or ttl > MAX_PREPARE_TTL:
+        raise HTTPException(status_code=400, detail=f"ttl must be between 1 and {MAX_PREPARE_TTL} seconds.")
+
+    background_tasks.add_task(dm.prepare, ttl, desk_id)
+
+    return {"detail": f"Preparation accepted, expires after {ttl} seconds if unused"}
+
+
+@app.post("/debug/recordings")
+async def save_recording(seconds: float | None = Form(default=None), dm: DecisionManager = Depends(get_dm)):
+    """Writes the last `seconds` (default: everything buffered) of the camera stream to disk."""
+    since = None if seconds is None else time.time() - seconds
+    path = await _save_recording(dm, "manual", since)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Flight recorder is disabled or empty.")
+    return {"path": path}
+
+
+@app.get("/decision/{robot_run_id}")
+async def decision_status(robot_run_id: int, store: DecisionStore = Depends(get_store)):
+    """Status (pending, running, done, failed) and, once made, the decision for `robot_run_id`."""
+    record = store.get(robot_run_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"No decision for robot_run_id {robot_run_id}.")
+    return record.to_dict()
+
+
+@app.get("/decision/{robot_run_id}/trace")
+async def decision_trace(robot_run_id: int):
+    """Chrome trace-event JSON of the decision, open it in ui.perfetto.dev or chrome://tracing."""
+    trace = tracer.export_trace(robot_run_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"No trace for robot_run_id {robot_run_id}, is ROBOCOF_TRACING=1 set?")
+    return JSONResponse(
+        trace, headers={"Content-Disposition": f'attachment; filename="decision_{robot_run_id}.trace.json"'}
+    )
+
+
+def _has_progress(robot_run_id: int, hub: ProgressHub, store: DecisionStore) -> bool:
+    """Whether there is a progress stream to subscribe to: a running or recent decision, or one about to start."""
+    if hub.is_known(robot_run_id):
+        return True
+    record = store.get(robot_run_id)
+    return record is not None and record.in_flight()
+
+
+@app.get("/decision/{robot_run_id}/events")
+async def decision_events(robot_run_id: int, hub: ProgressHub = Depends(get_hub), store: DecisionStore = Depends(get_store)):
+    """Server-Sent Events stream of the intermediate state of a decision, ends after the final decision."""
+    if not _has_progress(robot_run_id, hub, store):
+        raise HTTPException(status_code=404, detail=f"No decision in progress for robot_run_id {robot_run_id}, see GET /decision/{robot_run_id}.")
+
+    async def event_stream():
+        async for event in hub.subscribe(robot_run_id):
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.websocket("/decision/{robot_run_id}/ws")
+async def decision_websocket(websocket: WebSocket, robot_run_id: int):
+    """Same events as /decision/{robot_run_id}/events; send {"action": "cancel"} to abort the decision."""
+    hub: ProgressHub = websocket.app.state.progress_hub
+    store: DecisionStore = websocket.app.state.decision_store
+    if not _has_progress(robot_run_id, hub, store):
+        # rejects the handshake (HTTP 403)
+        await websocket.close(code=1008, reason=f"No decision in progress for robot_run_id {robot_run_id}")
+        return
+    await websocket.accept()
+
+    async def receive_commands():
+        while True:
+            message = await websocket.receive_json()
+            if isinstance(message, dict) and message.get("action") == "cancel":
+                task = store.running_task(robot_run_id)
+                if task is not None:
+                    task.cancel()
+
+    receiver = asyncio.create_task(receive_commands())
+    try:
+        async for event in hub.subscribe(robot_run_id):
+            await websocket.send_json(event)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+
+
+@app.post("/decision/{robot_run_id}/cancel", status_code=202)
+async def cancel_decision(robot_run_id: int, store: DecisionStore = Depends(get_store)):
+    """Stops a running decision right away; the callback then reports Decision.CANCELLED."""
+    task = store.running_task(robot_run_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail=f"No running decision for robot_run_id {robot_run_id}.")
+    task.cancel()
+    return {"detail": "Cancellation requested"}
+
+
+async def _read_snapshots(images: list[UploadFile]) -> list[bytes]:
+    if len(images) > MAX_SNAPSHOT_IMAGES:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_SNAPSHOT_IMAGES} images per request.")
+    contents = []
+    for image in images:
+        data = await image.read()
+        if len(data) > MAX_SNAPSHOT_BYTES:
+            raise HTTPException(status_code=413, detail=f"{image.filename} is larger than {MAX_SNAPSHOT_BYTES} bytes.")
+        contents.append(data)
+    return contents
+
+
+@app.post("/snapshots/classify")
+async def classify_snapshots(
+    images: list[UploadFile] = File(...),
+    tasks: str = Form(",".join(SNAPSHOT_TASKS)),
+    classifier: SnapshotClassifier = Depends(get_classifier),
+):
+    """Seat status, gestures and faces of uploaded images, e.g. to pre-check snapshots; synchronous."""
+    kinds = tuple(kind.strip() for kind in tasks.split(",") if kind.strip())
+    unknown = sorted(set(kinds) - set(SNAPSHOT_TASKS))
+    if not kinds or unknown:
+        raise HTTPException(status_code=400, detail=f"tasks must be a comma-separated subset of {', '.join(SNAPSHOT_TASKS)}.")
+
+    contents = await _read_snapshots(images)
+    started = time.perf_counter()
+    results = await classifier.classify(contents, kinds)
+    return {
+        "results": [{**result.to_dict(), "filename": image.filename} for result, image in zip(results, images)],
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+@app.post("/faces/enrol")
+async def enrol_faces(
+    images: list[UploadFile] = File(...),
+    names: list[str] = Form(...),
+    classifier: SnapshotClassifier = Depends(get_classifier),
+):
+    """Adds the face in each image under the name at the same position; each image must show one face."""
+    if len(names) != len(images):
+        raise HTTPException(status_code=400, detail=f"{len(names)} names for {len(images)} images.")
+
+    contents = await _read_snapshots(images)
+    results = await classifier.enrol(names, contents)
+    return {
+        "results": [
+            {"index": result.index, "name": name, "filename": image.filename, "enrolled": result.faces is not None, "error": result.error}
+            for result, name, image in zip(results, names, images)
+        ],
+        "known_faces": classifier.known_faces(),
+    }
+
+
+@app.get("/faces")
+async def known_faces(classifier: SnapshotClassifier = Depends(get_classifier)):
+    return {"names": classifier.known_faces()}
+
 
-# start using uvicorn robocof_mood.main:app --reload   
\ No newline at end of file
+# start using uvicorn robocof_mood.main:app --reload   
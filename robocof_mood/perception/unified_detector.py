@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from robocof_mood.lazy_import import lazy_import
+from robocof_mood.tracing import log
+
+# ultralytics pulls in torch, only import it when a UnifiedDetector is created
+ultralytics = lazy_import("ultralytics")
+
+
+# A local COCO detection model gives persons and chairs in one pass. A pose model trained with an
+# additional chair class (same class names) also yields wrist keypoints from that same pass.
+DEFAULT_MODEL_PATH = "models/yolo11n.pt"
+
+# COCO keypoint indices of the wrists in ultralytics pose models
+LEFT_WRIST = 9
+RIGHT_WRIST = 10
+MIN_KEYPOINT_CONFIDENCE = 0.3
+
+# hand region = square around a wrist, side = HAND_REGION_FACTOR * person box width
+HAND_REGION_FACTOR = 0.6
+# the face is searched in the top FACE_REGION_SHARE of a person box
+FACE_REGION_SHARE = 0.4
+
+
+@dataclass
+class PerceptionResult:
+    """Everything one forward pass of the unified detector found in a frame (full-frame pixel coordinates)."""
+
+    frame_shape: tuple[int, int]  # height, width
+    # boxes as dicts with xmin, ymin, xmax, ymax, confidence, like SeatRecognizer.detect()
+    persons: list[dict] = field(default_factory=list)
+    chairs: list[dict] = field(default_factory=list)
+    # (x, y) per visible wrist; empty for plain detection models
+    wrists: list[tuple[float, float]] = field(default_factory=list)
+    has_keypoints: bool = False
+    # time.monotonic() of the detection; seat gating can keep a result around for seconds
+    created: float = field(default_factory=time.monotonic)
+
+    def hand_regions(self) -> list[tuple[int, int, int, int]]:
+        """
+        Regions (x0, y0, x1, y1) where hands can be: squares around the wrists if the model has keypoints,
+        otherwise the upper body (top two thirds) of each person, where a raised hand gesture happens.
+        """
+        h, w = self.frame_shape
+        regions = []
+        if self.has_keypoints:
+            for person in self.persons:
+                side = HAND_REGION_FACTOR * (person["xmax"] - person["xmin"])
+                for x, y in person.get("wrists", []):
+                    regions.append(_clip((x - side, y - side, x + side, y + side), w, h))
+        else:
+            for person in self.persons:
+                top, bottom = person["ymin"], person["ymax"]
+                pad = 0.25 * (person["xmax"] - person["xmin"])  # hands stick out of the body box
+                regions.append(_clip(
+                    (person["xmin"] - pad, top - pad, person["xmax"] + pad, top + (bottom - top) * 2 / 3), w, h
+                ))
+        return [r for r in regions if r[2] > r[0] and r[3] > r[1]]
+
+    def face_regions(self) -> list[tuple[int, int, int, int]]:
+        """Regions (x0, y0, x1, y1) in which each person's face has to be, i.e. the top of the person box."""
+        h, w = self.frame_shape
+        regions = []
+        for person in self.persons:
+            top, bottom = person["ymin"], person["ymax"]
+            regions.append(_clip((person["xmin"], top, person["xmax"], top + (bottom - top) * FACE_REGION_SHARE), w, h))
+        return [r for r in regions if r[2] > r[0] and r[3] > r[1]]
+
+
+def union_region(regions: list[tuple[int, int, int, int]]) -> tuple[int, int, int, int] | None:
+    """Smallest box containing all `regions`, or None if there are none."""
+    if not regions:
+        return None
+    return (
+        min(r[0] for r in regions),
+        min(r[1] for r in regions),
+        max(r[2] for r in regions),
+        max(r[3] for r in regions),
+    )
+
+
+def _clip(box, w: int, h: int) -> tuple[int, int, int, int]:
+    x0, y0, x1, y1 = box
+    return max(0, int(x0)), max(0, int(y0)), min(w, int(x1)), min(h, int(y1))
+
+
+class UnifiedDetector:
+    """
+    Single-pass perception on a local ultralytics model: persons and chairs (and wrist keypoints for pose
+    models) from one forward pass. The result feeds seat classification directly and tells the gesture and
+    face recognizers where (and whether) to run.
+    """
+
+    def __init__(
+        self,
+        model_path: str = DEFAULT_MODEL_PATH,
+        imgsz: int = 640,
+        conf: float = 0.25,
+        iou: float = 0.45,
+    ):
+        """Constructor
+
+        Args:
+            model_path (str, optional): Path of the ultralytics weights. Defaults to DEFAULT_MODEL_PATH.
+            imgsz (int, optional): Inference size. Defaults to 640.
+            conf (float, optional): Confidence threshold. Defaults to 0.25 (as for the YOLOv5 seat model).
+            iou (float, optional): NMS IoU threshold. Defaults to 0.45.
+        """
+        self.model = ultralytics.YOLO(model_path)
+        self.imgsz = imgsz
+        self.conf = conf
+        self.iou = iou
+
+        names = {int(k): v for k, v in self.model.names.items()}
+        self.person_class = next((k for k, v in names.items() if v == "person"), None)
+        self.chair_class = next((k for k, v in names.items() if v == "chair"), None)
+        if self.person_class is None:
+            raise ValueError(f"{model_path} has no 'person' class")
+        if self.chair_class is None:
+            log.warning("detector.no_chair_class", "no 'chair' class, seat status will lack chairs", model=str(model_path))
+        self.classes = [c for c in (self.person_class, self.chair_class) if c is not None]
+
+    def detect(self, frame: np.ndarray, rgb: bool = False, size: int | None = None) -> PerceptionResult:
+        """
+        Runs the forward pass.
+
+        Args:
+            frame (np.ndarray): The full frame.
+            rgb (bool, optional): True if `frame` is RGB (ultralytics expects BGR arrays). Defaults to False.
+            size (int | None, optional): Inference size, overrides `imgsz`. Defaults to None.
+
+        Returns:
+            PerceptionResult: Persons, chairs and wrists in `frame` coordinates.
+        """
+        image = np.ascontiguousarray(frame[..., ::-1]) if rgb else frame
+        result = self.model.predict(
+            image,
+            imgsz=size or self.imgsz,
+            conf=self.conf,
+            iou=self.iou,
+            classes=self.classes,
+            verbose=False,
+        )[0]
+
+        perception = PerceptionResult(frame_shape=tuple(frame.shape[:2]))
+        boxes = result.boxes
+        xyxy = boxes.xyxy.cpu().numpy()
+        cls = boxes.cls.cpu().numpy().astype(int)
+        confidence = boxes.conf.cpu().numpy()
+
+        keypoints = None
+        if getattr(result, "keypoints", None) is not None and result.keypoints.xy is not None:
+            keypoints = result.keypoints.xy.cpu().numpy()
+            kp_conf = result.keypoints.conf.cpu().numpy() if result.keypoints.conf is not None else None
+            perception.has_keypoints = True
+
+        for i, (box, c, p) in enumerate(zip(xyxy, cls, confidence)):
+            entry = {
+                "xmin": float(box[0]), "ymin": float(box[1]), "xmax": float(box[2]), "ymax": float(box[3]),
+                "confidence": float(p),
+            }
+            if c == self.person_class:
+                if keypoints is not None:
+                    entry["wrists"] = [
+                        (float(keypoints[i, k, 0]), float(keypoints[i, k, 1]))
+                        for k in (LEFT_WRIST, RIGHT_WRIST)
+                        if kp_conf is None or kp_conf[i, k] >= MIN_KEYPOINT_CONFIDENCE
+                    ]
+                    perception.wrists.extend(entry["wrists"])
+                perception.persons.append(entry)
+            elif c == self.chair_class:
+                perception.chairs.append(entry)
+        return perception
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterator
+
+
+# Final events stay available for late subscribers this long (seconds)
+DEFAULT_RETENTION = 60.0
+# Events buffered per subscriber; a slow subscriber loses the oldest ones
+DEFAULT_QUEUE_SIZE = 64
+# Unfinished sessions without any event for this long (seconds) are ended, e.g. subscribed but never opened
+DEFAULT_IDLE_TIMEOUT = 300.0
+
+
+@dataclass
+class _Session:
+    # latest event per type, replayed to new subscribers
+    snapshot: dict[str, dict] = field(default_factory=dict)
+    subscribers: list[asyncio.Queue] = field(default_factory=list)
+    finished: bool = False
+    cleanup: asyncio.TimerHandle | None = None
+    last_activity: float = field(default_factory=time.monotonic)
+
+
+class ProgressHub:
+    """
+    Fan-out of intermediate decision state per robot_run_id (seat-status distribution, gesture
+    candidates, recognized faces and the final decision) to SSE / WebSocket subscribers.
+
+    Events are dicts {"type": ..., "data": ..., "time": ...}. publish() never blocks the caller.
+    """
+
+    def __init__(
+        self,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        retention: float = DEFAULT_RETENTION,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+    ):
+        self.queue_size = queue_size
+        self.retention = retention
+        self.idle_timeout = idle_timeout
+        self._sessions: dict[int, _Session] = {}
+
+    def open(self, robot_run_id: int):
+        """Starts (or restarts) the event stream of a decision session."""
+        self._expire_idle()
+        session = self._sessions.get(robot_run_id)
+        if session is not None and session.cleanup is not None:
+            session.cleanup.cancel()
+        if session is None or session.finished:
+            self._sessions[robot_run_id] = _Session()
+        else:
+            session.last_activity = time.monotonic()
+
+    def publish(self, robot_run_id: int, event_type: str, data):
+        """Sends an event to all subscribers of `robot_run_id`."""
+        session = self._sessions.get(robot_run_id)
+        if session is None:
+            return
+        event = {"type": event_type, "data": data, "time": time.time()}
+        session.snapshot[event_type] = event
+        session.last_activity = time.monotonic()
+        for queue in session.subscribers:
+            if queue.full():
+                queue.get_nowait()  # drop the oldest, the newest state matters most
+            queue.put_nowait(event)
+
+    def close(self, robot_run_id: int):
+        """Marks the session as finished; subscribers end after the events published so far."""
+        session = self._sessions.get(robot_run_id)
+        if session is None:
+            return
+        session.finished = True
+        for queue in session.subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(None)
+        session.cleanup = asyncio.get_running_loop().call_later(
+            self.retention, self._sessions.pop, robot_run_id, None
+        )
+
+    def is_known(self, robot_run_id: int) -> bool:
+        return robot_run_id in self._sessions
+
+    def _expire_idle(self):
+        """Ends unfinished sessions without events for `idle_timeout`, so abandoned ones cannot pile up."""
+        deadline = time.monotonic() - self.idle_timeout
+        for robot_run_id, session in list(self._sessions.items()):
+            if session.finished or session.last_activity > deadline:
+                continue
+            del self._sessions[robot_run_id]
+            for queue in session.subscribers:
+                if queue.full():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    async def subscribe(self, robot_run_id: int) -> AsyncIterator[dict]:
+        """
+        Yields the current state of the session and then every new event until the session is closed.
+        Subscribing before the decision starts is allowed; the stream waits for it (at most `idle_timeout`).
+        Callers only subscribe to decisions that exist, see main.decision_events().
+        """
+        self._expire_idle()
+        session = self._sessions.get(robot_run_id)
+        if session is None:
+            session = self._sessions[robot_run_id] = _Session()
+            # ends the stream if the decision never opens it; open() cancels this
+            session.cleanup = asyncio.get_running_loop().call_later(self.idle_timeout + 1, self._expire_idle)
+        queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        finished = session.finished
+        if not finished:
+            # registered before the replay: events published while the caller consumes it must not be lost
+            session.subscribers.append(queue)
+        try:
+            replayed = set()
+            for event in sorted(session.snapshot.values(), key=lambda e: e["time"]):
+                replayed.add((event["type"], event["time"]))
+                yield event
+            if finished:
+                return
+            while True:
+                event = await queue.get()
+                if event is None:
+                    return
+                if (event["type"], event["time"]) in replayed:
+                    continue  # already sent with the snapshot
+                yield event
+        finally:
+            current = self._sessions.get(robot_run_id)
+            if current is not None and queue in current.subscribers:
+                current.subscribers.remove(queue)
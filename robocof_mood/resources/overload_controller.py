@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass, asdict
+from typing import Callable
+
+from robocof_mood.tracing import tracer, log
+
+
+@dataclass(frozen=True)
+class QualityTier:
+    """How much work the recognizers may do per frame."""
+
+    level: int
+    name: str
+    seat_size: int  # YOLO input size of the full-frame seat pass
+    seat_interval: float  # extra seconds between seat inferences
+    gesture_interval: float  # extra seconds between gesture inferences
+    face_enabled: bool
+    decode_reduction: int  # 1, 2 or 4: JPEGs are decoded at 1/n of their size
+
+
+# Ordered from full quality to the most degraded. Seat and face evidence only explain a timeout, so they are
+# shed first; gesture recognition decides the outcome and keeps its frame rate until the last tier.
+# The reduced decode is shared by all recognizers, so from "low" on gestures also see half-size frames: this
+# trades hand detection range (MediaPipe downsamples to 192 px for palm detection anyway, so only hands far
+# from the camera are lost) for not decoding every JPEG twice.
+QUALITY_TIERS = (
+    QualityTier(0, "full", 720, 0.0, 0.0, True, 1),
+    QualityTier(1, "reduced", 512, 0.2, 0.0, False, 1),
+    QualityTier(2, "low", 416, 0.5, 0.0, False, 2),
+    QualityTier(3, "gesture-first", 320, 1.0, 0.05, False, 2),
+)
+
+# Event-loop lag (s) above which the service counts as saturated, and below which it counts as healthy.
+# Inference that runs on the loop itself (in-process recognizers) is not counted as lag, see observe()
+LAG_HIGH = 0.1
+LAG_LOW = 0.03
+# Inference latency (s) per recognizer above which it counts as saturated
+DEFAULT_LATENCY_BUDGETS = {"seat": 0.5, "gesture": 0.12, "face": 0.6}
+# EMA weight of a new sample
+SMOOTHING = 0.3
+
+
+class OverloadController:
+    """
+    Watches event-loop lag and per-recognizer inference latency and steps the quality tier down when the
+    service is saturated, and back up once it has been healthy for `recover_after` seconds. The recognizers
+    read `tier` on every iteration, so all running decision sessions follow the change right away.
+    """
+
+    def __init__(
+        self,
+        tiers: tuple[QualityTier, ...] = QUALITY_TIERS,
+        latency_budgets: dict[str, float] | None = None,
+        interval: float = 0.25,
+        step_down_after: int = 3,
+        recover_after: float = 5.0,
+        settle: float = 1.0,
+    ):
+        """Constructor
+
+        Args:
+            tiers (tuple[QualityTier, ...], optional): Tiers from best to most degraded. Defaults to QUALITY_TIERS.
+            latency_budgets (dict[str, float] | None, optional): Saturation latency per recognizer. Defaults to DEFAULT_LATENCY_BUDGETS.
+            interval (float, optional): Seconds between load samples. Defaults to 0.25.
+            step_down_after (int, optional): Consecutive saturated samples before stepping down. Defaults to 3.
+            recover_after (float, optional): Healthy seconds before stepping up again. Defaults to 5.0.
+            settle (float, optional): Seconds after a change before the next one, so the averages catch up. Defaults to 1.0.
+        """
+        self.tiers = tiers
+        self.latency_budgets = dict(latency_budgets or DEFAULT_LATENCY_BUDGETS)
+        self.interval = interval
+        self.step_down_after = step_down_after
+        self.recover_after = recover_after
+        self.settle = settle
+
+        self.level = 0
+        self.loop_lag = 0.0
+        self.latencies: dict[str, float] = {}
+        # seconds the loop spent in in-process inference since the last lag sample
+        self._inference_on_loop = 0.0
+        self.changes = 0
+        self._saturated_samples = 0
+        self._healthy_since: float | None = None
+        self._changed_at = time.monotonic()
+        self._listeners: list[Callable[[QualityTier], None]] = []
+        self._task: asyncio.Task | None = None
+
+    @property
+    def tier(self) -> QualityTier:
+        return self.tiers[self.level]
+
+    def add_listener(self, listener: Callable[[QualityTier], None]):
+        """Calls `listener` with the new tier on every change."""
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[QualityTier], None]):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def observe(self, kind: str, seconds: float, on_loop: bool = False):
+        """
+        Reports the duration of one inference of recognizer `kind`.
+
+        Args:
+            kind (str): "seat", "gesture" or "face".
+            seconds (float): Duration of the inference.
+            on_loop (bool, optional): The inference blocked the event loop (in-process recognizer). That time is
+                the recognizer's own work, not a sign of saturation, and is left out of the loop lag. Defaults to False.
+        """
+        if on_loop:
+            self._inference_on_loop += seconds
+        previous = self.latencies.get(kind)
+        self.latencies[kind] = seconds if previous is None else (1 - SMOOTHING) * previous + SMOOTHING * seconds
+
+    # ------------------------------------------------------------------ #
+    # monitor
+    # ------------------------------------------------------------------ #
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._monitor(), name="overload monitor")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _monitor(self):
+        while True:
+            t0 = time.monotonic()
+            self._inference_on_loop = 0.0
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - t0 - self.interval - self._inference_on_loop)
+            self.loop_lag = (1 - SMOOTHING) * self.loop_lag + SMOOTHING * lag
+            self.evaluate()
+
+    def evaluate(self):
+        """Steps the tier down or up based on the current averages."""
+        now = time.monotonic()
+        over_budget = [
+            kind for kind, latency in self.latencies.items()
+            if latency > self.latency_budgets.get(kind, float("inf"))
+        ]
+        saturated = self.loop_lag > LAG_HIGH or bool(over_budget)
+        healthy = self.loop_lag < LAG_LOW and all(
+            latency < 0.6 * self.latency_budgets.get(kind, float("inf")) for kind, latency in self.latencies.items()
+        )
+
+        self._saturated_samples = self._saturated_samples + 1 if saturated else 0
+        if not healthy:
+            self._healthy_since = None
+        elif self._healthy_since is None:
+            self._healthy_since = now
+
+        if now - self._changed_at < self.settle:
+            return
+        if self._saturated_samples >= self.step_down_after and self.level < len(self.tiers) - 1:
+            self._set_level(self.level + 1, f"lag {self.loop_lag * 1000:.0f} ms, over budget: {over_budget or '-'}")
+        elif (
+            self._healthy_since is not None
+            and now - self._healthy_since >= self.recover_after
+            and self.level > 0
+        ):
+            self._set_level(self.level - 1, "load dropped")
+
+    def _set_level(self, level: int, reason: str):
+        old = self.tier
+        self.level = level
+        self.changes += 1
+        self._changed_at = time.monotonic()
+        self._saturated_samples = 0
+        self._healthy_since = None
+        # latencies measured at the old tier say little about the new one
+        self.latencies.clear()
+        log.warning("overload.tier", "quality tier changed", old=old.name, new=self.tier.name, reason=reason)
+        tracer.instant("quality tier", tier=self.tier.name, reason=reason)
+        for listener in list(self._listeners):
+            listener(self.tier)
+
+    def stats(self) -> dict:
+        """Current tier and load signals, for the metrics endpoint."""
+        return {
+            "tier": asdict(self.tier),
+            "loop_lag_ms": round(self.loop_lag * 1000, 1),
+            "latency_ms": {kind: round(latency * 1000, 1) for kind, latency in self.latencies.items()},
+            "tier_changes": self.changes,
+            "seconds_in_tier": round(time.monotonic() - self._changed_at, 1),
+        }
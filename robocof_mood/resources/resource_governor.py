@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import os
+import sys
+import threading
+from dataclasses import dataclass
+
+import cv2
+
+from robocof_mood.tracing import log
+
+
+# Share of the CPUs each backend gets; "capture" is OpenCV (JPEG decode and preprocessing)
+DEFAULT_WEIGHTS = {"seat": 0.5, "gesture": 0.25, "face": 0.15, "capture": 0.1}
+# read by OpenMP / BLAS when torch, dlib or numpy start their pools, i.e. on first import
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+
+@dataclass
+class ThreadBudget:
+    threads: int
+    cpus: list[int]
+
+
+def parse_cpu_list(spec: str) -> list[int]:
+    """Parses a CPU list like "0-3,6" (as in taskset / cgroups)."""
+    cpus = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-")
+            cpus.extend(range(int(first), int(last) + 1))
+        else:
+            cpus.append(int(part))
+    return sorted(set(cpus))
+
+
+def available_cpus() -> list[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def apply_thread_budget(threads: int, cpus: list[int] | None = None):
+    """
+    Limits the thread pools of the current process: torch intra-op threads (if torch is loaded already,
+    otherwise through OMP_NUM_THREADS when it is), OpenCV, OpenMP / BLAS, and optionally pins the process.
+    """
+    threads = max(1, int(threads))
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+    cv2.setNumThreads(threads)
+    torch = sys.modules.get("torch")  # never import torch just for this
+    if torch is not None:
+        torch.set_num_threads(threads)
+    if cpus and hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, cpus)
+        except OSError as exc:
+            log.warning("resources.pin_failed", "could not pin to CPUs", cpus=sorted(cpus), error=str(exc))
+
+
+class ResourceGovernor:
+    """
+    Splits the host's CPUs between the inference backends so torch, MediaPipe, dlib and OpenCV do not each
+    start one thread per core and oversubscribe the robot host.
+
+    Every backend gets a thread budget proportional to its weight, divided by the number of concurrently
+    running decisions; the budgets are re-applied whenever a decision starts or finishes. In worker mode each
+    recognizer process gets its own budget and, with `pin`, its own slice of the CPUs. In-process, budgets
+    are process-wide: torch follows the seat budget and OpenCV the capture budget. MediaPipe does not expose
+    its thread count, so it is only contained by pinning its worker process.
+    """
+
+    def __init__(
+        self,
+        cpus: list[int] | None = None,
+        weights: dict[str, float] | None = None,
+        pin: bool = False,
+    ):
+        """Constructor
+
+        Args:
+            cpus (list[int] | None, optional): CPUs the service may use. Defaults to the current affinity.
+            weights (dict[str, float] | None, optional): CPU share per backend. Defaults to DEFAULT_WEIGHTS.
+            pin (bool, optional): Pin worker processes to disjoint CPU slices (the service to `cpus`). Defaults to False.
+        """
+        self.cpus = sorted(cpus) if cpus else available_cpus()
+        self.weights = dict(weights or DEFAULT_WEIGHTS)
+        self.pin = pin
+        self._sessions = 0
+        self._workers: dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def budgets(self, sessions: int | None = None) -> dict[str, ThreadBudget]:
+        """Thread budget and CPU slice per backend for `sessions` concurrent decisions."""
+        sessions = max(1, self._sessions if sessions is None else sessions)
+        n = len(self.cpus)
+        total = sum(self.weights.values())
+        budgets = {}
+        start = 0
+        for kind, weight in self.weights.items():
+            share = weight / total * n
+            size = max(1, round(share))
+            if start + size > n:
+                start = max(0, n - size)  # not enough CPUs for disjoint slices, share the last ones
+            budgets[kind] = ThreadBudget(
+                threads=max(1, int(share / sessions)),
+                cpus=self.cpus[start:start + size],
+            )
+            start += size
+        return budgets
+
+    def options_for(self, kind: str) -> dict:
+        """Worker options that make a freshly spawned worker process start within its budget."""
+        budget = self.budgets()[kind]
+        return {"threads": budget.threads, "cpus": budget.cpus if self.pin else None}
+
+    def register_worker(self, kind: str, worker):
+        with self._lock:
+            self._workers[kind] = worker
+
+    def session_started(self):
+        with self._lock:
+            self._sessions += 1
+        self.apply()
+
+    def session_finished(self):
+        with self._lock:
+            self._sessions = max(0, self._sessions - 1)
+        self.apply()
+
+    def apply(self):
+        """Applies the current budgets to this process and all registered workers."""
+        with self._lock:
+            budgets = self.budgets()
+            workers = dict(self._workers)
+        # torch runs in this process unless the seat recognizer has its own worker
+        apply_thread_budget(budgets["capture" if "seat" in workers else "seat"].threads)
+        cv2.setNumThreads(budgets["capture"].threads)
+        for kind, worker in workers.items():
+            budget = budgets[kind]
+            worker.configure(budget.threads, budget.cpus if self.pin else None)
+
+    def pin_service(self):
+        """Restricts the whole service to `cpus` (called once at start-up, before the model pools exist)."""
+        if self.pin and hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, self.cpus)
@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+
+from robocof_mood.tracing import log
+
+
+# Exponential moving average weight of a new chair observation
+EMA_WEIGHT = 0.3
+# Observations needed before the prior is trusted for region-of-interest detection
+MIN_OBSERVATIONS = 3
+# Learned chair area * MIN_SIZE_FACTOR replaces the fixed min_size of 10000 px^2
+MIN_SIZE_FACTOR = 0.4
+# Learned chair height * CENTROID_FACTOR replaces the fixed 190 px centroid distance
+# (a ~300 px high chair, typical at desk distance, gives the old value)
+CENTROID_FACTOR = 0.63
+# ROI = chair box grown by ROI_MARGIN * box size on every side
+ROI_MARGIN = 0.75
+# Desks get rearranged; forget priors that were not confirmed for this long
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 512
+
+
+@dataclass
+class DeskPrior:
+    """What we learned about one desk: where its chair is in the camera frame and how big it is."""
+
+    desk_id: str
+    chair_box: tuple[float, float, float, float]  # xmin, ymin, xmax, ymax
+    frame_shape: tuple[int, int]  # height, width
+    observations: int = 1
+    updated: float = 0.0
+
+    def update(self, chair_box: tuple[float, float, float, float], frame_shape: tuple[int, int]):
+        """Blend in a new chair observation; a different camera resolution starts over."""
+        if tuple(frame_shape) != tuple(self.frame_shape):
+            self.chair_box = tuple(chair_box)
+            self.frame_shape = tuple(frame_shape)
+            self.observations = 1
+        else:
+            self.chair_box = tuple(
+                (1 - EMA_WEIGHT) * old + EMA_WEIGHT * new for old, new in zip(self.chair_box, chair_box)
+            )
+            self.observations += 1
+        self.updated = time.time()
+
+    def is_trusted(self) -> bool:
+        return self.observations >= MIN_OBSERVATIONS
+
+    @property
+    def min_size(self) -> float:
+        xmin, ymin, xmax, ymax = self.chair_box
+        return MIN_SIZE_FACTOR * (xmax - xmin) * (ymax - ymin)
+
+    @property
+    def centroid_threshold(self) -> float:
+        _, ymin, _, ymax = self.chair_box
+        return CENTROID_FACTOR * (ymax - ymin)
+
+    def scaled(self, scale: float) -> DeskPrior:
+        """The prior for frames decoded at `scale` of the resolution it was learned at (reduced JPEG decode)."""
+        h, w = self.frame_shape
+        return DeskPrior(
+            self.desk_id,
+            tuple(v * scale for v in self.chair_box),
+            # libjpeg rounds the reduced size up
+            (math.ceil(h * scale), math.ceil(w * scale)),
+            self.observations,
+            self.updated,
+        )
+
+    def roi(self) -> tuple[int, int, int, int]:
+        """Region of interest (x0, y0, x1, y1) around the learned chair, clipped to the frame."""
+        xmin, ymin, xmax, ymax = self.chair_box
+        h, w = self.frame_shape
+        mx = ROI_MARGIN * (xmax - xmin)
+        my = ROI_MARGIN * (ymax - ymin)
+        return (
+            max(0, int(xmin - mx)),
+            max(0, int(ymin - my)),
+            min(w, int(xmax + mx)),
+            min(h, int(ymax + my)),
+        )
+
+
+class DeskPriorCache:
+    """
+    Per-desk calibration cache for the seat recognizer, keyed by the desk id passed to /decision.
+
+    Bounded (least recently used entries are evicted first) and entries expire `ttl` seconds after
+    their last update. Optionally persisted as JSON so priors survive restarts.
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        ttl: float = DEFAULT_TTL,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        """Constructor
+
+        Args:
+            path (str | None, optional): JSON file to load from and save to. None keeps the cache in memory. Defaults to None.
+            ttl (float, optional): Seconds after which an entry is considered stale. Defaults to DEFAULT_TTL.
+            max_entries (int, optional): Maximum number of desks to remember. Defaults to DEFAULT_MAX_ENTRIES.
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, DeskPrior] = OrderedDict()
+        self._lock = threading.Lock()
+        # save() runs in threads; one writer of the temporary file at a time
+        self._save_lock = threading.Lock()
+        if path is not None:
+            self.load()
+
+    def get(self, desk_id: str) -> DeskPrior | None:
+        """Returns the prior for `desk_id`, or None if unknown or stale."""
+        with self._lock:
+            prior = self._entries.get(desk_id)
+            if prior is None:
+                return None
+            if time.time() - prior.updated > self.ttl:
+                del self._entries[desk_id]
+                return None
+            self._entries.move_to_end(desk_id)
+            return prior
+
+    def update(self, desk_id: str, chair_box, frame_shape: tuple[int, int]) -> DeskPrior:
+        """Adds a chair observation for `desk_id`, creating the entry if needed."""
+        with self._lock:
+            prior = self._entries.get(desk_id)
+            if prior is None or time.time() - prior.updated > self.ttl:
+                prior = DeskPrior(desk_id, tuple(chair_box), tuple(frame_shape), updated=time.time())
+                self._entries[desk_id] = prior
+            else:
+                prior.update(chair_box, frame_shape)
+            self._entries.move_to_end(desk_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return prior
+
+    def invalidate(self, desk_id: str):
+        """Forget a desk, e.g. after it was rearranged."""
+        with self._lock:
+            self._entries.pop(desk_id, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                records = json.load(f)
+        except (OSError, json.JSONDecodeError) as exc:
+            log.warning("desk_priors.load_failed", "could not load desk priors", path=self.path, error=exc)
+            return
+        if not isinstance(records, list):
+            log.warning("desk_priors.load_failed", "desk priors file is not a list", path=self.path)
+            return
+        priors = []
+        for index, r in enumerate(records):
+            try:
+                priors.append(self._parse(r))
+            except (KeyError, TypeError, ValueError) as exc:
+                # one damaged record must not cost the others (or the service start)
+                log.warning("desk_priors.bad_record", "skipping desk prior", path=self.path, index=index,
+                            error=f"{type(exc).__name__}: {exc}")
+        now = time.time()
+        with self._lock:
+            for prior in sorted(priors, key=lambda p: p.updated):
+                if now - prior.updated <= self.ttl:
+                    self._entries[prior.desk_id] = prior
+
+    @staticmethod
+    def _parse(record: dict) -> DeskPrior:
+        """A DeskPrior from one saved record; raises KeyError / TypeError / ValueError if it is malformed."""
+        chair_box = tuple(float(v) for v in record["chair_box"])
+        frame_shape = tuple(int(v) for v in record["frame_shape"])
+        if len(chair_box) != 4 or len(frame_shape) != 2:
+            raise ValueError(f"chair_box {chair_box} / frame_shape {frame_shape}")
+        return DeskPrior(
+            str(record["desk_id"]), chair_box, frame_shape, int(record["observations"]), float(record["updated"]),
+        )
+
+    def save(self):
+        if self.path is None:
+            return
+        with self._lock:
+            records = [asdict(p) for p in self._entries.values()]
+        tmp_path = self.path + ".tmp"
+        with self._save_lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(records, f)
+            os.replace(tmp_path, self.path)
@@ -1,5 +1,4 @@
 import math
-import torch
 import cv2
 import json
 import warnings
@@ -8,10 +7,22 @@ from collections import Counter
 
 
 import asyncio
+import time
 from time import sleep
 from enum import Enum
 from robocof_mood.input_stream.input_stream import InputStream
 from robocof_mood.input_stream.webcam_input_stream import WebcamInputStream
+from robocof_mood.input_stream.change_detector import ChangeDetector
+from robocof_mood.lazy_import import lazy_import
+from robocof_mood.workers.recognizer_worker import RecognizerWorker, WorkerCrashedError
+from robocof_mood.seat_recognition.desk_prior_cache import DeskPrior, DeskPriorCache
+from robocof_mood.perception.unified_detector import UnifiedDetector, PerceptionResult
+from robocof_mood.tracing import tracer, log
+from robocof_mood.resources.overload_controller import OverloadController
+from robocof_mood.sessions.cancellation import CancellationToken
+
+# torch (and pandas through the YOLO results) is only imported once a SeatRecognizer is created
+torch = lazy_import("torch")
 
 
 #TODO: store model locally,
@@ -32,35 +43,257 @@ class SeatStatus(Enum):
     SEAT_OCCUPIED = 3
 
 
+# Scene-change gate: chairs and people only need a new YOLO pass on larger changes
+GATE_MEAN_THRESHOLD = 6.0
+GATE_CELL_THRESHOLD = 40.0
+GATE_MAX_SKIP_SECONDS = 2.0
+
+# YOLO input size for the full frame and for the cached region around a known desk's chair
+FULL_SIZE = 720
+ROI_SIZE = 320
+# YOLO confidence threshold of the NMS and maximum number of boxes kept per frame
+CONFIDENCE = 0.25
+MAX_DETECTIONS = 20
+#minimum size of bounding box for chair (to avoid background chairs). currently chosen arbitrarily
+MIN_CHAIR_SIZE = 10000
+# person centroid this far (px) from the chair centroid counts as not sitting on it
+CENTROID_THRESHOLD = 190
+# Adaptive resolution: cheap passes tried before the full size, a pass is only repeated at the next
+# scale if its result is ambiguous (see is_ambiguous)
+ADAPTIVE_SCALES = (320, 480)
+# a chair with an area in this range (factor of min_size) is close to the cutoff
+AMBIGUOUS_SIZE_RANGE = (0.6, 1.6)
+# a person this close (factor of the centroid threshold) to the threshold might be sitting or not
+AMBIGUOUS_CENTROID_MARGIN = 0.2
+# a reduced pass that sees an empty seat misses small or distant people first: its result is confirmed at the
+# full size unless the last full-size pass (at most this many seconds ago) saw an empty seat too
+EMPTY_RECHECK_SECONDS = 1.0
+
+
+class ScaleStats:
+    """Per-scale latency and escalation rate of the adaptive seat inference."""
+
+    def __init__(self):
+        self.frames = 0
+        self.escalated = 0
+        self.runs = Counter()
+        self.seconds = Counter()
+
+    def record(self, passes: list[tuple[int, float]]):
+        """Adds the (size, seconds) passes that were needed for one frame."""
+        self.frames += 1
+        if len(passes) > 1:
+            self.escalated += 1
+        for size, seconds in passes:
+            self.runs[size] += 1
+            self.seconds[size] += seconds
+
+    def summary(self) -> dict:
+        return {
+            "frames": self.frames,
+            "escalation_rate": round(self.escalated / self.frames, 3) if self.frames else None,
+            "scales": {
+                size: {"runs": runs, "mean_ms": round(self.seconds[size] / runs * 1000, 1)}
+                for size, runs in sorted(self.runs.items())
+            },
+        }
+
+
+# YOLOv5 model shared by all SeatRecognizers of the process
+_model = None
+
+
+def load_model():
+    """Loads and configures YOLOv5 on first use, later calls return the same model.
+
+    Inference only reads the weights, so the recognizers of one process, and pre-forked worker processes
+    (copy-on-write), share a single copy.
+    """
+    global _model
+    if _model is not None:
+        return _model
+    # Loading Model
+    model = torch.hub.load('ultralytics/yolov5', 'yolov5s')
+
+    # Configuring Model
+    model.cpu()  # .cpu() ,or .cuda()
+    model.conf = CONFIDENCE  # NMS confidence threshold
+    model.iou = 0.45  # NMS IoU threshold
+    model.agnostic = False  # NMS class-agnostic
+    model.multi_label = False  # NMS multiple labels per box
+    # (optional list) filter by class, i.e. = [0, 15, 16] for COCO persons, cats and dogs
+    model.classes = [0, 56]
+    model.max_det = MAX_DETECTIONS  # maximum number of detections per image
+    model.amp = False  # Automatic Mixed Precision (AMP) inference
+    _model = model
+    return model
+
+
 class SeatRecognizer:
-    def __init__(self, input_stream: InputStream):
+    def __init__(
+        self,
+        input_stream: InputStream,
+        motion_gating: bool = True,
+        worker: RecognizerWorker | None = None,
+        detector: UnifiedDetector | None = None,
+        overload: OverloadController | None = None,
+        max_frame_age: float | None = None,
+        with_model: bool = True,
+    ):
         self.__input_stream = input_stream
-        #Save and load the initialized model: If you're calling it repeatedly, warm it once and serialize with torch.save(model.state_dict()) or TorchScript.
-        #debug mode?
-               # Loading Model
-        self.model = torch.hub.load('ultralytics/yolov5', 'yolov5s')
-
-
-        # Configuring Model
-        self.model.cpu()  # .cpu() ,or .cuda()
-        self.model.conf = 0.25  # NMS confidence threshold
-        self.model.iou = 0.45  # NMS IoU threshold
-        self.model.agnostic = False  # NMS class-agnostic
-        self.model.multi_label = False  # NMS multiple labels per box
-        # (optional list) filter by class, i.e. = [0, 15, 16] for COCO persons, cats and dogs
-        self.model.classes = [0, 56]
-        self.model.max_det = 20  # maximum number of detections per image
-        self.model.amp = False  # Automatic Mixed Precision (AMP) inference
-
-        #counter
+        # frames older than this (seconds since capture) are rejected, None accepts every frame
+        self.max_frame_age = max_frame_age
+        self.stale_frames = 0
+        # capture time of the last frame counted in seatStatus_counter
+        self.last_frame_time: float | None = None
+        # quality tier (YOLO size, inference rate) under load, see OverloadController
+        self.overload = overload
+        # stop signal of a start() loop started without a token, see stop()
+        self.__cancel: CancellationToken | None = None
+        # skip YOLO on frames that look like the last inferred one
+        self.change_detector = ChangeDetector(
+            GATE_MEAN_THRESHOLD, GATE_CELL_THRESHOLD, grid=16, max_skip_seconds=GATE_MAX_SKIP_SECONDS
+        ) if motion_gating else None
+        #counter: camera frames per status, so the vote is weighted by time, see __count()
         self.seatStatus_counter = Counter()
-            
+        self.__last_status: SeatStatus | None = None
+        self.__counted_seq: int | None = None
+        # desk being looked at and the cache of learned chair locations, see set_desk()
+        self.__desk_id: str | None = None
+        self.__desk_cache: DeskPriorCache | None = None
+        self.last_chair_box = None
+        # adaptive resolution: scales used for the last frame and statistics over all frames
+        self.adaptive = True
+        self.last_passes: list[tuple[int, float]] = []
+        self.scale_stats = ScaleStats()
+        # (status, time.monotonic()) of the last pass at the full size, see needs_full_size()
+        self.__last_full_size: tuple[SeatStatus, float] | None = None
+        # called with the seat-status distribution after every inferred frame, e.g. for live progress
+        self.listener = None
+
+        self.__worker = worker
+        # single-pass detector shared with gesture and face recognition, see latest_perception
+        self.detector = detector
+        self.latest_perception: PerceptionResult | None = None
+        self.model = None
+        if worker is not None or detector is not None or not with_model:
+            # inference runs in the worker process or the unified detector, or the caller only classifies
+            # detections it already has (see benchmarks/evaluation.py): no YOLOv5 needed
+            return
+
+        # loaded once per process; a pre-forked worker inherits the parent's copy, see serving/prefork.py
+        self.model = load_model()
+
+
+    def recognize(
+        self,
+        frame,
+        model,
+        rgb: bool = False,
+        prior: DeskPrior | None = None,
+        size: int = FULL_SIZE,
+        scale: float = 1.0,
+    ):
+        """
+        Classifies the seat in `frame`. The largest chair found is kept in `last_chair_box`.
+
+        Args:
+            frame: The captured frame.
+            model: The YOLOv5 model.
+            rgb (bool, optional): True if `frame` is already RGB. Defaults to False.
+            prior (DeskPrior | None, optional): Learned chair location of this desk (at full resolution). If trusted,
+                detection runs on a region around the chair at ROI_SIZE instead of the full frame at FULL_SIZE.
+            size (int, optional): YOLO input size, lowered under load. Defaults to FULL_SIZE.
+            scale (float, optional): Size of `frame` relative to the camera resolution (reduced JPEG decode),
+                scales the fixed pixel thresholds and the prior. Defaults to 1.0.
+        """
+        # frames captured with rgb=True are already converted by the input stream
+        image = frame if rgb else cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        if prior is not None and scale != 1.0:
+            # priors are learned on full-resolution frames: ROI and thresholds in the reduced frame's pixels
+            prior = prior.scaled(scale)
+        trusted = prior is not None and prior.is_trusted() and tuple(image.shape[:2]) == tuple(prior.frame_shape)
+
+        if self.detector is not None:
+            # one full-frame pass serves seat, gesture and face; the prior only contributes its thresholds
+            perception = self.detector.detect(image, rgb=True, size=min(size, self.detector.imgsz))
+            self.latest_perception = perception
+            if trusted:
+                return self.classify(perception.chairs, perception.persons, prior.min_size, prior.centroid_threshold)
+            return self.classify(perception.chairs, perception.persons, MIN_CHAIR_SIZE * scale ** 2, CENTROID_THRESHOLD * scale)
 
+        if trusted:
+            x0, y0, x1, y1 = prior.roi()
+            chairs, persons = self.detect(image[y0:y1, x0:x1], model, size=min(ROI_SIZE, size), offset=(x0, y0))
+            status = self.classify(chairs, persons, prior.min_size, prior.centroid_threshold)
+            if self.last_chair_box is not None:
+                return status
+            # chair not where we expected it (moved or occluded): fall back to the full frame
 
-    def recognize(self, frame, model):
-        image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        min_size, centroid_threshold = MIN_CHAIR_SIZE * scale ** 2, CENTROID_THRESHOLD * scale
+        sizes = [s for s in ADAPTIVE_SCALES if s < size] + [size] if self.adaptive else [size]
+        passes = []
+        for pass_size in sizes:
+            # low resolution first, the full size only for ambiguous frames
+            t0 = time.perf_counter()
+            with tracer.span("seat.detect", size=pass_size):
+                chairs, persons = self.detect(image, model, size=pass_size)
+            status = self.classify(chairs, persons, min_size, centroid_threshold)
+            passes.append((pass_size, time.perf_counter() - t0))
+            if pass_size == size:
+                self.__last_full_size = (status, time.monotonic())
+            elif not (
+                self.is_ambiguous(status, chairs, persons, min_size, centroid_threshold)
+                or self.needs_full_size(status, prior_expects_chair=trusted)
+            ):
+                break
+        self.last_passes = passes
+        self.scale_stats.record(passes)
+        return status
+
+    def is_ambiguous(self, status, df_chair, df_person, min_size: float, centroid_threshold: float) -> bool:
+        """
+        True if a higher resolution could change the result: UNSURE, a chair close to the `min_size` cutoff,
+        or a person close to the centroid threshold of the chosen chair. Empty results: see needs_full_size().
+        """
+        if status == SeatStatus.UNSURE:
+            return True
+        low, high = AMBIGUOUS_SIZE_RANGE
+        for box in df_chair:
+            area = (box["xmax"] - box["xmin"]) * (box["ymax"] - box["ymin"])
+            if low * min_size <= area <= high * min_size:
+                return True
+        if self.last_chair_box is not None:
+            xmin, ymin, xmax, ymax = self.last_chair_box
+            chair_centroid = ((xmin + xmax) / 2.0, (ymin + ymax) / 2.0)
+            for box in df_person:
+                person_centroid = ((box["xmin"] + box["xmax"]) / 2.0, (box["ymin"] + box["ymax"]) / 2.0)
+                if abs(math.dist(chair_centroid, person_centroid) - centroid_threshold) <= AMBIGUOUS_CENTROID_MARGIN * centroid_threshold:
+                    return True
+        return False
+
+    def needs_full_size(self, status, prior_expects_chair: bool = False) -> bool:
+        """
+        True if the empty result of a reduced pass has to be confirmed at the full size: no full-size result yet,
+        the last one saw somebody (or was unsure) or is older than EMPTY_RECHECK_SECONDS, or the desk's trusted
+        prior expects a chair the reduced pass did not find.
+        """
+        if status not in (SeatStatus.SEAT_EMPTY, SeatStatus.NO_CHAIRS_NO_PEOPLE):
+            return False
+        if prior_expects_chair or self.__last_full_size is None:
+            return True
+        last_status, at = self.__last_full_size
+        if last_status not in (SeatStatus.SEAT_EMPTY, SeatStatus.NO_CHAIRS_NO_PEOPLE):
+            return True
+        return time.monotonic() - at > EMPTY_RECHECK_SECONDS
+
+    def detect(self, image, model, size: int = FULL_SIZE, offset: tuple[int, int] = (0, 0)):
+        """
+        Runs YOLO on `image` and returns (chairs, persons) as lists of dicts with xmin, ymin, xmax, ymax, ...
+        Boxes are shifted by `offset` (x, y), so detections on a crop are in full-frame coordinates.
+        """
         # Inference
-        results = model(image, size=720)  # includes NMS
+        results = model(image, size=size)  # includes NMS
 
         # Results
         # results.print()  # .print() , .show(), .save(), .crop(), .pandas(), etc.
@@ -80,10 +313,28 @@ class SeatRecognizer:
         json_chair = df_chair.to_json(orient="records")
         df_person = json.loads(json_person)
         df_chair = json.loads(json_chair)
-        
+
+        dx, dy = offset
+        if dx or dy:
+            for box in df_chair + df_person:
+                box["xmin"] += dx
+                box["xmax"] += dx
+                box["ymin"] += dy
+                box["ymax"] += dy
+        return df_chair, df_person
+
+    def classify(
+        self,
+        df_chair,
+        df_person,
+        min_size: float = MIN_CHAIR_SIZE,
+        centroid_threshold: float = CENTROID_THRESHOLD,
+    ):
+        """Decides the SeatStatus from the detected chairs and persons."""
+        self.last_chair_box = None
+
         # Accessing each individual object and then getting its xmin, ymin, xmax and ymax to calculate its centroid
         
-        min_size = 10000 #minimum size of bounding box for chair (to avoid background chairs). currently chosen arbitrarily
         big_chair = [min_size, 0, 0] #min_size, bottom left corner, top right corner
         flag = False
         for objects in df_chair:
@@ -106,6 +357,7 @@ class SeatRecognizer:
             ymin_chair = big_chair[1][1]
             xmax_chair = big_chair[2][0]
             ymax_chair = big_chair[2][1]
+            self.last_chair_box = (xmin_chair, ymin_chair, xmax_chair, ymax_chair)
             cx_chair = int((xmin_chair+xmax_chair)/2.0)
             cy_chair = int((ymin_chair+ymax_chair)/2.0)
             
@@ -128,7 +380,7 @@ class SeatRecognizer:
                 #print(c1 , c2)
                 #print("......")
                 
-                if (centroid_dist >= 190): 
+                if (centroid_dist >= centroid_threshold): 
                     #cv2.rectangle(image, (int(c1[0]), int(c1[1])), (int(c2[0]), int(c2[1])), (0, 150, 0), 2)
                     #cv2.putText(image, 'Empty', (int(c1[0]), int(c1[1]-10)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 150, 0), 2)
                     return self.parse_result([big_chair, df_person, True])
@@ -157,29 +409,120 @@ class SeatRecognizer:
         else:
             return SeatStatus.NO_CHAIRS_NO_PEOPLE
 
-    async def start(self):
+    async def start(self, token: CancellationToken | None = None):
         """
         Starts check for seats and people
 
+        Args:
+            token (CancellationToken | None, optional): Stop signal of the decision session this loop belongs to;
+                cancelling it ends the loop and drops its requests queued in the worker process, without touching
+                the loops of other sessions. Defaults to None (a token of its own, cancelled by stop()).
+
         Returns:
             SeatStatus code corresponding to the specific scenario
         """
- 
-        
-        while True:
-            frame = self.__input_stream.capture_frame()
+        if token is None:
+            token = self.__cancel = CancellationToken()
+
+        while not token.cancelled:
+            frame = self.__input_stream.capture_frame(rgb=True)
             if frame is None:
-                print("[Seat-detection]: Failed to capture image.")
+                log.warning("capture.failed", "Failed to capture image", recognizer="seat")
+                # wait for the stream instead of spinning on the event loop
+                await asyncio.sleep(0.01)
                 continue
-        
-            status = self.recognize(frame, self.model)
-            print(status)
-            self.seatStatus_counter[status] += 1
-            # yield control to allow other tasks to run
-            await asyncio.sleep(0.01)
+            frame_time = self.__input_stream.captured_time
+            age = self.__input_stream.captured_age()
+            if self.max_frame_age is not None and age is not None and age > self.max_frame_age:
+                # the stream stalled (reconnect, slow decode): do not count the same old frame again
+                self.stale_frames += 1
+                await asyncio.sleep(0.01)
+                continue
+
+            if self.change_detector is not None and not self.change_detector.needs_inference(frame):
+                # static scene: the last status still holds for this frame too
+                if self.__last_status is not None and self.__input_stream.frame_seq != self.__counted_seq:
+                    self.__count(self.__last_status, self.__input_stream.frame_seq)
+                    self.last_frame_time = frame_time
+                await asyncio.sleep(0.01)
+                continue
+
+            prior = None
+            if self.__desk_cache is not None and self.__desk_id is not None:
+                prior = self.__desk_cache.get(self.__desk_id)
+
+            tier = self.overload.tier if self.overload is not None else None
+            size = tier.seat_size if tier is not None else FULL_SIZE
+            # of the captured frame, not the stream's current setting: 1 for streams that always decode full size
+            reduction = self.__input_stream.captured_reduction
+            seq = self.__input_stream.frame_seq
+            t0 = time.perf_counter()
+            if self.__worker is not None:
+                try:
+                    with tracer.span("seat.infer", pid=self.__worker.pid, seq=seq, size=size):
+                        result = await self.__worker.infer(frame, token=token, prior=prior, size=size, scale=1 / reduction)
+                except WorkerCrashedError:
+                    continue  # the worker restarts itself, try again with a fresh frame
+                if result is None or token.cancelled:
+                    continue  # frame was overwritten before the worker read it, or stopped meanwhile
+                status, self.last_chair_box, passes = result
+                if passes:
+                    self.scale_stats.record(passes)
+            else:
+                with tracer.span("seat.infer", seq=seq, roi=prior is not None and prior.is_trusted(), size=size):
+                    status = self.recognize(frame, self.model, rgb=True, prior=prior, size=size, scale=1 / reduction)
+            if self.overload is not None:
+                self.overload.observe("seat", time.perf_counter() - t0, on_loop=self.__worker is None)
+
+            # chair boxes of reduced frames would reset the learned prior (different resolution)
+            if reduction == 1 and self.__desk_id is not None and self.__desk_cache is not None and self.last_chair_box is not None:
+                # learn the chair location of this desk incrementally
+                self.__desk_cache.update(self.__desk_id, self.last_chair_box, frame.shape[:2])
+            log.debug("seat.status", "Seat status", status=status.name, seq=seq)
+            self.__count(status, seq)
+            self.last_frame_time = frame_time
+            # yield control to allow other tasks to run (and less often under load)
+            await asyncio.sleep(0.01 + (tier.seat_interval if tier is not None else 0.0))
+
+    def __count(self, status: SeatStatus, seq: int):
+        """
+        Adds `status` for every camera frame since the last counted one: frames skipped by the change detector
+        or while YOLO ran keep the status, so a still scene weighs as much as a moving one over the same time.
+        """
+        frames = 1 if self.__counted_seq is None else max(1, seq - self.__counted_seq)
+        self.seatStatus_counter[status] += frames
+        self.__last_status = status
+        self.__counted_seq = seq
+        if self.listener is not None:
+            self.listener({"distribution": {s.name: n for s, n in self.seatStatus_counter.items()}})
+
+    def stop(self):
+        """Ends a start() loop that was started without a token (sessions cancel their own token instead)."""
+        if self.__cancel is not None:
+            self.__cancel.cancel()
             
                     
+    def set_desk(self, desk_id: str | None, cache: DeskPriorCache | None):
+        """Use (and keep learning) the chair prior of `desk_id` from `cache`. None disables the prior."""
+        self.__desk_id = desk_id
+        self.__desk_cache = cache
+
+    def reset(self):
+        """Forget the seat evidence collected so far, e.g. before a new decision."""
+        self.seatStatus_counter.clear()
+        self.__last_full_size = None
+        self.__last_status = None
+        self.__counted_seq = None
+        self.latest_perception = None
+        self.stale_frames = 0
+        self.last_frame_time = None
+        if self.change_detector is not None:
+            self.change_detector.reset()
+
     def output(self):
+        if not self.seatStatus_counter:
+            # no frame was evaluated yet
+            return SeatStatus.UNSURE
         return self.seatStatus_counter.most_common(1)[0][0]
 
 if __name__ == "__main__":
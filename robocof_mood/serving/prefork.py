@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import gc
+import os
+import signal
+import sys
+import time
+import traceback
+
+from robocof_mood.serving import process_stats
+from robocof_mood.tracing import log
+
+
+# one MJPEG feed per robot, e.g. ROBOCOF_ROBOT_STREAMS=http://192.168.137.204:8000/video_feed,http://192.168.137.205:8000/video_feed
+ROBOT_STREAMS = [url.strip() for url in os.getenv("ROBOCOF_ROBOT_STREAMS", "").split(",") if url.strip()]
+HOST = os.getenv("ROBOCOF_HOST", "0.0.0.0")
+# the worker of robot i listens on BASE_PORT + i
+BASE_PORT = int(os.getenv("ROBOCOF_BASE_PORT", "8000"))
+# seconds before a crashed worker is forked again
+RESTART_DELAY = 1.0
+
+
+def worker_path(path: str, index: int) -> str:
+    """Per-worker variant of a state file, e.g. desk_priors.json -> desk_priors.1.json."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{index}{ext}"
+
+
+def preload_shared():
+    """
+    Imports the app and the ML backends and loads the model weights in the parent process, once for all workers.
+
+    Only what is safe to fork is created here: YOLOv5's weights and the MediaPipe task file's bytes. The MediaPipe
+    task graph starts threads, so every worker builds its own from the shared bytes when it creates its recognizers.
+    """
+    from robocof_mood import main
+    from robocof_mood.lazy_import import preload
+    from robocof_mood.seat_recognition import seat_recognizer
+    from robocof_mood.gesture_recognition import gesture_recognizer
+
+    if main.WORKER_MODE:
+        log.info("prefork.worker_mode", "ROBOCOF_WORKER_MODE=1: the recognizer worker processes load their own models, nothing is shared")
+        return
+
+    # the weights must not be loaded with an OpenMP pool running, it would not survive the fork;
+    # every worker sets its own thread budget in the lifespan
+    seat_recognizer.torch.set_num_threads(1)
+    if main.UNIFIED_MODEL_PATH is None:
+        seat_recognizer.load_model()
+    preload(gesture_recognizer.mp, gesture_recognizer.python, gesture_recognizer.vision)
+    gesture_recognizer.load_model_asset()
+
+
+def _run_worker(index: int, stream_url: str, host: str, port: int):
+    """Body of a forked worker: serves the app for one robot."""
+    # the parent's handlers would signal the other workers
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    process_stats.reset_start()
+
+    import uvicorn
+    from robocof_mood import main
+
+    main.LIVESTREAM_URL = stream_url
+    # state files are written without cross-process locking, each worker keeps its own
+    main.DESK_PRIORS_PATH = worker_path(main.DESK_PRIORS_PATH, index)
+    main.CALLBACK_OUTBOX_PATH = worker_path(main.CALLBACK_OUTBOX_PATH, index)
+    uvicorn.run(main.app, host=host, port=port)
+
+
+def _fork_worker(index: int, stream_url: str, host: str, port: int) -> int:
+    pid = os.fork()
+    if pid != 0:
+        return pid
+    code = 1
+    try:
+        _run_worker(index, stream_url, host, port)
+        code = 0
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(code)
+
+
+def serve(streams: list[str], host: str = HOST, base_port: int = BASE_PORT):
+    """
+    Loads the models once, then forks one worker process per robot stream. The workers share the parent's
+    model memory copy-on-write; robot i's stream and decisions are handled by the worker on `base_port + i`,
+    so a robot's sessions always reach the worker that reads its camera. Crashed workers are forked again from
+    the warm parent, which takes a fraction of a cold start. Blocks until SIGINT / SIGTERM.
+
+    Args:
+        streams (list[str]): MJPEG feed URL of every robot.
+        host (str, optional): Interface the workers listen on. Defaults to HOST.
+        base_port (int, optional): Port of the first robot's worker. Defaults to BASE_PORT.
+    """
+    if not streams:
+        raise SystemExit("[prefork] no robot streams, set ROBOCOF_ROBOT_STREAMS")
+
+    t0 = time.monotonic()
+    preload_shared()
+    memory = process_stats.memory_usage()
+    log.info("prefork.models_loaded", "models loaded", seconds=round(time.monotonic() - t0, 2), rss_mb=memory["rss_mb"])
+    # move everything loaded so far out of the collector's reach: gc passes would otherwise write to the
+    # inherited objects' headers and copy their pages into every worker
+    gc.collect()
+    gc.freeze()
+
+    parent_pid = os.getpid()
+    workers: dict[int, int] = {}  # pid -> robot index
+    stopping = False
+
+    def shutdown(signum, frame):
+        nonlocal stopping
+        if os.getpid() != parent_pid:
+            return
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    for index, url in enumerate(streams):
+        pid = _fork_worker(index, url, host, base_port + index)
+        workers[pid] = index
+        log.info("prefork.worker_started", "robot worker started", robot=index, url=url, pid=pid, port=base_port + index)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = workers.pop(pid, None)
+        if index is None or stopping:
+            continue
+        log.warning(
+            "prefork.worker_exited", "robot worker exited, restarting",
+            robot=index, pid=pid, exit_code=os.waitstatus_to_exitcode(status),
+        )
+        time.sleep(RESTART_DELAY)
+        if stopping:
+            continue
+        new_pid = _fork_worker(index, streams[index], host, base_port + index)
+        workers[new_pid] = index
+    log.info("prefork.stopped", "all workers stopped")
+
+
+# start using python -m robocof_mood.serving.prefork from the root dir
+if __name__ == "__main__":
+    serve(ROBOT_STREAMS)
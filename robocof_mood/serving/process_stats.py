@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import os
+import resource
+import time
+
+from robocof_mood.tracing import log
+
+
+# set when the process starts serving requests, see mark_ready()
+_started = time.monotonic()
+_ready: float | None = None
+
+
+def reset_start():
+    """Restarts the startup clock, called by a freshly forked worker (it inherits the parent's clock)."""
+    global _started, _ready
+    _started = time.monotonic()
+    _ready = None
+
+
+def mark_ready():
+    """Records the startup time (process start or fork until the models are loaded) and logs it."""
+    global _ready
+    _ready = time.monotonic() - _started
+    memory = memory_usage()
+    log.info(
+        "startup.ready", "ready to serve",
+        pid=os.getpid(), seconds=round(_ready, 2), rss_mb=memory["rss_mb"], pss_mb=memory.get("pss_mb"),
+    )
+
+
+def memory_usage() -> dict:
+    """
+    Memory of this process in MB. `rss` counts every page the process maps, also the ones it shares with
+    the other pre-forked workers; `pss` divides shared pages among the processes sharing them, so the
+    sum of `pss` over all workers is what they really use. `shared` is the part of `rss` shared with others.
+    """
+    fields = {}
+    try:
+        with open("/proc/self/smaps_rollup", encoding="ascii") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if value.strip().endswith("kB"):
+                    fields[key] = int(value.split()[0])
+    except OSError:
+        # not Linux: peak RSS only (kB on Linux, bytes on macOS)
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {"rss_mb": round(maxrss / (1024 * 1024 if os.uname().sysname == "Darwin" else 1024), 1)}
+
+    shared = fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)
+    return {
+        "rss_mb": round(fields.get("Rss", 0) / 1024, 1),
+        "pss_mb": round(fields.get("Pss", 0) / 1024, 1),
+        "shared_mb": round(shared / 1024, 1),
+    }
+
+
+def snapshot() -> dict:
+    """Process id, startup time and memory, for the metrics endpoint."""
+    return {
+        "pid": os.getpid(),
+        "startup_s": None if _ready is None else round(_ready, 2),
+        "uptime_s": round(time.monotonic() - _started, 1),
+        "memory": memory_usage(),
+    }
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import itertools
+import threading
+from typing import Callable
+
+
+class CancellationToken:
+    """
+    Stop signal of one decision session, created by the session and passed to every recognizer loop it
+    starts. Recognizer loops check it between frames, executor jobs check it before they start and worker
+    requests tagged with its `id` are dropped with it, so no inference outlives the decision it was started
+    for while the loops of other sessions keep running. Thread-safe; cancel() is idempotent.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self):
+        # identifies the session's requests to worker processes (0 stands for "no session")
+        self.id = next(CancellationToken._ids)
+        self._event = threading.Event()
+        self._callbacks: list[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        """Signals every stage of the session to stop and runs the registered callbacks once."""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def add_callback(self, callback: Callable[[], None]):
+        """Calls `callback` on cancel(), right away if already cancelled."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def guard(self, fn: Callable, *args):
+        """Wraps `fn` for an executor: a job that only starts after cancel() returns None without running."""
+        def job():
+            if self._event.is_set():
+                return None
+            return fn(*args)
+        return job
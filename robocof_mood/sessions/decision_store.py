@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from robocof_mood.decision_manager import Decision
+
+
+# Finished decisions are returned to retries of the same robot_run_id for this long (seconds)
+DEFAULT_TTL = 600.0
+DEFAULT_MAX_ENTRIES = 1024
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+@dataclass
+class DecisionRecord:
+    """State of the decision for one robot_run_id."""
+
+    robot_run_id: int
+    desk_id: str | None
+    # every distinct callback URL of the original request and its retries gets the result once
+    callback_urls: list[str] = field(default_factory=list)
+    status: str = PENDING
+    decision: Decision | None = None
+    detail: str | None = None
+    created: float = field(default_factory=time.time)
+    finished: float | None = None
+    # camera-to-decision latency and rejected stale frames, see DecisionManager.make_decision
+    latency: dict | None = None
+    task: asyncio.Task | None = None
+
+    def in_flight(self) -> bool:
+        return self.status in (PENDING, RUNNING)
+
+    def to_dict(self) -> dict:
+        return {
+            "robot_run_id": self.robot_run_id,
+            "status": self.status,
+            "decision": None if self.decision is None else str(self.decision),
+            "detail": self.detail,
+            "desk_id": self.desk_id,
+            "created": self.created,
+            "finished": self.finished,
+            "latency": self.latency,
+        }
+
+
+class DecisionStore:
+    """
+    Idempotency store for /decision keyed by robot_run_id: a retry attaches to the decision in flight or gets
+    the cached result of a finished one (within `ttl`), instead of starting another make_decision.
+
+    Bounded to `max_entries`; the oldest finished records are evicted first, decisions in flight never are.
+    Only used from the event loop, so no locking.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES):
+        """Constructor
+
+        Args:
+            ttl (float, optional): Seconds a finished decision is kept. Defaults to DEFAULT_TTL.
+            max_entries (int, optional): Maximum number of records. Defaults to DEFAULT_MAX_ENTRIES.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._records: OrderedDict[int, DecisionRecord] = OrderedDict()
+
+    def begin(self, robot_run_id: int, callback_url: str, desk_id: str | None = None) -> tuple[DecisionRecord, bool]:
+        """
+        Registers a /decision request.
+
+        Returns:
+            tuple[DecisionRecord, bool]: The record, and True if a new decision has to be started for it,
+            False if the request is a duplicate of one in flight or of a cached result.
+        """
+        record = self.get(robot_run_id)
+        if record is not None and record.status != FAILED:
+            if record.in_flight() and callback_url not in record.callback_urls:
+                record.callback_urls.append(callback_url)
+            return record, False
+
+        record = DecisionRecord(robot_run_id, desk_id, [callback_url])
+        self._records.pop(robot_run_id, None)  # a failed record is replaced, at the end of the eviction order
+        self._records[robot_run_id] = record
+        self._evict()
+        return record, True
+
+    def get(self, robot_run_id: int) -> DecisionRecord | None:
+        """The record of `robot_run_id`, or None if unknown or expired."""
+        record = self._records.get(robot_run_id)
+        if record is None:
+            return None
+        if not record.in_flight() and time.time() - record.finished > self.ttl:
+            del self._records[robot_run_id]
+            return None
+        return record
+
+    def start(self, robot_run_id: int, task: asyncio.Task):
+        record = self._records.get(robot_run_id)
+        if record is not None:
+            record.task = task
+            record.status = RUNNING
+
+    def report_latency(self, robot_run_id: int, latency: dict):
+        record = self._records.get(robot_run_id)
+        if record is not None:
+            record.latency = latency
+
+    def finish(self, robot_run_id: int, decision: Decision):
+        record = self._records.get(robot_run_id)
+        if record is not None:
+            record.decision = decision
+            record.status = DONE
+            record.finished = time.time()
+            record.task = None
+
+    def fail(self, robot_run_id: int, detail: str):
+        """Marks the decision as failed; failures are only kept for the status query, a retry starts a new decision."""
+        record = self._records.get(robot_run_id)
+        if record is not None:
+            record.status = FAILED
+            record.detail = detail
+            record.finished = time.time()
+            record.task = None
+
+    def running_task(self, robot_run_id: int) -> asyncio.Task | None:
+        record = self._records.get(robot_run_id)
+        if record is None or record.task is None or record.task.done():
+            return None
+        return record.task
+
+    def _evict(self):
+        if len(self._records) <= self.max_entries:
+            return
+        now = time.time()
+        for robot_run_id, record in list(self._records.items()):
+            if len(self._records) <= self.max_entries:
+                return
+            if not record.in_flight() or now - record.created > self.ttl * 10:
+                # finished, or in flight for so long that its task is gone without reporting back
+                del self._records[robot_run_id]
+
+    def __len__(self) -> int:
+        return len(self._records)
@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable
+
+import cv2
+import numpy as np
+
+from robocof_mood.decision_manager import gesture_decision
+from robocof_mood.gesture_recognition.gesture_recognizer import Gesture, GestureRecognizer
+from robocof_mood.seat_recognition.seat_recognizer import SeatRecognizer, SeatStatus
+from robocof_mood.face_recognition.face_recognition import FaceRecognizer
+from robocof_mood.perception.unified_detector import UnifiedDetector
+from robocof_mood.tracing import tracer, log
+
+
+TASKS = ("seat", "gesture", "face")
+# uploads larger than this (pixels, longest side) are scaled down once, before any recognizer sees them
+MAX_SIDE = 1280
+# decoded images waiting per recognizer stage; bounds the memory of large batches
+QUEUE_SIZE = 4
+
+
+@dataclass
+class SnapshotResult:
+    """Per-image output of a batch, None for recognizers that were not asked for or failed."""
+
+    index: int
+    seat: SeatStatus | None = None
+    gestures: list[Gesture] | None = None
+    faces: list[str] | None = None
+    error: str | None = None
+    # milliseconds spent in each stage (decode, seat, gesture, face)
+    timings: dict[str, float] = field(default_factory=dict)
+
+    def to_dict(self) -> dict:
+        decision = None if self.gestures is None else gesture_decision(self.gestures)
+        return {
+            "index": self.index,
+            "seat": None if self.seat is None else self.seat.name,
+            "gestures": None if self.gestures is None else [gesture.name for gesture in self.gestures],
+            "gesture_decision": None if decision is None else str(decision),
+            "faces": self.faces,
+            "error": self.error,
+            "timings_ms": self.timings,
+        }
+
+
+def decode_image(data: bytes, max_side: int = MAX_SIDE) -> np.ndarray:
+    """Decodes an uploaded JPEG / PNG into an RGB array no larger than `max_side`."""
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("not a decodable image")
+    h, w = image.shape[:2]
+    if max(h, w) > max_side:
+        f = max_side / max(h, w)
+        image = cv2.resize(image, (round(w * f), round(h * f)), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+# stage functions: (recognizer, index in the batch, decoded RGB image) -> output
+def _classify_seat(recognizer: SeatRecognizer, index: int, image: np.ndarray) -> SeatStatus:
+    return recognizer.recognize(image, recognizer.model, rgb=True)
+
+
+def _classify_gesture(recognizer: GestureRecognizer, index: int, image: np.ndarray) -> list[Gesture]:
+    import mediapipe as mp
+    return recognizer.recognize(mp.Image(image_format=mp.ImageFormat.SRGB, data=image))
+
+
+def _classify_face(recognizer: FaceRecognizer, index: int, image: np.ndarray) -> list[str]:
+    return recognizer.recognize(image, rgb=True)
+
+
+STAGES = {"seat": _classify_seat, "gesture": _classify_gesture, "face": _classify_face}
+# SnapshotResult field each stage's output goes to
+FIELDS = {"seat": "seat", "gesture": "gestures", "face": "faces"}
+
+
+class SnapshotClassifier:
+    """
+    Runs seat, gesture and face recognition on uploaded still images instead of a live stream, e.g. to
+    pre-check snapshots or to enrol colleague photos in bulk.
+
+    A batch is one pipelined job: images are decoded one after the other and handed to one stage per
+    recognizer, so image n+1 is decoded while image n is in YOLOv5, MediaPipe and dlib at the same time.
+    The inference itself runs in the loop's default executor, the pool face recognition already uses.
+    Every recognizer runs one image at a time (MediaPipe graphs are not reentrant), also across
+    concurrent batches, whose stages then interleave.
+
+    The recognizers are separate from the live ones of the DecisionManager, so batches never disturb the
+    state of a running decision (seat evidence, learned chair box); YOLOv5's weights and the MediaPipe
+    task file are loaded once per process and shared with them.
+    """
+
+    def __init__(self, unified_model_path: str | None = None, max_side: int = MAX_SIDE):
+        """Constructor
+
+        Args:
+            unified_model_path (str | None, optional): Local ultralytics model; if given, seat status comes from
+                it instead of YOLOv5, as in the DecisionManager. Defaults to None.
+            max_side (int, optional): Longest side images are scaled down to after decoding. Defaults to MAX_SIDE.
+        """
+        self.__unified_model_path = unified_model_path
+        self.max_side = max_side
+        # created (and with them torch / mediapipe / dlib imported) on first use
+        self.__recognizers: dict[str, object] = {}
+        self.__recognizer_lock = threading.Lock()
+        self.__stage_locks = {kind: asyncio.Lock() for kind in TASKS}
+        self.images = 0
+        self.batches = 0
+
+    def __create(self, kind: str):
+        """Returns the recognizer of `kind`, creating it (and loading its model) on first use. Blocking."""
+        recognizer = self.__recognizers.get(kind)
+        if recognizer is not None:
+            return recognizer
+        with self.__recognizer_lock:
+            if kind not in self.__recognizers:
+                if kind == "seat":
+                    detector = UnifiedDetector(self.__unified_model_path) if self.__unified_model_path else None
+                    recognizer = SeatRecognizer(None, motion_gating=False, detector=detector)
+                elif kind == "gesture":
+                    recognizer = GestureRecognizer([], None, motion_gating=False)
+                elif kind == "face":
+                    recognizer = FaceRecognizer(None, motion_gating=False)
+                else:
+                    raise ValueError(f"Unknown recognizer kind: {kind}")
+                self.__recognizers[kind] = recognizer
+            return self.__recognizers[kind]
+
+    async def __recognizer(self, kind: str):
+        recognizer = self.__recognizers.get(kind)
+        if recognizer is None:
+            recognizer = await asyncio.to_thread(self.__create, kind)
+        return recognizer
+
+    async def __run(self, kind: str, index: int, result: SnapshotResult, fn: Callable, *args):
+        """Runs one stage of one image in the executor, one image per recognizer at a time."""
+        loop = asyncio.get_running_loop()
+        async with self.__stage_locks[kind]:
+            t0 = time.perf_counter()
+            with tracer.span(f"snapshot.{kind}", index=index):
+                output = await loop.run_in_executor(None, fn, *args)
+            result.timings[kind] = round((time.perf_counter() - t0) * 1000, 1)
+        return output
+
+    async def __pipeline(self, images: list[bytes], stages: dict[str, Callable]) -> list[SnapshotResult]:
+        """
+        Decodes `images` and runs every stage on each of them, pipelined. `stages` maps a recognizer kind to a
+        blocking function (recognizer, index, image) -> output, stored in the result field FIELDS[kind].
+        """
+        results = [SnapshotResult(index) for index in range(len(images))]
+        # load the models up front: a missing model fails the request instead of every image
+        recognizers = {kind: await self.__recognizer(kind) for kind in stages}
+        queues: dict[str, asyncio.Queue] = {kind: asyncio.Queue(maxsize=QUEUE_SIZE) for kind in stages}
+        loop = asyncio.get_running_loop()
+
+        async def decode():
+            for index, data in enumerate(images):
+                t0 = time.perf_counter()
+                try:
+                    with tracer.span("snapshot.decode", index=index):
+                        image = await loop.run_in_executor(None, decode_image, data, self.max_side)
+                except (ValueError, cv2.error) as exc:
+                    results[index].error = str(exc)
+                    continue
+                results[index].timings["decode"] = round((time.perf_counter() - t0) * 1000, 1)
+                for queue in queues.values():
+                    await queue.put((index, image))
+            for queue in queues.values():
+                await queue.put(None)
+
+        async def stage(kind: str):
+            fn, recognizer, queue = stages[kind], recognizers[kind], queues[kind]
+            while (item := await queue.get()) is not None:
+                index, image = item
+                result = results[index]
+                try:
+                    output = await self.__run(kind, index, result, fn, recognizer, index, image)
+                except Exception as exc:
+                    # one broken image must not fail the batch
+                    message = f"{kind}: {type(exc).__name__}: {exc}"
+                    result.error = message if result.error is None else f"{result.error}; {message}"
+                    continue
+                setattr(result, FIELDS[kind], output)
+
+        async with asyncio.TaskGroup() as group:
+            group.create_task(decode())
+            for kind in stages:
+                group.create_task(stage(kind))
+        return results
+
+    async def classify(self, images: list[bytes], tasks: tuple[str, ...] = TASKS) -> list[SnapshotResult]:
+        """
+        Classifies a batch of encoded images (JPEG, PNG, ...).
+
+        Args:
+            images (list[bytes]): The encoded images.
+            tasks (tuple[str, ...], optional): Recognizers to run, any of TASKS. Defaults to all.
+
+        Returns:
+            list[SnapshotResult]: One result per image, in order.
+        """
+        unknown = set(tasks) - set(TASKS)
+        if unknown:
+            raise ValueError(f"Unknown recognizer kind(s): {', '.join(sorted(unknown))}")
+        t0 = time.perf_counter()
+        results = await self.__pipeline(images, {kind: STAGES[kind] for kind in TASKS if kind in tasks})
+        self.batches += 1
+        self.images += len(images)
+        log.info("snapshots.classified", "batch classified", images=len(images), tasks=",".join(tasks),
+                 failed=sum(result.error is not None for result in results),
+                 elapsed_ms=round((time.perf_counter() - t0) * 1000, 1))
+        return results
+
+    async def enrol(self, names: list[str], images: list[bytes]) -> list[SnapshotResult]:
+        """
+        Adds one known face per image, e.g. colleague photos. Images must show exactly one face.
+
+        Args:
+            names (list[str]): Name of the person in each image.
+            images (list[bytes]): The encoded images.
+
+        Returns:
+            list[SnapshotResult]: Per image, `faces` holds the enrolled name or `error` says why it was not.
+        """
+        if len(names) != len(images):
+            raise ValueError(f"{len(names)} names for {len(images)} images")
+
+        def enrol_face(recognizer: FaceRecognizer, index: int, image: np.ndarray) -> list[str]:
+            encodings = recognizer.encode(image, rgb=True)
+            if len(encodings) != 1:
+                raise ValueError(f"expected one face, found {len(encodings)}")
+            # under the face stage's lock, so no batch matches against a half-updated gallery
+            recognizer.add_face_encoding(names[index], encodings[0])
+            return [names[index]]
+
+        results = await self.__pipeline(images, {"face": enrol_face})
+        log.info("snapshots.enrolled", "faces enrolled", images=len(images),
+                 enrolled=sum(result.faces is not None for result in results))
+        return results
+
+    def known_faces(self) -> list[str]:
+        """Names enrolled so far, empty before the first enrolment."""
+        recognizer = self.__recognizers.get("face")
+        return [] if recognizer is None else list(recognizer.get_known_faces())
+
+    def stats(self) -> dict:
+        return {"batches": self.batches, "images": self.images, "loaded": sorted(self.__recognizers)}
@@ -0,0 +1,282 @@
+"""
+Structured logging of the service, cheap enough for per-frame call sites.
+
+A call returns right away if the level is disabled or the record is sampled out, rate-limited or over its
+session's cap; otherwise the record (a dict) goes into a bounded queue. Formatting and writing happen in a
+background thread, so a slow stdout never blocks the event loop; if the queue is full the record is dropped
+and counted. Records carry the robot_run_id of the decision session they were logged in (see begin_session())
+and, where the call site passes it, the frame sequence number `seq`.
+
+    log.info("decision.made", "Decision made", decision="CARRY_OUT_ACTION", seq=1234)
+
+prints `[decision.made] Decision made decision=CARRY_OUT_ACTION seq=1234 run=17`, or one JSON object per line
+with configure(json_output=True).
+"""
+from __future__ import annotations
+
+import atexit
+import contextvars
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from typing import TextIO
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+MAX_QUEUE = 10_000
+# records per second (token bucket refill) and burst per event type, unless listed in RATE_LIMITS
+DEFAULT_RATE = 5.0
+DEFAULT_BURST = 20
+RATE_LIMITS: dict[str, tuple[float, int]] = {
+    "capture.failed": (1.0, 3),
+    "seat.status": (2.0, 5),
+    "gesture.recognized": (5.0, 10),
+}
+# only every n-th record of these (per-frame) event types is considered at all
+SAMPLING: dict[str, int] = {
+    "seat.status": 5,
+    "gesture.recognized": 3,
+}
+# records per decision session; errors are never capped
+DEFAULT_SESSION_CAP = 500
+
+_level = INFO
+_json_output = False
+_stream: TextIO = sys.stdout
+_session_cap = DEFAULT_SESSION_CAP
+_rates = dict(RATE_LIMITS)
+_sampling = dict(SAMPLING)
+
+_robot_run_id: contextvars.ContextVar[int | None] = contextvars.ContextVar("robot_run_id", default=None)
+_lock = threading.Lock()
+_buckets: dict[str, list[float]] = {}  # event -> [tokens, last refill]
+_sample_counts: dict[str, int] = {}
+_suppressed: dict[str, int] = {}  # event -> records dropped since the last one written
+_session_counts: dict[int, int] = {}
+_dropped = {"rate": 0, "sampled": 0, "session_cap": 0, "queue_full": 0}
+_written = 0
+
+_queue: queue.Queue = queue.Queue(maxsize=MAX_QUEUE)
+_writer: threading.Thread | None = None
+_writer_pid: int | None = None
+
+
+def configure(
+    level: int | str = INFO,
+    json_output: bool = False,
+    stream: TextIO | None = None,
+    session_cap: int = DEFAULT_SESSION_CAP,
+    rate_limits: dict[str, tuple[float, int]] | None = None,
+    sampling: dict[str, int] | None = None,
+):
+    """
+    Sets up the logging layer; without a call, INFO and above are written as text to stdout.
+
+    Args:
+        level (int | str, optional): Lowest level written, e.g. DEBUG or "DEBUG". Defaults to INFO.
+        json_output (bool, optional): One JSON object per line instead of text. Defaults to False.
+        stream (TextIO | None, optional): Where records are written. Defaults to None (stdout).
+        session_cap (int, optional): Records per decision session. Defaults to DEFAULT_SESSION_CAP.
+        rate_limits (dict | None, optional): (records per second, burst) per event type, added to RATE_LIMITS.
+        sampling (dict | None, optional): Keep every n-th record per event type, added to SAMPLING.
+    """
+    global _level, _json_output, _stream, _session_cap
+    _level = level if isinstance(level, int) else {name: lvl for lvl, name in LEVEL_NAMES.items()}[level.upper()]
+    _json_output = json_output
+    _stream = stream or sys.stdout
+    _session_cap = session_cap
+    with _lock:
+        _rates.update(rate_limits or {})
+        _sampling.update(sampling or {})
+        _buckets.clear()
+
+
+def is_enabled(level: int) -> bool:
+    return level >= _level
+
+
+# ---------------------------------------------------------------------- #
+# sessions
+# ---------------------------------------------------------------------- #
+def begin_session(robot_run_id: int):
+    """Tags the records of the current context (and of the tasks created from it) with `robot_run_id`."""
+    _robot_run_id.set(robot_run_id)
+    with _lock:
+        _session_counts[robot_run_id] = 0
+
+
+def end_session(robot_run_id: int):
+    """Closes the session's record count; logs how many records were capped, if any."""
+    with _lock:
+        count = _session_counts.pop(robot_run_id, 0)
+    if count > _session_cap:
+        _enqueue(INFO, "log.session_capped", "Session log capped", {"records": count, "cap": _session_cap}, robot_run_id)
+    if _robot_run_id.get() == robot_run_id:
+        _robot_run_id.set(None)
+
+
+# ---------------------------------------------------------------------- #
+# logging calls
+# ---------------------------------------------------------------------- #
+def debug(event: str, msg: str = "", **fields):
+    if DEBUG >= _level:
+        _log(DEBUG, event, msg, fields)
+
+
+def info(event: str, msg: str = "", **fields):
+    if INFO >= _level:
+        _log(INFO, event, msg, fields)
+
+
+def warning(event: str, msg: str = "", **fields):
+    if WARNING >= _level:
+        _log(WARNING, event, msg, fields)
+
+
+def error(event: str, msg: str = "", **fields):
+    if ERROR >= _level:
+        _log(ERROR, event, msg, fields)
+
+
+def _log(level: int, event: str, msg: str, fields: dict):
+    robot_run_id = _robot_run_id.get()
+    with _lock:
+        every = _sampling.get(event)
+        if every is not None and every > 1:
+            n = _sample_counts.get(event, 0)
+            _sample_counts[event] = n + 1
+            if n % every:
+                _dropped["sampled"] += 1
+                _suppressed[event] = _suppressed.get(event, 0) + 1
+                return
+
+        rate, burst = _rates.get(event, (DEFAULT_RATE, DEFAULT_BURST))
+        now = time.monotonic()
+        bucket = _buckets.get(event)
+        if bucket is None:
+            bucket = _buckets[event] = [float(burst), now]
+        bucket[0] = min(float(burst), bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if bucket[0] < 1.0 and level < ERROR:
+            _dropped["rate"] += 1
+            _suppressed[event] = _suppressed.get(event, 0) + 1
+            return
+        bucket[0] = max(0.0, bucket[0] - 1.0)
+
+        if robot_run_id is not None and robot_run_id in _session_counts:
+            count = _session_counts[robot_run_id] = _session_counts[robot_run_id] + 1
+            if count > _session_cap and level < ERROR:
+                _dropped["session_cap"] += 1
+                return
+
+        suppressed = _suppressed.pop(event, 0)
+    if suppressed:
+        fields["suppressed"] = suppressed
+    _enqueue(level, event, msg, fields, robot_run_id)
+
+
+def _enqueue(level: int, event: str, msg: str, fields: dict, robot_run_id: int | None):
+    global _written
+    _ensure_writer()
+    record = {"ts": time.time(), "level": level, "event": event, "msg": msg, "run": robot_run_id, "fields": fields}
+    try:
+        _queue.put_nowait(record)
+        _written += 1
+    except queue.Full:
+        _dropped["queue_full"] += 1
+
+
+# ---------------------------------------------------------------------- #
+# background writer
+# ---------------------------------------------------------------------- #
+def _format(record: dict) -> str:
+    if _json_output:
+        line = {
+            "ts": round(record["ts"], 3),
+            "level": LEVEL_NAMES[record["level"]],
+            "event": record["event"],
+            "msg": record["msg"],
+            "robot_run_id": record["run"],
+            "pid": os.getpid(),
+        }
+        line.update(record["fields"])
+        return json.dumps(line, default=str)
+    parts = [f"[{record['event']}]"]
+    if record["level"] >= WARNING:
+        parts.append(LEVEL_NAMES[record["level"]])
+    if record["msg"]:
+        parts.append(record["msg"])
+    parts.extend(f"{key}={value}" for key, value in record["fields"].items())
+    if record["run"] is not None:
+        parts.append(f"run={record['run']}")
+    return " ".join(parts)
+
+
+def _write_loop():
+    while True:
+        record = _queue.get()
+        lines = []
+        stop = False
+        # write whatever has piled up in one go
+        while record is not None:
+            lines.append(_format(record))
+            try:
+                record = _queue.get_nowait()
+            except queue.Empty:
+                break
+        else:
+            stop = True
+        if lines:
+            try:
+                _stream.write("\n".join(lines) + "\n")
+                _stream.flush()
+            except (OSError, ValueError):
+                pass  # stdout closed
+        if stop:
+            return
+
+
+def _ensure_writer():
+    global _writer, _writer_pid
+    if _writer is not None and _writer_pid == os.getpid():
+        return
+    with _lock:
+        if _writer is None or _writer_pid != os.getpid():
+            _writer = threading.Thread(target=_write_loop, name="log writer", daemon=True)
+            _writer_pid = os.getpid()
+            _writer.start()
+
+
+def flush(timeout: float = 2.0):
+    """Writes the queued records and stops the writer thread; the next record starts it again."""
+    global _writer
+    writer = _writer
+    if writer is None or _writer_pid != os.getpid() or not writer.is_alive():
+        return
+    _queue.put(None)
+    writer.join(timeout)
+    _writer = None
+
+
+def _after_fork_in_child():
+    """The writer thread does not survive a fork: start over with an empty queue and fresh counters."""
+    global _queue, _writer, _lock
+    _lock = threading.Lock()
+    _queue = queue.Queue(maxsize=MAX_QUEUE)
+    _writer = None
+    _session_counts.clear()
+
+
+def stats() -> dict:
+    """Records written and dropped (by reason) so far, for the metrics endpoint."""
+    with _lock:
+        return {"written": _written, "dropped": dict(_dropped), "queued": _queue.qsize()}
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+atexit.register(flush)
@@ -0,0 +1,183 @@
+"""
+Opt-in tracing of the decision pipeline in the Chrome trace-event format (chrome://tracing, ui.perfetto.dev).
+
+Spans of every stage (frame decode, capture and preprocessing, each recognizer's inference, the asyncio.wait
+loop of the DecisionManager) go into one bounded in-memory buffer; a decision session marks the time window
+that export_trace() cuts out for its robot_run_id. While tracing is disabled span() returns a shared no-op
+context manager, so instrumented code only pays one function call and a global lookup.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+DEFAULT_MAX_EVENTS = 200_000
+# traces of this many sessions are kept for export
+MAX_SESSIONS = 32
+
+_enabled = False
+_events: deque[dict] = deque(maxlen=DEFAULT_MAX_EVENTS)
+_sessions: OrderedDict[int, list] = OrderedDict()  # robot_run_id -> [start_us, end_us | None]
+_track_names: dict[tuple[int, int], str] = {}
+_task_tracks: dict[int, int] = {}
+_track_ids = itertools.count(1_000_000)  # virtual thread ids for asyncio tasks
+_lock = threading.Lock()
+_NOOP = contextlib.nullcontext()
+
+
+def _now_us() -> float:
+    return time.perf_counter_ns() / 1000
+
+
+def enable_tracing(max_events: int = DEFAULT_MAX_EVENTS):
+    """Starts recording spans into a buffer of at most `max_events` events."""
+    global _enabled, _events
+    with _lock:
+        if _events.maxlen != max_events:
+            _events = deque(_events, maxlen=max_events)
+    _enabled = True
+
+
+def disable_tracing():
+    global _enabled
+    _enabled = False
+
+
+def is_tracing() -> bool:
+    return _enabled
+
+
+def _track() -> tuple[int, int]:
+    """(pid, tid) of the caller; asyncio tasks get a virtual thread each, as their spans interleave."""
+    pid, tid = os.getpid(), threading.get_ident()
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    if task is not None:
+        key = id(task)
+        vtid = _task_tracks.get(key)
+        if vtid is None:
+            vtid = _task_tracks[key] = next(_track_ids)
+            _track_names[(pid, vtid)] = f"task {task.get_name()}"
+        return pid, vtid
+    if (pid, tid) not in _track_names:
+        _track_names[(pid, tid)] = threading.current_thread().name
+    return pid, tid
+
+
+def add_span(name: str, start_us: float, end_us: float, cat: str = "pipeline", pid: int | None = None, **args):
+    """Records a span that was timed by the caller (microseconds on the _now_us() clock)."""
+    if not _enabled:
+        return
+    own_pid, tid = _track()
+    if pid is not None and pid != own_pid:
+        # work done in another process (e.g. a recognizer worker), one track per process
+        tid = 0
+        _track_names.setdefault((pid, 0), name.split(".")[0] + " worker")
+    event = {
+        "name": name, "cat": cat, "ph": "X", "ts": start_us, "dur": end_us - start_us,
+        "pid": own_pid if pid is None else pid, "tid": tid,
+    }
+    if args:
+        event["args"] = args
+    # export_trace() iterates the buffer under the lock, while decode spans come from the stream's reader thread
+    with _lock:
+        _events.append(event)
+
+
+@contextlib.contextmanager
+def _span(name: str, cat: str, pid: int | None, args: dict):
+    start = _now_us()
+    try:
+        yield args
+    finally:
+        add_span(name, start, _now_us(), cat, pid, **args)
+
+
+def span(name: str, cat: str = "pipeline", pid: int | None = None, **args):
+    """
+    Context manager timing the enclosed block.
+
+    Args:
+        name (str): Span name, e.g. "seat.infer".
+        cat (str, optional): Trace category. Defaults to "pipeline".
+        pid (int | None, optional): Process that did the work, if not this one. Defaults to None.
+        **args: Shown with the span, e.g. seq=<frame sequence number>. The yielded dict can be extended.
+    """
+    if not _enabled:
+        return _NOOP
+    return _span(name, cat, pid, args)
+
+
+def instant(name: str, cat: str = "pipeline", **args):
+    """Records a point in time, e.g. a decision being taken."""
+    if not _enabled:
+        return
+    pid, tid = _track()
+    event = {"name": name, "cat": cat, "ph": "i", "s": "t", "ts": _now_us(), "pid": pid, "tid": tid}
+    if args:
+        event["args"] = args
+    with _lock:
+        _events.append(event)
+
+
+def begin_session(robot_run_id: int):
+    """Marks the start of the decision for `robot_run_id`."""
+    if not _enabled:
+        return
+    with _lock:
+        _sessions.pop(robot_run_id, None)
+        _sessions[robot_run_id] = [_now_us(), None]
+        while len(_sessions) > MAX_SESSIONS:
+            _sessions.popitem(last=False)
+
+
+def end_session(robot_run_id: int):
+    with _lock:
+        window = _sessions.get(robot_run_id)
+        if window is not None and window[1] is None:
+            window[1] = _now_us()
+    _task_tracks.clear()
+
+
+def has_trace(robot_run_id: int) -> bool:
+    return robot_run_id in _sessions
+
+
+def export_trace(robot_run_id: int) -> dict | None:
+    """
+    Returns the Chrome trace of the decision of `robot_run_id` (JSON object format), or None if it was not
+    traced. Every event that overlaps the session's time window is included, whichever thread recorded it.
+    """
+    with _lock:
+        window = _sessions.get(robot_run_id)
+        if window is None:
+            return None
+        start, end = window[0], window[1] if window[1] is not None else _now_us()
+        recorded = list(_events)
+    events = [
+        e for e in recorded
+        if e["ts"] <= end and e["ts"] + e.get("dur", 0) >= start
+    ]
+    tracks = {(e["pid"], e["tid"]) for e in events}
+    metadata = [
+        {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": _track_names.get((pid, tid), str(tid))}}
+        for pid, tid in tracks
+    ]
+    metadata += [
+        {"name": "process_name", "ph": "M", "pid": pid, "tid": 0,
+         "args": {"name": "robocof" if pid == os.getpid() else _track_names.get((pid, 0), f"process {pid}")}}
+        for pid in {pid for pid, _ in tracks}
+    ]
+    return {
+        "traceEvents": metadata + events,
+        "displayTimeUnit": "ms",
+        "otherData": {"robot_run_id": robot_run_id},
+    }
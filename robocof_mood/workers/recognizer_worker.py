@@ -0,0 +1,405 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import itertools
+import multiprocessing as mp_proc
+import threading
+import time
+
+import numpy as np
+
+from robocof_mood.workers.shared_frame_ring import SharedFrameRing, DEFAULT_MAX_FRAME_BYTES
+from robocof_mood.resources.resource_governor import apply_thread_budget
+from robocof_mood.sessions.cancellation import CancellationToken
+from robocof_mood.tracing import log
+
+
+RESTART_DELAY = 1.0  # seconds to wait before restarting a crashed worker
+MAX_RESTART_DELAY = 30.0
+# consecutive worker processes that die before their model is loaded, after which the worker gives up
+MAX_LOAD_FAILURES = 3
+# ids of the most recently cancelled sessions the worker process checks requests against; each session has at
+# most one request per recognizer in flight, so its id only has to outlive that request
+CANCELLED_SLOTS = 64
+
+
+class WorkerCrashedError(RuntimeError):
+    """Raised for requests that were in flight when their worker process died."""
+
+
+class WorkerUnavailableError(RuntimeError):
+    """Raised when the worker gave up because its model cannot be loaded; restarting will not help."""
+
+
+def _create_recognizer(kind: str, options: dict):
+    """Creates (and loads the model of) the recognizer of the given kind inside the worker process."""
+    if kind == "seat":
+        from robocof_mood.seat_recognition.seat_recognizer import SeatRecognizer
+        return SeatRecognizer(None, motion_gating=False)
+    if kind == "gesture":
+        from robocof_mood.gesture_recognition.gesture_recognizer import GestureRecognizer
+        return GestureRecognizer([], None, motion_gating=False)
+    if kind == "face":
+        from robocof_mood.face_recognition.face_recognition import FaceRecognizer
+        return FaceRecognizer(
+            None,
+            face_names=list(options.get("face_names", [])),
+            known_face_encodings=list(options.get("known_face_encodings", [])),
+            motion_gating=False,
+        )
+    raise ValueError(f"Unknown recognizer kind: {kind}")
+
+
+def _infer(kind: str, recognizer, frame: np.ndarray, kwargs: dict):
+    """Runs one inference; `frame` is what the recognizer's start() loop captures from the input stream."""
+    if kind == "seat":
+        options = {key: kwargs[key] for key in ("prior", "size", "scale") if key in kwargs}
+        recognizer.last_passes = []
+        status = recognizer.recognize(frame, recognizer.model, rgb=True, **options)
+        return status, recognizer.last_chair_box, recognizer.last_passes
+    if kind == "gesture":
+        import mediapipe as mp
+        return recognizer.recognize(mp.Image(image_format=mp.ImageFormat.SRGB, data=frame))
+    if kind == "face":
+        return recognizer.recognize(frame, rgb=True, regions=kwargs.get("regions"))
+    raise ValueError(f"Unknown recognizer kind: {kind}")
+
+
+def _worker_main(kind: str, ring_name: str, slots: int, max_frame_bytes: int, conn, options: dict, cancelled):
+    """Entry point of the worker process: load the model once, then serve frames from the ring."""
+    ring = SharedFrameRing(slots, max_frame_bytes, name=ring_name)
+    if options.get("threads"):
+        # before the model is loaded, so torch / OpenMP size their pools accordingly
+        apply_thread_budget(options["threads"], options.get("cpus"))
+    try:
+        try:
+            recognizer = _create_recognizer(kind, options)
+        except Exception as exc:
+            # missing weights, broken install, ...: tell the parent why instead of only dying
+            conn.send(("load_failed", None, f"{type(exc).__name__}: {exc}"))
+            return
+        conn.send(("ready", None, None))
+        while True:
+            try:
+                msg = conn.recv()
+            except EOFError:
+                break  # parent went away
+            if msg is None:
+                break
+            if msg[0] == "budget":
+                apply_thread_budget(msg[1], msg[2])
+                continue
+            request_id, slot, seq, kwargs, session_id = msg
+            if session_id and session_id in cancelled[:]:
+                # queued before its session was cancelled, nobody waits for the result
+                conn.send(("stale", request_id, None))
+                continue
+
+            frame = ring.read(slot, seq)
+            if frame is None:
+                conn.send(("stale", request_id, None))
+                continue
+            try:
+                result = _infer(kind, recognizer, frame, kwargs)
+            except Exception as exc:
+                conn.send(("error", request_id, f"{type(exc).__name__}: {exc}"))
+                continue
+            finally:
+                del frame
+            if not ring.is_current(slot, seq):
+                conn.send(("stale", request_id, None))
+                continue
+            conn.send(("ok", request_id, result))
+    finally:
+        ring.close()
+
+
+class RecognizerWorker:
+    """
+    Runs one recognizer ("seat", "gesture" or "face") in its own long-lived process.
+
+    Frames are handed over through a SharedFrameRing; only (request id, slot, sequence number) cross the
+    pipe, results come back pickled. A background thread collects the results and resolves the awaiting
+    futures on their event loop. If the process dies, its in-flight requests fail with WorkerCrashedError
+    and the process is restarted with backoff.
+    """
+
+    def __init__(
+        self,
+        kind: str,
+        *,
+        slots: int = 4,
+        max_frame_bytes: int = DEFAULT_MAX_FRAME_BYTES,
+        options: dict | None = None,
+    ):
+        """Constructor
+
+        Args:
+            kind (str): "seat", "gesture" or "face".
+            slots (int, optional): Slots in the shared frame ring. Defaults to 4.
+            max_frame_bytes (int, optional): Largest frame that can be sent. Defaults to DEFAULT_MAX_FRAME_BYTES.
+            options (dict | None, optional): Extra recognizer options, e.g. known faces for "face". Defaults to None.
+        """
+        self.kind = kind
+        self.options = options or {}
+        self.restarts = 0
+        # why the worker gave up after MAX_LOAD_FAILURES failed model loads, None while it is usable
+        self.error: str | None = None
+        self._load_failures = 0
+        self._last_load_error: str | None = None
+        self._ring = SharedFrameRing(slots, max_frame_bytes)
+        self._ctx = mp_proc.get_context("spawn")
+        self._process = None
+        self._conn = None
+        self._send_lock = threading.Lock()
+        # request id -> (loop, future, session id) of the requests awaiting a result
+        self._pending: dict[int, tuple[asyncio.AbstractEventLoop, asyncio.Future, int]] = {}
+        self._pending_lock = threading.Lock()
+        self._ids = itertools.count()
+        self._ready = threading.Event()
+        self._stopping = False
+        self._supervisor: threading.Thread | None = None
+        # ring of cancelled session ids, written by cancel_pending(); the worker skips their queued requests
+        self._cancelled = self._ctx.Array("q", CANCELLED_SLOTS)
+        self._cancelled_next = 0
+        # sessions whose token already calls cancel_pending() when cancelled
+        self._sessions: set[int] = set()
+
+    # ------------------------------------------------------------------ #
+    # lifecycle
+    # ------------------------------------------------------------------ #
+    def start(self, wait: bool = True, timeout: float | None = None):
+        """
+        Spawns the worker process.
+
+        Args:
+            wait (bool, optional): Block until the model is loaded. Defaults to True.
+            timeout (float | None, optional): Maximum seconds to wait. Defaults to None.
+
+        Raises:
+            TimeoutError: The model was not loaded within `timeout`; the worker is stopped.
+            WorkerUnavailableError: The model failed to load MAX_LOAD_FAILURES times in a row.
+        """
+        self._stopping = False
+        self.error = None
+        self._load_failures = 0
+        self._spawn()
+        self._supervisor = threading.Thread(target=self._supervise, daemon=True, name=f"{self.kind}-worker")
+        self._supervisor.start()
+        if wait:
+            try:
+                self._wait_ready(timeout)
+            except (TimeoutError, WorkerUnavailableError):
+                self.stop()
+                raise
+
+    def _wait_ready(self, timeout: float | None = None):
+        """Blocks until the model is loaded; raises if the worker gave up or `timeout` passed."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._ready.wait(0.1):
+            if self.error is not None:
+                raise WorkerUnavailableError(f"{self.kind} worker: {self.error}")
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"{self.kind} worker did not load its model within {timeout} s")
+
+    def stop(self):
+        """Stops the worker process and frees the shared memory."""
+        self._stopping = True
+        with self._send_lock:
+            try:
+                self._conn.send(None)
+            except (OSError, AttributeError):
+                pass
+        if self._process is not None:
+            self._process.join(timeout=5)
+            if self._process.is_alive():
+                self._process.kill()
+        if self._supervisor is not None:
+            self._supervisor.join(timeout=5)
+        self._fail_pending(WorkerCrashedError(f"{self.kind} worker stopped"))
+        self._ring.close()
+
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
+
+    def cancel_pending(self, token: CancellationToken):
+        """
+        Drops the requests of the session of `token`: the worker skips the ones still queued (the one it is
+        running finishes, its result is discarded) and their callers get CancelledError. Requests of other
+        sessions are not affected. Called by infer() once `token` is cancelled.
+        """
+        with self._cancelled.get_lock():
+            self._cancelled[self._cancelled_next % CANCELLED_SLOTS] = token.id
+            self._cancelled_next += 1
+        with self._pending_lock:
+            self._sessions.discard(token.id)
+            request_ids = [request_id for request_id, entry in self._pending.items() if entry[2] == token.id]
+            entries = [self._pending.pop(request_id) for request_id in request_ids]
+        for loop, future, _ in entries:
+            try:
+                loop.call_soon_threadsafe(future.cancel)
+            except RuntimeError:
+                pass  # loop already closed
+
+    def configure(self, threads: int, cpus: list[int] | None = None):
+        """Changes the thread budget (and CPU affinity) of the worker process, also after restarts."""
+        self.options["threads"] = threads
+        self.options["cpus"] = cpus
+        with self._send_lock:
+            try:
+                self._conn.send(("budget", threads, cpus))
+            except (OSError, AttributeError):
+                pass  # not running, the options apply when it is (re)spawned
+
+    @property
+    def pid(self) -> int | None:
+        """Process id of the current worker process."""
+        return None if self._process is None else self._process.pid
+
+    # ------------------------------------------------------------------ #
+    # inference
+    # ------------------------------------------------------------------ #
+    async def infer(self, frame: np.ndarray, token: CancellationToken | None = None, **kwargs):
+        """
+        Sends `frame` to the worker and waits for the recognizer's result.
+
+        Args:
+            frame (np.ndarray): The frame, as captured by the recognizer's start() loop.
+            token (CancellationToken | None, optional): Stop signal of the requesting session; cancelling it
+                drops this request (see cancel_pending()). Defaults to None.
+            **kwargs: Small picklable extras for the recognizer, e.g. the desk prior for "seat".
+
+        Returns:
+            The result of the recognizer's recognize() ((status, chair box, scale passes) for "seat"), or None if the
+            frame was overwritten before the worker got to it or the session was cancelled.
+        """
+        if self.error is not None:
+            raise WorkerUnavailableError(f"{self.kind} worker: {self.error}")
+        if not self._ready.is_set():
+            await asyncio.to_thread(self._wait_ready)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        request_id = next(self._ids)
+        session_id = 0 if token is None else token.id
+        with self._pending_lock:
+            if token is not None and token.cancelled:
+                return None
+            self._pending[request_id] = (loop, future, session_id)
+            register = token is not None and session_id not in self._sessions
+            if register:
+                self._sessions.add(session_id)
+        if register:
+            token.add_callback(functools.partial(self.cancel_pending, token))
+
+        try:
+            with self._send_lock:
+                slot, seq = self._ring.write(frame)
+                self._conn.send((request_id, slot, seq, kwargs, session_id))
+        except (OSError, ValueError) as exc:
+            with self._pending_lock:
+                self._pending.pop(request_id, None)
+            if isinstance(exc, ValueError):
+                raise
+            raise WorkerCrashedError(f"{self.kind} worker is not reachable") from exc
+
+        try:
+            return await future
+        finally:
+            with self._pending_lock:
+                self._pending.pop(request_id, None)
+
+    # ------------------------------------------------------------------ #
+    # internals
+    # ------------------------------------------------------------------ #
+    def _spawn(self):
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(self.kind, self._ring.name, self._ring.slots, self._ring.max_frame_bytes, child_conn, self.options, self._cancelled),
+            daemon=True,
+            name=f"robocof-{self.kind}-worker",
+        )
+        process.start()
+        child_conn.close()
+        with self._send_lock:
+            self._conn = parent_conn
+            self._process = process
+
+    def _supervise(self):
+        """Receives results; restarts the worker when it dies."""
+        delay = RESTART_DELAY
+        while True:
+            conn = self._conn
+            try:
+                status, request_id, result = conn.recv()
+            except (EOFError, OSError):
+                loaded = self._ready.is_set()
+                self._ready.clear()
+                if self._stopping:
+                    self._fail_pending(WorkerCrashedError(f"{self.kind} worker died"))
+                    return
+                self._process.join(timeout=1)
+                exitcode = self._process.exitcode
+                if not loaded:
+                    # died while loading its model: a restart will most likely fail the same way
+                    self._load_failures += 1
+                    if self._load_failures >= MAX_LOAD_FAILURES:
+                        self.error = self._last_load_error or f"died while loading (exit code {exitcode})"
+                        log.error("worker.gave_up", f"{self.kind} worker could not load its model, not restarting",
+                                  attempts=self._load_failures, error=self.error)
+                        self._fail_pending(WorkerUnavailableError(f"{self.kind} worker: {self.error}"))
+                        return
+                self._fail_pending(WorkerCrashedError(f"{self.kind} worker died"))
+                log.error("worker.died", f"{self.kind} worker died, restarting", exit_code=exitcode, delay=delay,
+                          error=None if loaded else self._last_load_error)
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RESTART_DELAY)
+                if self._stopping:
+                    return
+                self.restarts += 1
+                self._spawn()
+                continue
+
+            if status == "ready":
+                delay = RESTART_DELAY
+                self._load_failures = 0
+                self._last_load_error = None
+                self._ready.set()
+                continue
+            if status == "load_failed":
+                self._last_load_error = result
+                continue
+
+            with self._pending_lock:
+                entry = self._pending.get(request_id)
+            if entry is None:
+                continue
+            loop, future, _ = entry
+            if status == "ok":
+                loop.call_soon_threadsafe(_set_result, future, result)
+            elif status == "stale":
+                loop.call_soon_threadsafe(_set_result, future, None)
+            else:
+                loop.call_soon_threadsafe(_set_exception, future, RuntimeError(f"[{self.kind} worker] {result}"))
+
+    def _fail_pending(self, exc: Exception):
+        with self._pending_lock:
+            entries = list(self._pending.values())
+            self._pending.clear()
+        for loop, future, _ in entries:
+            try:
+                loop.call_soon_threadsafe(_set_exception, future, exc)
+            except RuntimeError:
+                pass  # loop already closed
+
+
+def _set_result(future: asyncio.Future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_exception(future: asyncio.Future, exc: Exception):
+    if not future.done():
+        future.set_exception(exc)
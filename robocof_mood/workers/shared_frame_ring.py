@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+# per slot: sequence number, height, width, channels
+_HEADER_FIELDS = 4
+# 1080p BGR
+DEFAULT_MAX_FRAME_BYTES = 1920 * 1080 * 3
+
+
+class SharedFrameRing:
+    """
+    A ring of frame slots in `multiprocessing.shared_memory`.
+
+    The owning process writes frames into the next slot; only (slot, sequence number) have to be sent
+    to the reading process, which maps the same memory. Every slot carries the sequence number of the
+    frame it holds, so a reader can detect that a slot was overwritten in the meantime.
+    """
+
+    def __init__(
+        self,
+        slots: int = 4,
+        max_frame_bytes: int = DEFAULT_MAX_FRAME_BYTES,
+        name: str | None = None,
+    ):
+        """Constructor
+
+        Args:
+            slots (int, optional): Number of frames the ring holds. Defaults to 4.
+            max_frame_bytes (int, optional): Size of one slot in bytes. Defaults to DEFAULT_MAX_FRAME_BYTES.
+            name (str | None, optional): Attach to the existing ring with this name instead of creating one. Defaults to None.
+        """
+        self.slots = slots
+        self.max_frame_bytes = max_frame_bytes
+        header_bytes = slots * _HEADER_FIELDS * 8
+        self._owner = name is None
+        self._shm = shared_memory.SharedMemory(
+            name=name, create=self._owner, size=header_bytes + slots * max_frame_bytes
+        )
+        self._header = np.ndarray((slots, _HEADER_FIELDS), dtype=np.int64, buffer=self._shm.buf)
+        self._data_offset = header_bytes
+        self._next_slot = 0
+        self._seq = 0
+        if self._owner:
+            self._header[:] = 0
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    def write(self, frame: np.ndarray) -> tuple[int, int]:
+        """
+        Copies `frame` into the next slot.
+
+        Args:
+            frame (np.ndarray): uint8 frame with shape (H, W) or (H, W, C).
+
+        Returns:
+            tuple[int, int]: (slot, sequence number) identifying the frame.
+        """
+        if frame.dtype != np.uint8:
+            raise ValueError("Only uint8 frames can be shared")
+        if frame.nbytes > self.max_frame_bytes:
+            raise ValueError(f"Frame of {frame.nbytes} bytes exceeds the slot size of {self.max_frame_bytes} bytes")
+
+        slot = self._next_slot
+        self._next_slot = (slot + 1) % self.slots
+        self._seq += 1
+        h, w = frame.shape[:2]
+        c = frame.shape[2] if frame.ndim == 3 else 0
+
+        self._header[slot, 0] = 0  # mark as being written
+        np.copyto(self._slot_view(slot, (h, w, c)), frame.reshape(self._shape(h, w, c)))
+        self._header[slot, 1:] = (h, w, c)
+        self._header[slot, 0] = self._seq
+        return slot, self._seq
+
+    def read(self, slot: int, seq: int) -> np.ndarray | None:
+        """
+        Returns a zero-copy view of the frame in `slot`, or None if the slot no longer holds frame `seq`.
+        Use is_current() after processing to check the view was not overwritten meanwhile.
+        """
+        if self._header[slot, 0] != seq:
+            return None
+        h, w, c = (int(v) for v in self._header[slot, 1:])
+        return self._slot_view(slot, (h, w, c))
+
+    def is_current(self, slot: int, seq: int) -> bool:
+        """Whether `slot` still holds frame `seq`."""
+        return self._header[slot, 0] == seq
+
+    def close(self):
+        """Unmaps the ring; the owning process also frees the shared memory."""
+        self._header = None
+        self._shm.close()
+        if self._owner:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def _shape(h: int, w: int, c: int) -> tuple[int, ...]:
+        return (h, w, c) if c else (h, w)
+
+    def _slot_view(self, slot: int, hwc: tuple[int, int, int]) -> np.ndarray:
+        shape = self._shape(*hwc)
+        offset = self._data_offset + slot * self.max_frame_bytes
+        return np.ndarray(shape, dtype=np.uint8, buffer=self._shm.buf, offset=offset)
@@ -0,0 +1,38 @@
+"""Stand-ins shared by the tests."""
+from __future__ import annotations
+
+import time
+
+import numpy as np
+
+from robocof_mood.input_stream.input_stream import InputStream
+
+
+FRAME_INTERVAL = 0.04
+
+
+class StubInputStream(InputStream):
+    """A camera that delivers a new (random, so never motion-gated) frame every `frame_interval` seconds."""
+
+    def __init__(self, shape: tuple[int, int, int] = (48, 64, 3), frame_interval: float = FRAME_INTERVAL):
+        self.shape = shape
+        self.frame_interval = frame_interval
+        self.rng = np.random.default_rng(0)
+        self.started = 0
+        self.t0 = time.monotonic()
+        self.frame = None
+
+    def start(self):
+        self.started += 1
+
+    def capture_frame(self, square_crop: bool = False, transform: bool = False, rgb: bool = False):
+        seq = int((time.monotonic() - self.t0) / self.frame_interval) + 1
+        if seq != self.frame_seq:
+            self.frame = self.rng.integers(0, 255, self.shape, dtype=np.uint8)
+            self.frame_seq = seq
+            self.frame_time = time.time()
+        self.captured_time = self.frame_time
+        return self.preprocessor.process(self.frame, square_crop=square_crop, transform=transform, rgb=rgb)
+
+    def stop(self):
+        pass
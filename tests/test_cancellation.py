@@ -0,0 +1,184 @@
+"""
+A decision's recognizer loops and worker requests end with the decision, and only that decision's:
+inference has to stop within one frame interval after make_decision() returns.
+
+The models are replaced by counting stand-ins (no torch / mediapipe needed); everything else, the
+recognizer loops, the DecisionManager and the worker processes, is the real code.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from robocof_mood.decision_manager import DecisionManager
+from robocof_mood.gesture_recognition import gesture_recognizer
+from robocof_mood.gesture_recognition.gesture_recognizer import GestureRecognizer
+from robocof_mood.seat_recognition import seat_recognizer
+from robocof_mood.sessions.cancellation import CancellationToken
+from robocof_mood.workers import recognizer_worker
+from robocof_mood.workers.recognizer_worker import RecognizerWorker
+from stubs import FRAME_INTERVAL, StubInputStream
+
+
+DECISION_TIMEOUT = 0.5
+# seconds one stand-in inference takes in a worker process, see _counting_infer()
+INFER_DELAY_ENV = "ROBOCOF_TEST_INFER_DELAY"
+# file the worker processes append one line per inference to, see _counting_infer()
+COUNT_FILE_ENV = "ROBOCOF_TEST_COUNT_FILE"
+
+
+class Counter:
+    def __init__(self):
+        self.calls = {"gesture": 0, "seat": 0}
+
+    def snapshot(self) -> dict[str, int]:
+        return dict(self.calls)
+
+
+@pytest.fixture
+def counter(monkeypatch) -> Counter:
+    """Replaces the MediaPipe task and YOLOv5 with stand-ins that count their inferences."""
+    counter = Counter()
+
+    class CountingGestureTask:
+        def recognize(self, image):
+            counter.calls["gesture"] += 1
+            return SimpleNamespace(gestures=[])
+
+    def counting_detect(self, image, model, size=seat_recognizer.FULL_SIZE, offset=(0, 0)):
+        counter.calls["seat"] += 1
+        return [], []
+
+    monkeypatch.setattr(gesture_recognizer, "load_model_asset", lambda: b"")
+    monkeypatch.setattr(gesture_recognizer, "mp", SimpleNamespace(
+        Image=lambda image_format, data: data, ImageFormat=SimpleNamespace(SRGB=1)
+    ))
+    monkeypatch.setattr(gesture_recognizer, "python", SimpleNamespace(BaseOptions=lambda **options: options))
+    monkeypatch.setattr(gesture_recognizer, "vision", SimpleNamespace(
+        GestureRecognizerOptions=lambda **options: options,
+        GestureRecognizer=SimpleNamespace(create_from_options=lambda options: CountingGestureTask()),
+    ))
+    monkeypatch.setattr(seat_recognizer, "load_model", lambda: object())
+    monkeypatch.setattr(seat_recognizer.SeatRecognizer, "detect", counting_detect)
+    return counter
+
+
+# ---------------------------------------------------------------------- #
+# stand-in worker process (spawned: module level and picklable by reference)
+# ---------------------------------------------------------------------- #
+def _counting_infer(kind: str, recognizer, frame: np.ndarray, kwargs: dict):
+    with open(os.environ[COUNT_FILE_ENV], "a") as f:
+        f.write(f"{kind} {kwargs.get('tag', '')}\n")
+    time.sleep(float(os.environ.get(INFER_DELAY_ENV, "0")))
+    if kind == "seat":
+        return seat_recognizer.SeatStatus.NO_CHAIRS_NO_PEOPLE, None, []
+    return []
+
+
+def _counting_worker_main(*args):
+    recognizer_worker._create_recognizer = lambda kind, options: None
+    recognizer_worker._infer = _counting_infer
+    recognizer_worker._worker_main(*args)
+
+
+@pytest.fixture
+def worker_inferences(monkeypatch, tmp_path):
+    """Makes RecognizerWorker spawn stand-in workers; returns a function listing their inferences so far."""
+    count_file = tmp_path / "inferences.txt"
+    count_file.touch()
+    monkeypatch.setenv(COUNT_FILE_ENV, str(count_file))
+    monkeypatch.setattr(recognizer_worker, "_worker_main", _counting_worker_main)
+    return lambda: count_file.read_text().splitlines()
+
+
+# ---------------------------------------------------------------------- #
+# tests
+# ---------------------------------------------------------------------- #
+def test_inference_stops_when_decision_returns(counter):
+    manager = DecisionManager(StubInputStream(), timeout=DECISION_TIMEOUT)
+
+    async def scenario():
+        decision = await manager.make_decision()
+        await asyncio.sleep(FRAME_INTERVAL)
+        settled = counter.snapshot()
+        await asyncio.sleep(10 * FRAME_INTERVAL)
+        return decision, settled, counter.snapshot()
+
+    decision, settled, later = asyncio.run(scenario())
+    assert decision.name.startswith("TIMEOUT")
+    assert settled["gesture"] > 0 and settled["seat"] > 0
+    assert later == settled
+
+
+def test_cancelling_one_session_keeps_the_other_running(counter):
+    recognizer = GestureRecognizer([], StubInputStream(), motion_gating=False)
+
+    async def scenario():
+        a, b = CancellationToken(), CancellationToken()
+        task_a = asyncio.create_task(recognizer.start(a))
+        task_b = asyncio.create_task(recognizer.start(b))
+        await asyncio.sleep(3 * FRAME_INTERVAL)
+        a.cancel()
+        await asyncio.wait_for(task_a, FRAME_INTERVAL)
+        before = counter.calls["gesture"]
+        await asyncio.sleep(3 * FRAME_INTERVAL)
+        b_running = not task_b.done() and counter.calls["gesture"] > before
+        b.cancel()
+        await asyncio.wait_for(task_b, FRAME_INTERVAL)
+        return b_running
+
+    assert asyncio.run(scenario())
+
+
+def test_worker_inference_stops_when_decision_returns(worker_inferences, monkeypatch):
+    monkeypatch.setenv(INFER_DELAY_ENV, "0.01")
+    manager = DecisionManager(StubInputStream(), timeout=DECISION_TIMEOUT, worker_mode=True)
+    try:
+        manager.preload()
+
+        async def scenario():
+            decision = await manager.make_decision()
+            await asyncio.sleep(FRAME_INTERVAL)
+            settled = len(worker_inferences())
+            await asyncio.sleep(10 * FRAME_INTERVAL)
+            return decision, settled, len(worker_inferences())
+
+        decision, settled, later = asyncio.run(scenario())
+    finally:
+        manager.shutdown()
+    assert decision.name.startswith("TIMEOUT")
+    assert {line.split()[0] for line in worker_inferences()} == {"gesture", "seat"}
+    assert later == settled
+
+
+def test_cancelled_session_drops_only_its_queued_worker_request(worker_inferences, monkeypatch):
+    delay = 0.3
+    monkeypatch.setenv(INFER_DELAY_ENV, str(delay))
+    worker = RecognizerWorker("gesture")
+    worker.start(timeout=60)
+    frame = np.zeros((48, 64, 3), np.uint8)
+    try:
+
+        async def scenario():
+            a, b = CancellationToken(), CancellationToken()
+            running = asyncio.create_task(worker.infer(frame, token=b, tag="b"))
+            await asyncio.sleep(delay / 3)  # b is being inferred, a's request queues behind it
+            queued = asyncio.create_task(worker.infer(frame, token=a, tag="a"))
+            await asyncio.sleep(delay / 3)
+            a.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await asyncio.wait_for(queued, FRAME_INTERVAL)
+            result = await running
+            await asyncio.sleep(2 * delay)  # long enough for a's request to have run, had it not been dropped
+            return result
+
+        result = asyncio.run(scenario())
+    finally:
+        worker.stop()
+    assert result == []
+    assert worker_inferences() == ["gesture b"]
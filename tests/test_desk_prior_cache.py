@@ -0,0 +1,32 @@
+"""Loading the persisted desk priors skips damaged records instead of failing the service start."""
+from __future__ import annotations
+
+import json
+import time
+
+from robocof_mood.seat_recognition.desk_prior_cache import DeskPriorCache
+
+
+def test_bad_records_are_skipped(tmp_path):
+    now = time.time()
+    good = {"desk_id": "A1", "chair_box": [10, 20, 110, 220], "frame_shape": [480, 640], "observations": 4, "updated": now}
+    path = tmp_path / "desk_priors.json"
+    path.write_text(json.dumps([
+        good,
+        {"desk_id": "B2", "chair_box": [1, 2, 3, 4], "frame_shape": [480, 640], "updated": now},  # no observations
+        {"desk_id": "C3", "chair_box": None, "frame_shape": [480, 640], "observations": 1, "updated": now},
+        {"desk_id": "D4", "chair_box": [1, 2], "frame_shape": [480, 640], "observations": 1, "updated": now},
+        "not a record",
+    ]))
+
+    cache = DeskPriorCache(str(path))
+
+    assert len(cache) == 1
+    prior = cache.get("A1")
+    assert prior.chair_box == (10.0, 20.0, 110.0, 220.0) and prior.is_trusted()
+
+
+def test_unreadable_file_starts_empty(tmp_path):
+    path = tmp_path / "desk_priors.json"
+    path.write_text('{"desk_id": "A1"}')
+    assert len(DeskPriorCache(str(path))) == 0
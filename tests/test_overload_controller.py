@@ -0,0 +1,69 @@
+"""Load shedding reacts to saturation, not to the in-process recognizers' own inference on the event loop."""
+from __future__ import annotations
+
+import asyncio
+import time
+
+import pytest
+
+from robocof_mood.resources.overload_controller import OverloadController
+from robocof_mood.seat_recognition import seat_recognizer
+from robocof_mood.seat_recognition.seat_recognizer import SeatRecognizer
+from robocof_mood.sessions.cancellation import CancellationToken
+from stubs import StubInputStream
+
+
+# a YOLOv5 pass on CPU, run on the event loop by the in-process seat recognizer
+YOLO_SECONDS = 0.2
+RUN_SECONDS = 1.5
+
+
+@pytest.fixture
+def slow_yolo(monkeypatch):
+    def detect(self, image, model, size=seat_recognizer.FULL_SIZE, offset=(0, 0)):
+        time.sleep(YOLO_SECONDS)
+        return [], []
+
+    monkeypatch.setattr(SeatRecognizer, "detect", detect)
+
+
+def _controller() -> OverloadController:
+    return OverloadController(interval=0.05, step_down_after=3, settle=0.1)
+
+
+async def _run(controller: OverloadController, work):
+    controller.start()
+    try:
+        await work()
+    finally:
+        await controller.stop()
+
+
+def test_idle_single_session_stays_at_full_quality(slow_yolo):
+    controller = _controller()
+    recognizer = SeatRecognizer(StubInputStream(), motion_gating=False, overload=controller, with_model=False)
+
+    async def session():
+        token = CancellationToken()
+        task = asyncio.create_task(recognizer.start(token))
+        await asyncio.sleep(RUN_SECONDS)
+        token.cancel()
+        await task
+
+    asyncio.run(_run(controller, session))
+    assert sum(recognizer.seatStatus_counter.values()) > 3
+    assert controller.level == 0
+
+
+def test_blocked_loop_steps_down():
+    controller = _controller()
+
+    async def blocking_work():
+        # something other than reported inference keeps the loop busy
+        deadline = time.monotonic() + RUN_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(YOLO_SECONDS)
+            await asyncio.sleep(0.01)
+
+    asyncio.run(_run(controller, blocking_work))
+    assert controller.level > 0
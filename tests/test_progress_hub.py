@@ -0,0 +1,38 @@
+"""Subscribers of the ProgressHub receive every event, also the ones published during the snapshot replay."""
+from __future__ import annotations
+
+import asyncio
+
+from robocof_mood.progress.progress_hub import ProgressHub
+
+
+def test_decision_published_during_replay_is_delivered():
+    hub = ProgressHub()
+
+    async def scenario():
+        hub.open(1)
+        hub.publish(1, "seat", {"distribution": {"SEAT_OCCUPIED": 3}})
+        stream = hub.subscribe(1)
+        received = [await anext(stream)]
+        # the subscriber is suspended in the snapshot replay while the decision is made
+        hub.publish(1, "decision", {"decision": "CARRY_OUT_ACTION"})
+        hub.close(1)
+        received += [event async for event in stream]
+        return received
+
+    received = asyncio.run(scenario())
+    assert [event["type"] for event in received] == ["seat", "decision"]
+
+
+def test_late_subscriber_gets_the_final_state_once():
+    hub = ProgressHub()
+
+    async def scenario():
+        hub.open(1)
+        hub.publish(1, "seat", {"distribution": {}})
+        hub.publish(1, "decision", {"decision": "USER_ABORT"})
+        hub.close(1)
+        return [event async for event in hub.subscribe(1)]
+
+    received = asyncio.run(scenario())
+    assert [event["type"] for event in received] == ["seat", "decision"]
@@ -0,0 +1,43 @@
+"""A reduced pass that sees an empty seat is confirmed at the full size before it is trusted."""
+from __future__ import annotations
+
+import numpy as np
+
+from robocof_mood.seat_recognition import seat_recognizer
+from robocof_mood.seat_recognition.seat_recognizer import FULL_SIZE, SeatRecognizer, SeatStatus
+from stubs import StubInputStream
+
+CHAIR = {"xmin": 100.0, "ymin": 200.0, "xmax": 300.0, "ymax": 460.0}
+PERSON = {"xmin": 150.0, "ymin": 150.0, "xmax": 250.0, "ymax": 460.0}
+
+
+def test_empty_reduced_pass_escalates_while_the_full_size_disagrees(monkeypatch):
+    # the person is too small for the reduced passes, only the full size sees them
+    def detect(self, image, model, size=FULL_SIZE, offset=(0, 0)):
+        return [CHAIR], [PERSON] if size == FULL_SIZE else []
+
+    monkeypatch.setattr(seat_recognizer.SeatRecognizer, "detect", detect)
+    recognizer = SeatRecognizer(StubInputStream(), with_model=False)
+    frame = np.zeros((480, 640, 3), np.uint8)
+
+    for _ in range(3):
+        assert recognizer.recognize(frame, None, rgb=True) == SeatStatus.SEAT_OCCUPIED
+        assert recognizer.last_passes[-1][0] == FULL_SIZE
+
+
+def test_empty_seat_stays_at_the_reduced_size_once_confirmed(monkeypatch):
+    sizes = []
+
+    def detect(self, image, model, size=FULL_SIZE, offset=(0, 0)):
+        sizes.append(size)
+        return [CHAIR], []
+
+    monkeypatch.setattr(seat_recognizer.SeatRecognizer, "detect", detect)
+    recognizer = SeatRecognizer(StubInputStream(), with_model=False)
+    frame = np.zeros((480, 640, 3), np.uint8)
+
+    assert recognizer.recognize(frame, None, rgb=True) == SeatStatus.SEAT_EMPTY
+    assert sizes[-1] == FULL_SIZE
+    sizes.clear()
+    assert recognizer.recognize(frame, None, rgb=True) == SeatStatus.SEAT_EMPTY
+    assert sizes == [seat_recognizer.ADAPTIVE_SCALES[0]]
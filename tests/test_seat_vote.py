@@ -0,0 +1,51 @@
+"""The seat status vote is weighted by time, not by how often the scene moved."""
+from __future__ import annotations
+
+import asyncio
+import time
+
+import numpy as np
+
+from robocof_mood.seat_recognition.seat_recognizer import SeatRecognizer, SeatStatus
+from robocof_mood.sessions.cancellation import CancellationToken
+from stubs import StubInputStream
+
+
+class StillThenMovingStream(StubInputStream):
+    """A still scene for `still` seconds, then a new (random) image every frame."""
+
+    def __init__(self, still: float):
+        super().__init__()
+        self.still = still
+        self.still_frame = np.full(self.shape, 128, np.uint8)
+
+    def capture_frame(self, square_crop: bool = False, transform: bool = False, rgb: bool = False):
+        frame = super().capture_frame(square_crop, transform, rgb)
+        if time.monotonic() - self.t0 < self.still:
+            return self.preprocessor.process(self.still_frame, square_crop=square_crop, transform=transform, rgb=rgb)
+        return frame
+
+
+def test_still_occupied_seat_outweighs_a_burst_of_motion(monkeypatch):
+    still, moving = 0.8, 0.2
+    stream = StillThenMovingStream(still)
+    # occupied while the scene is still, a burst of (misdetected) empty frames while it moves
+    monkeypatch.setattr(
+        SeatRecognizer, "recognize",
+        lambda self, frame, model, **options: (
+            SeatStatus.SEAT_OCCUPIED if time.monotonic() - stream.t0 < still else SeatStatus.SEAT_EMPTY
+        ),
+    )
+    recognizer = SeatRecognizer(stream, with_model=False)
+
+    async def session():
+        token = CancellationToken()
+        task = asyncio.create_task(recognizer.start(token))
+        await asyncio.sleep(still + moving)
+        token.cancel()
+        await task
+
+    asyncio.run(session())
+    counts = recognizer.seatStatus_counter
+    assert counts[SeatStatus.SEAT_EMPTY] > 0
+    assert recognizer.output() == SeatStatus.SEAT_OCCUPIED
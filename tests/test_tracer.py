@@ -0,0 +1,43 @@
+"""Exporting a trace while the stream's reader thread keeps recording decode spans."""
+from __future__ import annotations
+
+import threading
+
+import pytest
+
+from robocof_mood.tracing import tracer
+
+
+@pytest.fixture
+def tracing():
+    tracer.enable_tracing()
+    yield
+    tracer.disable_tracing()
+
+
+def test_export_while_another_thread_records(tracing):
+    stop = threading.Event()
+
+    def reader():
+        seq = 0
+        while not stop.is_set():
+            seq += 1
+            with tracer.span("decode", seq=seq):
+                pass
+            tracer.instant("frame", seq=seq)
+
+    tracer.begin_session(1)
+    # a full buffer, so every export iterates long enough for the reader thread to get scheduled in between
+    for seq in range(tracer.DEFAULT_MAX_EVENTS):
+        tracer.add_span("decode", 0.0, 1.0, seq=seq)
+    thread = threading.Thread(target=reader, name="mjpeg reader")
+    thread.start()
+    try:
+        traces = [tracer.export_trace(1) for _ in range(10)]
+    finally:
+        stop.set()
+        thread.join()
+        tracer.end_session(1)
+
+    assert all(trace is not None for trace in traces)
+    assert any(event["name"] == "decode" for event in traces[-1]["traceEvents"])